@@ -0,0 +1,79 @@
+#!/usr/bin/env python3
+"""
+Comparar dos resultados de loadtest.py (baseline vs. candidato) por endpoint.
+
+    python compare.py results/mixed-antes.json results/mixed-despues.json --threshold 10
+
+Marca regresión si el throughput baja o p95 / p99 / error rate suben más que el umbral (%).
+Sale con código 1 si hay alguna regresión, para usarlo en CI o en un script.
+"""
+import sys
+import json
+import argparse
+from pathlib import Path
+
+# (métrica, True si más alto es mejor)
+METRICS = [("rps", True), ("p50_ms", False), ("p95_ms", False), ("p99_ms", False), ("error_rate", False)]
+REGRESSION_METRICS = {"rps", "p95_ms", "p99_ms", "error_rate"}
+
+
+def delta_pct(before: float, after: float) -> float:
+    if before == 0:
+        return 0.0 if after == 0 else float("inf")
+    return (after - before) / before * 100
+
+
+def compare_row(label: str, before: dict, after: dict, threshold: float) -> tuple[str, bool]:
+    cells = []
+    regressed = False
+    for metric, higher_is_better in METRICS:
+        change = delta_pct(before[metric], after[metric])
+        worse = -change if higher_is_better else change
+        flag = ""
+        if metric in REGRESSION_METRICS and worse > threshold:
+            # Error rate: ignorar cambios absolutos menores a 0.1%
+            if metric != "error_rate" or after[metric] - before[metric] > 0.001:
+                flag = "!"
+                regressed = True
+        cells.append(f"{after[metric]:>9.3f} ({change:+6.1f}%){flag:1}")
+    return f"{label:<34} " + " ".join(cells), regressed
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Comparar resultados de loadtest.py")
+    parser.add_argument("baseline", type=Path)
+    parser.add_argument("candidate", type=Path)
+    parser.add_argument("--threshold", type=float, default=10.0, help="variación tolerada en %% (default 10)")
+    args = parser.parse_args()
+
+    before = json.loads(args.baseline.read_text())
+    after = json.loads(args.candidate.read_text())
+    if before["scenario"] != after["scenario"]:
+        print(f"Aviso: escenarios distintos ({before['scenario']} vs {after['scenario']})")
+
+    print(f"baseline:  {args.baseline} (commit {before.get('git_commit')})")
+    print(f"candidato: {args.candidate} (commit {after.get('git_commit')})\n")
+    print(f"{'endpoint':<34} " + " ".join(f"{metric:>21}" for metric, _ in METRICS))
+
+    regressions = []
+    rows = [(label, before["endpoints"][label], after["endpoints"][label])
+            for label in after["endpoints"] if label in before["endpoints"]]
+    rows.append(("TOTAL", before["totals"], after["totals"]))
+    for label, b, a in rows:
+        line, regressed = compare_row(label, b, a, args.threshold)
+        print(line)
+        if regressed:
+            regressions.append(label)
+
+    missing = sorted(set(before["endpoints"]) ^ set(after["endpoints"]))
+    if missing:
+        print(f"\nEndpoints presentes en un solo resultado: {', '.join(missing)}")
+
+    if regressions:
+        print(f"\nRegresiones (> {args.threshold}%): {', '.join(regressions)}")
+        sys.exit(1)
+    print(f"\nSin regresiones (> {args.threshold}%)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,367 @@
+#!/usr/bin/env python3
+"""
+Load generator (asyncio + httpx) contra el stack de docker compose.
+
+Cada escenario es un perfil de operaciones con pesos; N workers concurrentes eligen una operación,
+la ejecutan y registran latencia y status por endpoint (template de ruta, no la URL cruda).
+Al final se reporta throughput y p50/p95/p99 por endpoint y se guarda un JSON comparable con compare.py.
+
+    python loadtest.py --scenario mixed --duration 60 --concurrency 50
+    python compare.py results/mixed-<antes>.json results/mixed-<después>.json
+
+Escenarios:
+- read_heavy:   listados y GET por ID de users / projects / tasks
+- create_burst: POST de users, projects y tasks (con validación entre servicios)
+- mixed:        ~80% lecturas, ~20% escrituras
+- cache_cold:   Redis vacío (FLUSHALL) y cada lectura pide un ID todavía no leído
+- cache_warm:   se leen todos los IDs antes de medir; lecturas repetidas sobre datos en cache
+- users_outage: mixed con users-api detenido (docker compose stop) durante el tercio central del run;
+                los resultados se separan por fase (before / outage / after)
+
+El rate limiter de las APIs es por IP (100 req/min por defecto): levantar el stack con
+RATE_LIMIT_MAX_REQUESTS alto, p. ej. RATE_LIMIT_MAX_REQUESTS=1000000 docker compose up -d
+"""
+import os
+import sys
+import json
+import time
+import uuid
+import random
+import asyncio
+import argparse
+import subprocess
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Optional
+import httpx
+
+ROOT = Path(__file__).resolve().parent
+RESULTS_DIR = ROOT / "results"
+
+USERS = os.getenv("USERS", "http://localhost:8001")
+PROJECTS = os.getenv("PROJECTS", "http://localhost:8002")
+TASKS = os.getenv("TASKS", "http://localhost:8003")
+
+
+def percentile(sorted_values: list[float], pct: float) -> float:
+    """Percentil por nearest-rank sobre una lista ya ordenada"""
+    if not sorted_values:
+        return 0.0
+    rank = max(1, round(pct / 100 * len(sorted_values)))
+    return sorted_values[min(rank, len(sorted_values)) - 1]
+
+
+class Stats:
+    """Latencias y status por endpoint (y por fase, si el escenario las usa)"""
+
+    def __init__(self):
+        self.samples: dict[str, list[float]] = {}
+        self.statuses: dict[str, dict[str, int]] = {}
+        self.recording = False
+        self.phase: Optional[str] = None
+
+    def record(self, endpoint: str, status: str, seconds: float):
+        if not self.recording:
+            return
+        label = f"{self.phase} {endpoint}" if self.phase else endpoint
+        self.samples.setdefault(label, []).append(seconds)
+        counts = self.statuses.setdefault(label, {})
+        counts[status] = counts.get(status, 0) + 1
+
+    def summary(self, elapsed: float) -> dict:
+        endpoints = {}
+        all_samples = []
+        errors = 0
+        for label, samples in sorted(self.samples.items()):
+            samples.sort()
+            all_samples.extend(samples)
+            counts = self.statuses[label]
+            failed = sum(n for status, n in counts.items() if status == "error" or status.startswith("5"))
+            errors += failed
+            endpoints[label] = {
+                "requests": len(samples),
+                "rps": round(len(samples) / elapsed, 2),
+                "error_rate": round(failed / len(samples), 4),
+                "mean_ms": round(sum(samples) / len(samples) * 1000, 2),
+                "p50_ms": round(percentile(samples, 50) * 1000, 2),
+                "p95_ms": round(percentile(samples, 95) * 1000, 2),
+                "p99_ms": round(percentile(samples, 99) * 1000, 2),
+                "max_ms": round(samples[-1] * 1000, 2),
+                "statuses": counts,
+            }
+        all_samples.sort()
+        totals = {
+            "requests": len(all_samples),
+            "rps": round(len(all_samples) / elapsed, 2) if elapsed else 0.0,
+            "error_rate": round(errors / len(all_samples), 4) if all_samples else 0.0,
+            "p50_ms": round(percentile(all_samples, 50) * 1000, 2),
+            "p95_ms": round(percentile(all_samples, 95) * 1000, 2),
+            "p99_ms": round(percentile(all_samples, 99) * 1000, 2),
+        }
+        return {"totals": totals, "endpoints": endpoints}
+
+
+class Context:
+    """Estado compartido por los workers: cliente HTTP, IDs sembrados y stats"""
+
+    def __init__(self, client: httpx.AsyncClient, stats: Stats):
+        self.client = client
+        self.stats = stats
+        self.run_id = uuid.uuid4().hex[:8]
+        self.user_ids: list[int] = []
+        self.project_ids: list[int] = []
+        self.task_ids: list[int] = []
+        self.unread: dict[str, list[int]] = {}
+        self.counter = 0
+
+    async def request(self, endpoint: str, method: str, url: str, **kwargs) -> Optional[httpx.Response]:
+        start = time.perf_counter()
+        try:
+            response = await self.client.request(method, url, **kwargs)
+        except httpx.HTTPError:
+            self.stats.record(endpoint, "error", time.perf_counter() - start)
+            return None
+        self.stats.record(endpoint, str(response.status_code), time.perf_counter() - start)
+        return response
+
+    def next_name(self, prefix: str) -> str:
+        self.counter += 1
+        return f"bench-{prefix}-{self.run_id}-{self.counter}"
+
+    def pick(self, kind: str, ids: list[int], cold: bool) -> int:
+        """ID al azar o, en modo cold, uno todavía no leído (se recicla al agotarse)"""
+        if not cold:
+            return random.choice(ids)
+        pending = self.unread.get(kind)
+        if not pending:
+            pending = self.unread[kind] = random.sample(ids, len(ids))
+        return pending.pop()
+
+
+# Operaciones
+
+async def list_users(ctx: Context, cold: bool):
+    await ctx.request("GET /users", "GET", f"{USERS}/users")
+
+
+async def get_user(ctx: Context, cold: bool):
+    await ctx.request("GET /users/{id}", "GET", f"{USERS}/users/{ctx.pick('users', ctx.user_ids, cold)}")
+
+
+async def list_projects(ctx: Context, cold: bool):
+    await ctx.request("GET /projects", "GET", f"{PROJECTS}/projects")
+
+
+async def get_project(ctx: Context, cold: bool):
+    await ctx.request("GET /projects/{id}", "GET", f"{PROJECTS}/projects/{ctx.pick('projects', ctx.project_ids, cold)}")
+
+
+async def list_tasks_by_project(ctx: Context, cold: bool):
+    project_id = ctx.pick("tasks_by_project", ctx.project_ids, cold)
+    await ctx.request("GET /tasks?project_id=", "GET", f"{TASKS}/tasks", params={"project_id": project_id})
+
+
+async def get_task(ctx: Context, cold: bool):
+    await ctx.request("GET /tasks/{id}", "GET", f"{TASKS}/tasks/{ctx.pick('tasks', ctx.task_ids, cold)}")
+
+
+async def create_user(ctx: Context, cold: bool):
+    name = ctx.next_name("user")
+    await ctx.request("POST /users", "POST", f"{USERS}/users", json={"name": name, "email": f"{name}@example.com"})
+
+
+async def create_project(ctx: Context, cold: bool):
+    payload = {"name": ctx.next_name("project"), "owner_user_id": random.choice(ctx.user_ids)}
+    await ctx.request("POST /projects", "POST", f"{PROJECTS}/projects", json=payload)
+
+
+async def create_task(ctx: Context, cold: bool):
+    payload = {
+        "title": ctx.next_name("task"),
+        "project_id": random.choice(ctx.project_ids),
+        "assignee_user_id": random.choice(ctx.user_ids),
+    }
+    await ctx.request("POST /tasks", "POST", f"{TASKS}/tasks", json=payload)
+
+
+READS = [(list_users, 10), (get_user, 25), (list_projects, 10), (get_project, 20), (list_tasks_by_project, 20), (get_task, 15)]
+WRITES = [(create_user, 30), (create_project, 30), (create_task, 40)]
+
+SCENARIOS = {
+    "read_heavy": {"operations": READS},
+    "create_burst": {"operations": WRITES},
+    "mixed": {"operations": [(op, weight * 4) for op, weight in READS] + WRITES},
+    "cache_cold": {"operations": [(get_user, 1), (get_project, 1), (get_task, 1)], "cold": True, "flush_cache": True},
+    "cache_warm": {"operations": [(get_user, 1), (get_project, 1), (get_task, 1)], "warm_cache": True},
+    "users_outage": {
+        "operations": [(get_task, 30), (list_tasks_by_project, 20), (create_task, 30), (create_project, 20)],
+        "outage": "users-api",
+    },
+}
+
+
+def docker_compose(*args: str):
+    subprocess.run(["docker", "compose", *args], cwd=ROOT.parent, check=True, capture_output=True)
+
+
+def git_commit() -> Optional[str]:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], cwd=ROOT, check=True, capture_output=True, text=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+async def gather_limited(coros, limit: int):
+    semaphore = asyncio.Semaphore(limit)
+
+    async def run(coro):
+        async with semaphore:
+            return await coro
+
+    return await asyncio.gather(*(run(c) for c in coros))
+
+
+async def seed(ctx: Context, size: int, concurrency: int):
+    """Crear usuarios, proyectos y tareas para las lecturas (sin registrar stats)"""
+
+    async def post(url: str, payload: dict) -> int:
+        response = await ctx.client.post(url, json=payload)
+        if response.status_code == 429:
+            sys.exit("429 durante el seed: levantar el stack con RATE_LIMIT_MAX_REQUESTS alto")
+        response.raise_for_status()
+        return response.json()["id"]
+
+    ctx.user_ids = await gather_limited(
+        [post(f"{USERS}/users", {"name": n, "email": f"{n}@example.com"}) for n in (ctx.next_name("seed-user") for _ in range(size))],
+        concurrency,
+    )
+    ctx.project_ids = await gather_limited(
+        [post(f"{PROJECTS}/projects", {"name": ctx.next_name("seed-project"), "owner_user_id": random.choice(ctx.user_ids)}) for _ in range(size)],
+        concurrency,
+    )
+    ctx.task_ids = await gather_limited(
+        [
+            post(f"{TASKS}/tasks", {"title": ctx.next_name("seed-task"), "project_id": random.choice(ctx.project_ids), "assignee_user_id": random.choice(ctx.user_ids)})
+            for _ in range(size * 2)
+        ],
+        concurrency,
+    )
+
+
+async def warm_cache(ctx: Context, concurrency: int):
+    reads = [ctx.client.get(f"{USERS}/users/{i}") for i in ctx.user_ids]
+    reads += [ctx.client.get(f"{PROJECTS}/projects/{i}") for i in ctx.project_ids]
+    reads += [ctx.client.get(f"{TASKS}/tasks/{i}") for i in ctx.task_ids]
+    await gather_limited(reads, concurrency)
+
+
+async def worker(ctx: Context, operations: list, weights: list[int], cold: bool, deadline: float):
+    while time.perf_counter() < deadline:
+        operation = random.choices(operations, weights)[0]
+        await operation(ctx, cold)
+
+
+async def outage(ctx: Context, service: str, duration: float):
+    """Detener el servicio durante el tercio central del run"""
+    ctx.stats.phase = "before"
+    await asyncio.sleep(duration / 3)
+    await asyncio.to_thread(docker_compose, "stop", service)
+    ctx.stats.phase = "outage"
+    try:
+        await asyncio.sleep(duration / 3)
+    finally:
+        await asyncio.to_thread(docker_compose, "start", service)
+    ctx.stats.phase = "after"
+
+
+async def run(args) -> dict:
+    scenario = SCENARIOS[args.scenario]
+    stats = Stats()
+    limits = httpx.Limits(max_connections=args.concurrency, max_keepalive_connections=args.concurrency)
+    async with httpx.AsyncClient(timeout=args.timeout, limits=limits) as client:
+        ctx = Context(client, stats)
+        print(f"Seed: {args.seed_size} users, {args.seed_size} projects, {args.seed_size * 2} tasks")
+        await seed(ctx, args.seed_size, args.concurrency)
+
+        if scenario.get("flush_cache"):
+            docker_compose("exec", "-T", "redis", "redis-cli", "FLUSHALL")
+        if scenario.get("warm_cache"):
+            await warm_cache(ctx, args.concurrency)
+
+        operations, weights = zip(*scenario["operations"])
+        cold = scenario.get("cold", False)
+
+        if args.warmup and not cold:
+            print(f"Warm-up: {args.warmup}s")
+            deadline = time.perf_counter() + args.warmup
+            await asyncio.gather(*(worker(ctx, operations, weights, cold, deadline) for _ in range(args.concurrency)))
+
+        print(f"Escenario {args.scenario}: {args.duration}s, {args.concurrency} workers")
+        stats.recording = True
+        started = time.perf_counter()
+        deadline = started + args.duration
+        background = []
+        if scenario.get("outage"):
+            background.append(asyncio.create_task(outage(ctx, scenario["outage"], args.duration)))
+        await asyncio.gather(*(worker(ctx, operations, weights, cold, deadline) for _ in range(args.concurrency)))
+        elapsed = time.perf_counter() - started
+        stats.recording = False
+        for task in background:
+            await task
+
+    return {
+        "scenario": args.scenario,
+        "started_at": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+        "git_commit": git_commit(),
+        "params": {
+            "duration": args.duration,
+            "concurrency": args.concurrency,
+            "warmup": args.warmup,
+            "seed_size": args.seed_size,
+            "urls": {"users": USERS, "projects": PROJECTS, "tasks": TASKS},
+        },
+        "elapsed_seconds": round(elapsed, 2),
+        **stats.summary(elapsed),
+    }
+
+
+def print_report(result: dict):
+    header = f"{'endpoint':<34} {'req':>8} {'rps':>9} {'err%':>6} {'p50':>8} {'p95':>8} {'p99':>8}"
+    print(header)
+    print("-" * len(header))
+    rows = list(result["endpoints"].items()) + [("TOTAL", result["totals"])]
+    for label, row in rows:
+        print(
+            f"{label:<34} {row['requests']:>8} {row['rps']:>9.1f} {row['error_rate'] * 100:>6.2f} "
+            f"{row['p50_ms']:>8.1f} {row['p95_ms']:>8.1f} {row['p99_ms']:>8.1f}"
+        )
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Load test contra el stack de docker compose")
+    parser.add_argument("--scenario", choices=sorted(SCENARIOS), default="mixed")
+    parser.add_argument("--duration", type=float, default=30, help="segundos medidos")
+    parser.add_argument("--concurrency", type=int, default=20, help="workers concurrentes (closed loop)")
+    parser.add_argument("--warmup", type=float, default=5, help="segundos previos sin registrar")
+    parser.add_argument("--seed-size", type=int, default=200)
+    parser.add_argument("--timeout", type=float, default=10)
+    parser.add_argument("--seed", type=int, default=None, help="semilla de random para repetir la secuencia")
+    parser.add_argument("--output", type=Path, default=None, help="JSON de resultados (default: results/<escenario>-<fecha>.json)")
+    args = parser.parse_args()
+
+    if args.seed is not None:
+        random.seed(args.seed)
+
+    result = asyncio.run(run(args))
+    print_report(result)
+
+    output = args.output or RESULTS_DIR / f"{args.scenario}-{datetime.now().strftime('%Y%m%d-%H%M%S')}.json"
+    output.parent.mkdir(parents=True, exist_ok=True)
+    output.write_text(json.dumps(result, indent=2))
+    print(f"\nResultados: {output}")
+
+
+if __name__ == "__main__":
+    main()
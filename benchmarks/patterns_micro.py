@@ -0,0 +1,278 @@
+#!/usr/bin/env python3
+"""
+Micro-benchmarks de patterns.py y messaging.py (sin levantar las APIs).
+
+Mide ops/seg, latencia por operación (p50/p99) y memoria (pico y bytes retenidos, con tracemalloc) de:
+- CacheAside: get (hit / miss), set, get_many_raw e invalidate_pattern con distintas cantidades de keys
+- RateLimiter.is_allowed con 1 y muchos identificadores
+- call_external_service (Circuit Breaker + Retry + cliente httpx) contra un transport en proceso
+- MessageQueue.publish
+
+Backends:
+- por defecto Redis y RabbitMQ locales (REDIS_URL / RABBITMQ_URL, p. ej. los contenedores de docker compose)
+- --fake: fakeredis y una conexión pika en memoria; mide el costo propio de los patrones sin red
+
+    python patterns_micro.py --fake
+    python patterns_micro.py --service users-api --keys 100,10000 --iterations 5000
+"""
+import os
+import sys
+import json
+import time
+import random
+import asyncio
+import argparse
+import tracemalloc
+from datetime import datetime
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent
+RESULTS_DIR = ROOT / "results"
+
+
+class FakeChannel:
+    """Canal pika en memoria: cuenta los publish"""
+
+    def __init__(self):
+        self.is_open = True
+        self.is_closed = False
+        self.published = 0
+
+    def exchange_declare(self, **kwargs):
+        pass
+
+    def queue_declare(self, **kwargs):
+        pass
+
+    def queue_bind(self, **kwargs):
+        pass
+
+    def basic_publish(self, **kwargs):
+        self.published += 1
+
+
+class FakeBlockingConnection:
+    def __init__(self, params=None):
+        self.is_closed = False
+
+    def channel(self):
+        return FakeChannel()
+
+    def close(self):
+        self.is_closed = True
+
+
+def load_service_modules(service: str, fake: bool):
+    """Importar patterns / messaging del servicio, con los backends en memoria si --fake"""
+    sys.path.insert(0, str(ROOT.parent / "services" / service))
+    import patterns
+    import messaging
+    if fake:
+        import fakeredis
+        patterns.redis_client = fakeredis.FakeRedis()
+        messaging.pika.BlockingConnection = FakeBlockingConnection
+    return patterns, messaging
+
+
+def percentile(sorted_values: list[float], pct: float) -> float:
+    rank = max(1, round(pct / 100 * len(sorted_values)))
+    return sorted_values[min(rank, len(sorted_values)) - 1]
+
+
+def summarize(name: str, timings: list[float], peak: int, retained: int, iterations: int) -> dict:
+    timings.sort()
+    total = sum(timings)
+    return {
+        "name": name,
+        "iterations": iterations,
+        "ops_per_sec": round(iterations / total, 1) if total else 0.0,
+        "mean_us": round(total / iterations * 1e6, 2),
+        "p50_us": round(percentile(timings, 50) * 1e6, 2),
+        "p99_us": round(percentile(timings, 99) * 1e6, 2),
+        "peak_kib": round(peak / 1024, 1),
+        "retained_bytes_per_op": round(retained / iterations, 1),
+    }
+
+
+def bench(name: str, op, iterations: int, setup=None) -> dict:
+    """
+    Correr op() iterations veces (setup() antes de cada una, fuera del tiempo medido).
+    Una primera pasada mide tiempos; la segunda, con tracemalloc activo, la memoria.
+    """
+    timings = []
+    for _ in range(iterations):
+        if setup:
+            setup()
+        start = time.perf_counter()
+        op()
+        timings.append(time.perf_counter() - start)
+
+    tracemalloc.start()
+    before = tracemalloc.take_snapshot()
+    tracemalloc.reset_peak()
+    for _ in range(iterations):
+        if setup:
+            setup()
+        op()
+    _, peak = tracemalloc.get_traced_memory()
+    after = tracemalloc.take_snapshot()
+    tracemalloc.stop()
+    retained = sum(stat.size_diff for stat in after.compare_to(before, "filename"))
+    return summarize(name, timings, peak, retained, iterations)
+
+
+async def bench_async(name: str, op, iterations: int) -> dict:
+    """Igual que bench() para corutinas, dentro de un solo event loop"""
+    timings = []
+    for _ in range(iterations):
+        start = time.perf_counter()
+        await op()
+        timings.append(time.perf_counter() - start)
+
+    tracemalloc.start()
+    before = tracemalloc.take_snapshot()
+    tracemalloc.reset_peak()
+    for _ in range(iterations):
+        await op()
+    _, peak = tracemalloc.get_traced_memory()
+    after = tracemalloc.take_snapshot()
+    tracemalloc.stop()
+    retained = sum(stat.size_diff for stat in after.compare_to(before, "filename"))
+    return summarize(name, timings, peak, retained, iterations)
+
+
+def sample_user(i: int) -> dict:
+    return {"id": i, "name": f"Usuario {i}", "email": f"user{i}@example.com"}
+
+
+def sample_task_list(size: int) -> list[dict]:
+    return [{"id": i, "title": f"Tarea {i}", "project_id": i % 50, "assignee_user_id": i % 200} for i in range(size)]
+
+
+def cache_benchmarks(patterns, key_counts: list[int], iterations: int) -> list[dict]:
+    results = []
+    cache = patterns.CacheAside(prefix="bench")
+    cache.invalidate_pattern("*")
+
+    for count in key_counts:
+        cache.set_many({str(i): sample_user(i) for i in range(count)})
+        keys = [str(i) for i in range(count)]
+        results.append(bench(f"cache.get hit [{count} keys]", lambda: cache.get(random.choice(keys)), iterations))
+        results.append(bench(f"cache.get miss [{count} keys]", lambda: cache.get(f"missing-{random.random()}"), iterations))
+        results.append(bench(
+            f"cache.set [{count} keys]", lambda: cache.set(random.choice(keys), sample_user(random.randrange(count))), iterations
+        ))
+        batch = keys[:100]
+        results.append(bench(f"cache.get_many_raw x{len(batch)} [{count} keys]", lambda: cache.get_many_raw(batch), iterations))
+        # invalidate_pattern borra todo: se vuelve a poblar antes de cada iteración (fuera del tiempo medido)
+        results.append(bench(
+            f"cache.invalidate_pattern [{count} keys]",
+            lambda: cache.invalidate_pattern("*"),
+            max(1, iterations // 100),
+            setup=lambda: cache.set_many({k: sample_user(0) for k in keys}),
+        ))
+        cache.invalidate_pattern("*")
+
+    # Payload grande (supera CACHE_COMPRESS_THRESHOLD y pasa por zstd)
+    large = sample_task_list(500)
+    results.append(bench("cache.set listado 500 tareas (zstd)", lambda: cache.set("tasks:list", large), iterations))
+    results.append(bench("cache.get listado 500 tareas (zstd)", lambda: cache.get("tasks:list"), iterations))
+    msgpack_cache = patterns.CacheAside(prefix="bench-msgpack", codec=patterns.MsgpackCodec())
+    results.append(bench("cache.set listado 500 tareas (msgpack)", lambda: msgpack_cache.set("tasks:list", large), iterations))
+    results.append(bench("cache.get listado 500 tareas (msgpack)", lambda: msgpack_cache.get("tasks:list"), iterations))
+    cache.invalidate_pattern("*")
+    msgpack_cache.invalidate_pattern("*")
+    return results
+
+
+def rate_limiter_benchmarks(patterns, iterations: int) -> list[dict]:
+    limiter = patterns.RateLimiter(max_requests=10**9, window_seconds=60)
+    identifiers = [f"10.0.{i // 256}.{i % 256}" for i in range(1000)]
+    results = [
+        bench("rate_limiter.is_allowed [1 id]", lambda: limiter.is_allowed("bench-single"), iterations),
+        bench("rate_limiter.is_allowed [1000 ids]", lambda: limiter.is_allowed(random.choice(identifiers)), iterations),
+    ]
+    patterns.redis_client.delete("rate_limit:bench-single", *(f"rate_limit:{i}" for i in identifiers))
+    return results
+
+
+async def external_call_benchmarks(patterns, iterations: int) -> list[dict]:
+    """call_external_service contra un httpx.MockTransport: overhead de breaker + retry + métricas + cliente"""
+    import httpx
+
+    def handler(request: httpx.Request) -> httpx.Response:
+        return httpx.Response(200, json=sample_user(1))
+
+    patterns._http_client = httpx.AsyncClient(transport=httpx.MockTransport(handler))
+    try:
+        return [await bench_async(
+            "call_external_service (transport en proceso)",
+            lambda: patterns.call_external_service("http://users-api:8000/users/1"),
+            iterations,
+        )]
+    finally:
+        await patterns.close_http_client()
+
+
+def publish_benchmarks(messaging, iterations: int) -> list[dict]:
+    queue = messaging.MessageQueue("bench_queue")
+    message = {"type": "bench", "data": sample_user(1)}
+    try:
+        return [
+            bench("mq.publish directo a cola", lambda: queue.publish(message), iterations),
+            bench("mq.publish al exchange (routing_key)", lambda: queue.publish(message, routing_key="bench.event"), iterations),
+        ]
+    finally:
+        if queue.connection and not queue.connection.is_closed:
+            queue.connection.close()
+
+
+def print_report(results: list[dict]):
+    header = f"{'benchmark':<48} {'ops/s':>11} {'mean µs':>9} {'p50 µs':>9} {'p99 µs':>9} {'pico KiB':>9} {'B/op':>8}"
+    print(header)
+    print("-" * len(header))
+    for r in results:
+        print(
+            f"{r['name']:<48} {r['ops_per_sec']:>11.1f} {r['mean_us']:>9.1f} {r['p50_us']:>9.1f} "
+            f"{r['p99_us']:>9.1f} {r['peak_kib']:>9.1f} {r['retained_bytes_per_op']:>8.1f}"
+        )
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Micro-benchmarks de los patrones")
+    parser.add_argument("--service", default="tasks-api", choices=["users-api", "projects-api", "tasks-api"])
+    parser.add_argument("--fake", action="store_true", help="fakeredis + pika en memoria en lugar de contenedores")
+    parser.add_argument("--keys", default="10,1000,10000", help="cantidades de keys para los benchmarks de cache")
+    parser.add_argument("--iterations", type=int, default=2000)
+    parser.add_argument("--only", choices=["cache", "rate_limiter", "external", "publish"], action="append")
+    parser.add_argument("--output", type=Path, default=None, help="JSON (default: results/patterns-<fecha>.json)")
+    args = parser.parse_args()
+
+    patterns, messaging = load_service_modules(args.service, args.fake)
+    selected = set(args.only or ["cache", "rate_limiter", "external", "publish"])
+    key_counts = [int(k) for k in args.keys.split(",")]
+
+    results = []
+    if "cache" in selected:
+        results += cache_benchmarks(patterns, key_counts, args.iterations)
+    if "rate_limiter" in selected:
+        results += rate_limiter_benchmarks(patterns, args.iterations)
+    if "external" in selected:
+        results += asyncio.run(external_call_benchmarks(patterns, args.iterations))
+    if "publish" in selected:
+        results += publish_benchmarks(messaging, args.iterations)
+
+    print_report(results)
+    output = args.output or RESULTS_DIR / f"patterns-{datetime.now().strftime('%Y%m%d-%H%M%S')}.json"
+    output.parent.mkdir(parents=True, exist_ok=True)
+    output.write_text(json.dumps({
+        "service": args.service,
+        "backend": "fake" if args.fake else {"redis": os.getenv("REDIS_URL"), "rabbitmq": os.getenv("RABBITMQ_URL")},
+        "iterations": args.iterations,
+        "results": results,
+    }, indent=2))
+    print(f"\nResultados: {output}")
+
+
+if __name__ == "__main__":
+    main()
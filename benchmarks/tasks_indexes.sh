@@ -0,0 +1,12 @@
+#!/usr/bin/env bash
+# Benchmark de índices de tasks-api (insert + consultas) contra la DB de docker compose.
+#   - Compara el esquema de índices anterior con los compuestos/covering (migración 0002)
+#   - Reporta tiempo de insert, tamaño de índices y planes EXPLAIN ANALYZE
+
+set -euo pipefail
+source "$(dirname "$0")/../validation-scripts/env.sh"
+
+ROWS="${ROWS:-200000}"
+
+echo "== Benchmark de índices de tasks ($ROWS filas) =="
+psql_db -v rows="$ROWS" < "$(dirname "$0")/tasks_indexes.sql"
@@ -0,0 +1,92 @@
+-- Benchmark de índices de tasks-api: esquema de índices anterior vs. compuestos/covering.
+-- Corre sobre un schema temporal (bench_idx) con datos sintéticos; no toca las tablas del servicio.
+-- Uso: ./tasks_indexes.sh   (ROWS=200000 por defecto)
+
+\set ON_ERROR_STOP on
+\timing on
+
+DROP SCHEMA IF EXISTS bench_idx CASCADE;
+CREATE SCHEMA bench_idx;
+SET search_path = bench_idx;
+
+-- Índices anteriores: title, project_id, assignee_user_id / task_id
+CREATE TABLE tasks_old (
+    id serial PRIMARY KEY,
+    title varchar(200) NOT NULL,
+    project_id integer NOT NULL,
+    assignee_user_id integer NOT NULL,
+    created_at timestamptz NOT NULL DEFAULT now()
+);
+CREATE INDEX ON tasks_old (title);
+CREATE INDEX ON tasks_old (project_id);
+CREATE INDEX ON tasks_old (assignee_user_id);
+
+CREATE TABLE activities_old (
+    id serial PRIMARY KEY,
+    task_id integer NOT NULL,
+    action varchar(50) NOT NULL,
+    note text NOT NULL,
+    created_at timestamptz NOT NULL DEFAULT now()
+);
+CREATE INDEX ON activities_old (task_id);
+
+-- Índices nuevos: compuestos con INCLUDE
+CREATE TABLE tasks_new (LIKE tasks_old INCLUDING DEFAULTS);
+ALTER TABLE tasks_new ADD PRIMARY KEY (id);
+CREATE INDEX ON tasks_new (project_id, id) INCLUDE (title, assignee_user_id);
+CREATE INDEX ON tasks_new (assignee_user_id, id) INCLUDE (title, project_id);
+
+CREATE TABLE activities_new (LIKE activities_old INCLUDING DEFAULTS);
+ALTER TABLE activities_new ADD PRIMARY KEY (id);
+CREATE INDEX ON activities_new (task_id, created_at DESC) INCLUDE (action);
+
+\echo '== Insert de tareas: índices anteriores =='
+INSERT INTO tasks_old (title, project_id, assignee_user_id)
+SELECT 'Tarea ' || g || ' ' || md5(g::text), g % 500, g % 1000 FROM generate_series(1, :rows) g;
+
+\echo '== Insert de tareas: índices nuevos =='
+INSERT INTO tasks_new (title, project_id, assignee_user_id)
+SELECT 'Tarea ' || g || ' ' || md5(g::text), g % 500, g % 1000 FROM generate_series(1, :rows) g;
+
+\echo '== Insert de actividades: índices anteriores =='
+INSERT INTO activities_old (task_id, action, note, created_at)
+SELECT g % (:rows / 4) + 1, 'UPDATED', 'Task updated', now() - (g || ' seconds')::interval FROM generate_series(1, :rows) g;
+
+\echo '== Insert de actividades: índices nuevos =='
+INSERT INTO activities_new (task_id, action, note, created_at)
+SELECT g % (:rows / 4) + 1, 'UPDATED', 'Task updated', now() - (g || ' seconds')::interval FROM generate_series(1, :rows) g;
+
+-- VACUUM actualiza el visibility map (necesario para index-only scans)
+VACUUM ANALYZE tasks_old, tasks_new, activities_old, activities_new;
+
+\echo '== Tamaño de índices =='
+SELECT relname AS table_name, pg_size_pretty(pg_indexes_size(oid)) AS indexes_size
+FROM pg_class
+WHERE relnamespace = 'bench_idx'::regnamespace AND relkind = 'r'
+ORDER BY relname;
+
+\echo '== Tareas del proyecto 42 ordenadas por id: anterior =='
+EXPLAIN (ANALYZE, BUFFERS, COSTS OFF)
+SELECT id, title, project_id, assignee_user_id FROM tasks_old WHERE project_id = 42 ORDER BY id;
+
+\echo '== Tareas del proyecto 42 ordenadas por id: nuevo =='
+EXPLAIN (ANALYZE, BUFFERS, COSTS OFF)
+SELECT id, title, project_id, assignee_user_id FROM tasks_new WHERE project_id = 42 ORDER BY id;
+
+\echo '== Tareas del asignado 7 ordenadas por id: anterior =='
+EXPLAIN (ANALYZE, BUFFERS, COSTS OFF)
+SELECT id, title, project_id, assignee_user_id FROM tasks_old WHERE assignee_user_id = 7 ORDER BY id;
+
+\echo '== Tareas del asignado 7 ordenadas por id: nuevo =='
+EXPLAIN (ANALYZE, BUFFERS, COSTS OFF)
+SELECT id, title, project_id, assignee_user_id FROM tasks_new WHERE assignee_user_id = 7 ORDER BY id;
+
+\echo '== Últimas 50 actividades de la tarea 10: anterior =='
+EXPLAIN (ANALYZE, BUFFERS, COSTS OFF)
+SELECT id, task_id, action, created_at FROM activities_old WHERE task_id = 10 ORDER BY created_at DESC LIMIT 50;
+
+\echo '== Últimas 50 actividades de la tarea 10: nuevo =='
+EXPLAIN (ANALYZE, BUFFERS, COSTS OFF)
+SELECT id, task_id, action, created_at FROM activities_new WHERE task_id = 10 ORDER BY created_at DESC LIMIT 50;
+
+DROP SCHEMA bench_idx CASCADE;
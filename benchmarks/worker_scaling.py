@@ -0,0 +1,94 @@
+#!/usr/bin/env python3
+"""
+Escalado por cantidad de workers gunicorn: para cada N recrea las APIs con WEB_CONCURRENCY=N,
+espera a que respondan /healthz y corre loadtest.py con el mismo escenario y semilla.
+Al final imprime throughput y p50/p95/p99 totales por N (y el speedup contra el primero).
+
+    RATE_LIMIT_MAX_REQUESTS=1000000 python worker_scaling.py --workers 1,2,4,8 --duration 60
+
+Con N workers por servicio cada uno abre su propio pool: DB_POOL_SIZE / DB_MAX_OVERFLOW son por worker y
+las 3 APIs comparten max_connections=100 del primary; el script baja el pool si N lo requiere.
+"""
+import os
+import sys
+import json
+import time
+import argparse
+import subprocess
+from pathlib import Path
+import httpx
+
+ROOT = Path(__file__).resolve().parent
+RESULTS_DIR = ROOT / "results"
+
+SERVICES = ["users-api", "projects-api", "tasks-api"]
+HEALTH_URLS = [
+    os.getenv("USERS", "http://localhost:8001") + "/healthz",
+    os.getenv("PROJECTS", "http://localhost:8002") + "/healthz",
+    os.getenv("TASKS", "http://localhost:8003") + "/healthz",
+]
+# Conexiones del primary que pueden usar las APIs (el resto queda para migraciones, psql, replicación)
+DB_CONNECTION_BUDGET = 80
+
+
+def pool_settings(workers: int) -> dict[str, str]:
+    """Pool por worker tal que 3 servicios x N workers x (pool + overflow) entre en el presupuesto"""
+    per_worker = max(2, DB_CONNECTION_BUDGET // (len(SERVICES) * workers))
+    return {"DB_POOL_SIZE": str(max(1, per_worker // 2)), "DB_MAX_OVERFLOW": str(per_worker - max(1, per_worker // 2))}
+
+
+def recreate(workers: int):
+    env = {**os.environ, "WEB_CONCURRENCY": str(workers), **pool_settings(workers)}
+    env.setdefault("RATE_LIMIT_MAX_REQUESTS", "1000000")
+    subprocess.run(["docker", "compose", "up", "-d", "--force-recreate", *SERVICES], env=env, check=True)
+
+
+def wait_healthy(timeout: float):
+    deadline = time.monotonic() + timeout
+    pending = list(HEALTH_URLS)
+    while pending:
+        if time.monotonic() > deadline:
+            sys.exit(f"Timeout esperando /healthz: {', '.join(pending)}")
+        try:
+            pending = [url for url in pending if httpx.get(url, timeout=2).status_code != 200]
+        except httpx.HTTPError:
+            pass
+        if pending:
+            time.sleep(1)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Throughput y latencia según cantidad de workers gunicorn")
+    parser.add_argument("--workers", default="1,2,4,8", help="valores de WEB_CONCURRENCY a medir")
+    parser.add_argument("--scenario", default="read_heavy")
+    parser.add_argument("--duration", type=float, default=30)
+    parser.add_argument("--concurrency", type=int, default=50)
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--health-timeout", type=float, default=120)
+    args = parser.parse_args()
+
+    rows = []
+    for workers in [int(n) for n in args.workers.split(",")]:
+        print(f"\n=== WEB_CONCURRENCY={workers} ({pool_settings(workers)}) ===")
+        recreate(workers)
+        wait_healthy(args.health_timeout)
+        output = RESULTS_DIR / f"workers-{workers}.json"
+        subprocess.run([
+            sys.executable, str(ROOT / "loadtest.py"), "--scenario", args.scenario,
+            "--duration", str(args.duration), "--concurrency", str(args.concurrency),
+            "--seed", str(args.seed), "--output", str(output),
+        ], check=True)
+        rows.append((workers, json.loads(output.read_text())["totals"]))
+
+    print(f"\n{'workers':>8} {'rps':>10} {'speedup':>8} {'err%':>6} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8}")
+    base_rps = rows[0][1]["rps"] if rows else 0
+    for workers, totals in rows:
+        speedup = totals["rps"] / base_rps if base_rps else 0.0
+        print(
+            f"{workers:>8} {totals['rps']:>10.1f} {speedup:>7.2f}x {totals['error_rate'] * 100:>6.2f} "
+            f"{totals['p50_ms']:>8.1f} {totals['p95_ms']:>8.1f} {totals['p99_ms']:>8.1f}"
+        )
+
+
+if __name__ == "__main__":
+    main()
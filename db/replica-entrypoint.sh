@@ -0,0 +1,16 @@
+#!/bin/sh
+# Réplica de lectura por streaming replication.
+# En el primer arranque clona el primario con pg_basebackup (-R deja configurado standby.signal)
+set -e
+
+if [ ! -s "$PGDATA/PG_VERSION" ]; then
+  echo "Clonando primario $PRIMARY_HOST para réplica de lectura"
+  until pg_basebackup -h "$PRIMARY_HOST" -U "$PGUSER" -D "$PGDATA" -R -X stream -P; do
+    echo "Primario no disponible, reintentando en 2s"
+    rm -rf "${PGDATA:?}"/*
+    sleep 2
+  done
+  chmod 0700 "$PGDATA"
+fi
+
+exec postgres
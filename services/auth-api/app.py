@@ -1,13 +1,16 @@
 import os
 import jwt
+import time
 import logging
 from datetime import datetime, timedelta
 from typing import Optional
-from fastapi import FastAPI, HTTPException, Depends, Header
+from fastapi import FastAPI, HTTPException, Depends, Header, Request, Response
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
 from pydantic import BaseModel
+from prometheus_client import Counter, Histogram, CollectorRegistry, CONTENT_TYPE_LATEST, generate_latest, multiprocess
+from logging_config import setup_logging, restart_listener
 
-logging.basicConfig(level=logging.INFO)
+setup_logging("auth-api")
 logger = logging.getLogger(__name__)
 
 app = FastAPI(title="Auth API - Gatekeeper")
@@ -17,6 +20,33 @@ SECRET_KEY = os.getenv("JWT_SECRET_KEY", "mi-clave-secreta-super-segura-cambiar-
 ALGORITHM = "HS256"
 ACCESS_TOKEN_EXPIRE_MINUTES = 60
 
+# Métricas Prometheus (ruta = template de FastAPI, cardinalidad acotada)
+HTTP_REQUESTS = Counter("http_requests_total", "Requests HTTP atendidos", ["method", "route", "status"])
+HTTP_REQUEST_DURATION = Histogram(
+    "http_request_duration_seconds", "Latencia de requests HTTP", ["method", "route"],
+    buckets=(0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0),
+)
+TOKEN_VALIDATIONS = Counter("auth_token_validations_total", "Validaciones de token por resultado", ["result"])
+
+
+def reset_after_fork():
+    """Llamado desde post_fork de gunicorn: el thread del listener de logging no sobrevive al fork"""
+    restart_listener()
+
+
+@app.middleware("http")
+async def metrics_middleware(request: Request, call_next):
+    start = time.perf_counter()
+    status_code = 500
+    try:
+        response = await call_next(request)
+        status_code = response.status_code
+        return response
+    finally:
+        route = getattr(request.scope.get("route"), "path", None) or "unmatched"
+        HTTP_REQUEST_DURATION.labels(request.method, route).observe(time.perf_counter() - start)
+        HTTP_REQUESTS.labels(request.method, route, str(status_code)).inc()
+
 class LoginRequest(BaseModel):
     username: str
     password: str
@@ -64,7 +94,8 @@ def validate_token(token: str) -> dict:
     """
     try:
         payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
-        logger.info(f"Token validado exitosamente para usuario: {payload.get('username')}")
+        TOKEN_VALIDATIONS.labels("valid").inc()
+        logger.debug("Token validado exitosamente para usuario: %s", payload.get("username"), extra={"event": "token_validated"})
         return {
             "valid": True,
             "user_id": int(payload.get("sub")),
@@ -72,9 +103,11 @@ def validate_token(token: str) -> dict:
             "roles": payload.get("roles", [])
         }
     except jwt.ExpiredSignatureError:
+        TOKEN_VALIDATIONS.labels("expired").inc()
         logger.warning("Token expirado")
         return {"valid": False, "error": "Token expirado"}
     except jwt.InvalidTokenError as e:
+        TOKEN_VALIDATIONS.labels("invalid").inc()
         logger.warning(f"Token inválido: {e}")
         return {"valid": False, "error": "Token inválido"}
 
@@ -94,6 +127,16 @@ def check_permission(token_data: dict, required_role: str = None) -> bool:
     
     return True
 
+@app.get("/metrics", include_in_schema=False)
+def metrics():
+    """Exposición Prometheus (agregada entre workers si corre bajo gunicorn)"""
+    if "PROMETHEUS_MULTIPROC_DIR" in os.environ:
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+        return Response(content=generate_latest(registry), media_type=CONTENT_TYPE_LATEST)
+    return Response(content=generate_latest(), media_type=CONTENT_TYPE_LATEST)
+
+
 @app.get("/health")
 @app.get("/healthz")
 def health_check():
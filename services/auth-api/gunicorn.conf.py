@@ -0,0 +1,49 @@
+"""
+Entrypoint de producción: gunicorn con N workers uvicorn (uvloop + httptools, elegidos por uvicorn
+al estar instalados) y la app precargada en el master (--preload), así el import (modelos, rutas,
+setup de tracing / logging) se hace una sola vez y se comparte copy-on-write.
+
+Lo que tiene sockets o threads y se creó en el master (pool de la base, Redis, pika, httpx, listener
+de logging) no sirve en los hijos: post_fork llama a app.reset_after_fork() en cada worker.
+"""
+import os
+import shutil
+import multiprocessing
+
+bind = f"0.0.0.0:{os.getenv('PORT', '8000')}"
+workers = int(os.getenv("WEB_CONCURRENCY", multiprocessing.cpu_count()))
+# uvicorn.workers está deprecado desde uvicorn 0.30: el worker vive en el paquete uvicorn-worker
+worker_class = "uvicorn_worker.UvicornWorker"
+preload_app = os.getenv("GUNICORN_PRELOAD", "true").lower() == "true"
+timeout = int(os.getenv("GUNICORN_TIMEOUT", "30"))
+graceful_timeout = int(os.getenv("GUNICORN_GRACEFUL_TIMEOUT", "20"))
+keepalive = int(os.getenv("GUNICORN_KEEPALIVE", "5"))
+# Reciclar cada worker luego de N requests (con jitter para no reiniciarlos juntos); 0 = nunca
+max_requests = int(os.getenv("GUNICORN_MAX_REQUESTS", "0"))
+max_requests_jitter = int(os.getenv("GUNICORN_MAX_REQUESTS_JITTER", "0"))
+
+# Métricas Prometheus agregadas entre workers: cada proceso escribe sus valores en este directorio.
+# Se define y limpia acá porque el config se carga antes de importar la app (y prometheus_client)
+os.environ.setdefault("PROMETHEUS_MULTIPROC_DIR", "/tmp/prometheus-multiproc")
+shutil.rmtree(os.environ["PROMETHEUS_MULTIPROC_DIR"], ignore_errors=True)
+os.makedirs(os.environ["PROMETHEUS_MULTIPROC_DIR"], exist_ok=True)
+
+
+def when_ready(server):
+    # Con --preload el master importó la app y dejó archivos de gauges con su pid (valores definidos al
+    # importar); el master no atiende requests, así que se descartan para que livesum no lo cuente
+    from prometheus_client import multiprocess
+    multiprocess.mark_process_dead(os.getpid())
+
+
+def post_fork(server, worker):
+    # Sin --preload la app se importa en el worker, después de que el UvicornWorker configuró sus loggers,
+    # y setup_logging los rutea al QueueHandler; con --preload lo hace reset_after_fork -> restart_listener
+    if preload_app:
+        import app
+        app.reset_after_fork()
+
+
+def child_exit(server, worker):
+    from prometheus_client import multiprocess
+    multiprocess.mark_process_dead(worker.pid)
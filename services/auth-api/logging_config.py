@@ -0,0 +1,172 @@
+"""
+Configuración de logging del servicio: JSON estructurado, asíncrono y con muestreo.
+
+- Los módulos solo hacen logging.getLogger(__name__); la configuración se aplica una vez en app.py
+- El request solo encola el record (QueueHandler); formatear y escribir a stdout lo hace un thread
+  aparte (QueueListener), así el I/O de logging no bloquea el event loop
+- Eventos de alta frecuencia (cache, llamadas a otros servicios, mensajes) se loguean con extra={"event": ...}
+  y se pueden muestrear por evento; WARNING y superiores nunca se muestrean
+
+Variables de entorno:
+- LOG_LEVEL:        nivel del root logger (default INFO)
+- LOG_LEVELS:       niveles por módulo, p. ej. "patterns=DEBUG,uvicorn.access=WARNING"
+- LOG_FORMAT:       json (default) o text
+- LOG_SAMPLE_RATES: fracción de records que se emiten por evento, p. ej. "cache_hit=0.01,cache_set=0.1"
+"""
+import os
+import sys
+import json
+import queue
+import random
+import atexit
+import logging
+from datetime import datetime, timezone
+from logging.handlers import QueueHandler, QueueListener
+from typing import Optional
+
+try:
+    from opentelemetry import trace
+except ImportError:  # auth-api no tiene tracing
+    trace = None
+
+LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO").upper()
+LOG_LEVELS = os.getenv("LOG_LEVELS", "")
+LOG_FORMAT = os.getenv("LOG_FORMAT", "json").lower()
+LOG_SAMPLE_RATES = os.getenv("LOG_SAMPLE_RATES", "")
+
+# Atributos estándar de LogRecord; el resto (extra=...) se agrega como campos del JSON
+_RECORD_ATTRS = set(vars(logging.LogRecord("", 0, "", 0, "", None, None))) | {"message", "asctime"}
+
+_listener: Optional[QueueListener] = None
+
+
+def _parse_pairs(value: str) -> dict[str, str]:
+    """'a=1,b=2' -> {'a': '1', 'b': '2'}"""
+    pairs = {}
+    for item in value.split(","):
+        name, sep, setting = item.partition("=")
+        if sep and name.strip():
+            pairs[name.strip()] = setting.strip()
+    return pairs
+
+
+class SamplingFilter(logging.Filter):
+    """Deja pasar solo una fracción de los records de cada evento muestreado"""
+
+    def __init__(self, rates: dict[str, float]):
+        super().__init__()
+        self.rates = rates
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        if record.levelno >= logging.WARNING:
+            return True
+        rate = self.rates.get(getattr(record, "event", None))
+        return rate is None or random.random() < rate
+
+
+class TraceContextFilter(logging.Filter):
+    """Agregar trace_id / span_id del span activo; corre en el thread que loguea, donde vive el contexto"""
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        if trace is not None:
+            ctx = trace.get_current_span().get_span_context()
+            if ctx.is_valid:
+                record.trace_id = format(ctx.trace_id, "032x")
+                record.span_id = format(ctx.span_id, "016x")
+        return True
+
+
+class JsonFormatter(logging.Formatter):
+    """Una línea JSON por record"""
+
+    def __init__(self, service: str):
+        super().__init__()
+        self.service = service
+
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            "ts": datetime.fromtimestamp(record.created, timezone.utc).isoformat(timespec="milliseconds"),
+            "level": record.levelname,
+            "service": self.service,
+            "logger": record.name,
+            "message": record.getMessage(),
+        }
+        for key, value in record.__dict__.items():
+            if key not in _RECORD_ATTRS and not key.startswith("_"):
+                entry[key] = value
+        if record.exc_info:
+            entry["exc_info"] = self.formatException(record.exc_info)
+        elif record.exc_text:
+            entry["exc_info"] = record.exc_text
+        return json.dumps(entry, default=str, ensure_ascii=False)
+
+
+class DeferredQueueHandler(QueueHandler):
+    """
+    QueueHandler que no formatea en el thread del request: solo resuelve msg % args
+    (los args pueden ser objetos mutables) y deja el JSON para el listener.
+    """
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        record = logging.makeLogRecord(record.__dict__)
+        record.msg = record.getMessage()
+        record.args = None
+        if record.exc_info:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+
+def _route_server_loggers():
+    """
+    Los loggers de uvicorn / gunicorn traen handlers propios (síncronos, texto plano); pasan a usar el root.
+    El UvicornWorker de gunicorn los vuelve a configurar al crearse, así que se repite después del fork.
+    """
+    for name in ("uvicorn", "uvicorn.error", "uvicorn.access", "gunicorn.error"):
+        server_logger = logging.getLogger(name)
+        server_logger.handlers = []
+        server_logger.propagate = True
+
+
+def setup_logging(service: str):
+    """Configurar el root logger del proceso (idempotente)"""
+    global _listener
+    if _listener is not None:
+        return
+
+    stream = logging.StreamHandler(sys.stdout)
+    if LOG_FORMAT == "text":
+        stream.setFormatter(logging.Formatter("%(asctime)s %(levelname)s %(name)s: %(message)s"))
+    else:
+        stream.setFormatter(JsonFormatter(service))
+
+    handler = DeferredQueueHandler(queue.SimpleQueue())
+    handler.addFilter(SamplingFilter({event: float(rate) for event, rate in _parse_pairs(LOG_SAMPLE_RATES).items()}))
+    handler.addFilter(TraceContextFilter())
+
+    root = logging.getLogger()
+    root.handlers = [handler]
+    root.setLevel(LOG_LEVEL)
+    for name, level in _parse_pairs(LOG_LEVELS).items():
+        logging.getLogger(name).setLevel(level.upper())
+
+    _route_server_loggers()
+
+    _listener = QueueListener(handler.queue, stream, respect_handler_level=True)
+    _listener.start()
+    atexit.register(_listener.stop)
+
+
+def restart_listener():
+    """
+    Después del fork de un worker gunicorn (--preload): el thread del listener no sobrevive al fork y el
+    UvicornWorker reemplazó los handlers de uvicorn.*; levantar un listener nuevo y volver a rutearlos al root.
+    """
+    global _listener
+    if _listener is None:
+        return
+    _route_server_loggers()
+    atexit.unregister(_listener.stop)
+    _listener = QueueListener(_listener.queue, *_listener.handlers, respect_handler_level=True)
+    _listener.start()
+    atexit.register(_listener.stop)
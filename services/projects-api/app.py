@@ -1,53 +1,181 @@
 
 import os
+import time
 import logging
-from fastapi import FastAPI, HTTPException, Request
-from fastapi.responses import JSONResponse
-from sqlalchemy import text
+from typing import Optional
+import orjson
+from fastapi import FastAPI, HTTPException, Request, Response, BackgroundTasks, Header
+from fastapi.responses import JSONResponse, ORJSONResponse
+from sqlalchemy import text, Integer, any_, bindparam
+from sqlalchemy.dialects.postgresql import ARRAY
 from pybreaker import CircuitBreakerError
-from db import Base, engine, session_scope, init_schema
+from db import (
+    engine, session_scope, pool_stats, start_liveness_check, query_stats, read_engines, dispose_engines,
+    new_query_stats, repeated_statements, server_timing,
+    check_replicas_health, db_route, READ_YOUR_WRITES_COOKIE, READ_YOUR_WRITES_SECONDS,
+)
 from models import Project
 from schemas import ProjectCreate, ProjectOut
-from patterns import CacheAside, RateLimiter, check_redis_health, call_external_service
-from messaging import AsyncTaskProcessor, check_rabbitmq_health
+from patterns import CacheAside, RateLimiter, cache_headers, etag_matches, refresh_gateway_cache, check_redis_health, call_external_service, IdempotencyStore, make_etag, parse_ids, BatchLoader, request_memo, close_http_client, LoadShedder, publish_breaker_state, LOAD_SHEDDING_ENABLED, LOAD_SHED_RETRY_AFTER, reset_connections
+from messaging import AsyncTaskProcessor, check_rabbitmq_health, desired_workers
+from tracing import setup_tracing
+from logging_config import setup_logging, restart_listener
+from timing import request_timings, format_server_timing, start_profiler, save_profile, ProfiledRoute, SERVER_TIMING_ENABLED
+from metrics import (
+    HTTP_REQUESTS, HTTP_REQUEST_DURATION, HTTP_IN_FLIGHT, DB_TIME_PER_REQUEST, DB_QUERIES_PER_REQUEST, DB_REPEATED_STATEMENTS,
+    IDEMPOTENCY_REQUESTS, route_label, observe_pool, render_metrics,
+)
 
-logging.basicConfig(level=logging.INFO)
+setup_logging("projects-api")
 logger = logging.getLogger(__name__)
 
-app = FastAPI(title="Projects API")
+app = FastAPI(title="Projects API", default_response_class=ORJSONResponse)
+# Los handlers sync se perfilan en el thread del threadpool donde corren (ver timing.py)
+app.router.route_class = ProfiledRoute
+setup_tracing("projects-api", app, engines=[engine, *read_engines])
 
-init_schema()
-Base.metadata.create_all(bind=engine)
+# El schema y las tablas los crea el job de migraciones (alembic upgrade head), no el import
+
+# Métodos con label propia en las métricas (el resto se agrupa como OTHER)
+HTTP_METHODS = {"GET", "HEAD", "POST", "PUT", "PATCH", "DELETE", "OPTIONS"}
 
 # Inicializar patrones
 cache = CacheAside(prefix="projects", ttl=300)
-rate_limiter = RateLimiter(max_requests=100, window_seconds=60)
+rate_limiter = RateLimiter()
+load_shedder = LoadShedder()
+idempotency = IdempotencyStore(prefix="projects")
 task_processor = AsyncTaskProcessor("project_tasks")
 
 USERS_API_URL = os.getenv("USERS_API_URL", "http://users-api:8000")
 
+# Lookups de usuarios agrupados en llamadas multi-get (?ids=)
+users_loader = BatchLoader("users", f"{USERS_API_URL}/users")
+
 # Registrar handlers de tareas asíncronas
 def handle_project_notification(data: dict):
     """Ejemplo de handler async para notificaciones de proyecto"""
-    logger.info(f"Procesando notificación de proyecto: {data}")
+    logger.debug("Procesando notificación de proyecto: %s", data, extra={"event": "notification"})
 
 task_processor.register_handler("project_notification", handle_project_notification)
 
+# Con gunicorn --preload la app se importa en el master y los workers heredan sus conexiones
+def reset_after_fork():
+    """
+    Llamado desde post_fork en cada worker: descartar el pool de la base, Redis, httpx y pika del master
+    y levantar el listener de logging (los threads no sobreviven al fork). Los threads de liveness,
+    particiones y monitor de cola arrancan en startup, que ya corre por worker.
+    """
+    dispose_engines()
+    reset_connections()
+    task_processor.queue.reset_connections()
+    restart_listener()
+
+
 @app.on_event("startup")
 async def startup_event():
     logger.info("Iniciando Projects API con patrones arquitectónicos")
     logger.info("Queue-based load leveling listo ")
+    start_liveness_check()
+    # Gauges iniciales por worker (ver publish_breaker_state)
+    load_shedder.publish_metrics()
+    publish_breaker_state()
+    task_processor.start_monitor()
 
 @app.on_event("shutdown")
 async def shutdown_event():
     logger.info("Deteniendo Projects API")
     task_processor.stop_worker()
+    await close_http_client()
+
+# Middleware de ruteo de lecturas: GETs a réplica salvo escritura reciente del cliente
+@app.middleware("http")
+async def read_routing_middleware(request: Request, call_next):
+    sticky = READ_YOUR_WRITES_COOKIE in request.cookies
+    reading = request.method in ("GET", "HEAD") and not sticky
+    token = db_route.set("read" if reading else "write")
+    try:
+        response = await call_next(request)
+    finally:
+        db_route.reset(token)
+    # Read-your-writes: luego de escribir, el cliente lee del primario durante una ventana corta
+    if request.method not in ("GET", "HEAD") and response.status_code < 400:
+        response.set_cookie(READ_YOUR_WRITES_COOKIE, "1", max_age=READ_YOUR_WRITES_SECONDS, httponly=True)
+    return response
+
+# Middleware de Idempotency-Key: un POST reintentado devuelve la respuesta original sin re-ejecutar la escritura
+@app.middleware("http")
+async def idempotency_middleware(request: Request, call_next):
+    key = request.headers.get("idempotency-key")
+    if request.method != "POST" or not key:
+        return await call_next(request)
+    key = idempotency.scoped_key(key, request.headers.get("authorization"))
+    
+    fingerprint = idempotency.fingerprint(request.method, request.url.path, await request.body())
+    try:
+        stored = idempotency.get(key)
+        if stored is None and not idempotency.acquire(key):
+            # Un duplicado concurrente está en curso: esperar su respuesta
+            stored = await idempotency.wait(key)
+            if stored is None:
+                IDEMPOTENCY_REQUESTS.labels("in_progress").inc()
+                return JSONResponse(
+                    status_code=409,
+                    content={"detail": "Request con esta Idempotency-Key en curso"},
+                    headers={"Retry-After": "1"},
+                )
+    except Exception as e:
+        # Sin Redis no hay deduplicación, pero el request se atiende igual
+        logger.warning(f"Idempotency store no disponible: {e}")
+        return await call_next(request)
+    
+    if stored is not None:
+        if stored["fingerprint"] != fingerprint:
+            IDEMPOTENCY_REQUESTS.labels("mismatch").inc()
+            return JSONResponse(status_code=422, content={"detail": "Idempotency-Key reutilizada con otro request"})
+        IDEMPOTENCY_REQUESTS.labels("replayed").inc()
+        return Response(
+            content=stored["body"],
+            status_code=stored["status_code"],
+            media_type=stored["media_type"],
+            headers={"Idempotent-Replayed": "true"},
+        )
+    
+    IDEMPOTENCY_REQUESTS.labels("new").inc()
+    try:
+        response = await call_next(request)
+        body = b"".join([chunk async for chunk in response.body_iterator])
+    except Exception:
+        idempotency.release(key)
+        raise
+    # Los 5xx se pueden reintentar; el resto (incluidos los 4xx de validación) se guarda
+    try:
+        if response.status_code >= 500:
+            idempotency.release(key)
+        else:
+            media_type = response.headers.get("content-type", "application/json")
+            idempotency.save(key, fingerprint, response.status_code, media_type, body)
+    except Exception as e:
+        logger.warning(f"No se pudo guardar la respuesta idempotente: {e}")
+    
+    async def replay_body():
+        yield body
+    response.body_iterator = replay_body()
+    return response
+
+# Middleware de memo por request: lookups repetidos a otros servicios se resuelven una vez (BatchLoader)
+@app.middleware("http")
+async def request_memo_middleware(request: Request, call_next):
+    token = request_memo.set({})
+    try:
+        return await call_next(request)
+    finally:
+        request_memo.reset(token)
 
 # Middleware de rate limiting
 @app.middleware("http")
 async def rate_limit_middleware(request: Request, call_next):
     identifier = request.client.host
-    if request.url.path in ["/healthz", "/health"]:
+    if request.url.path in ["/healthz", "/health", "/metrics"]:
         return await call_next(request)
     if not rate_limiter.is_allowed(identifier):
         return JSONResponse(
@@ -56,6 +184,69 @@ async def rate_limit_middleware(request: Request, call_next):
         )
     return await call_next(request)
 
+# Middleware de load shedding: límite de concurrencia adaptativo por clase de ruta; en sobrecarga
+# responde 503 enseguida en lugar de acumular requests en el threadpool hasta el timeout del gateway
+@app.middleware("http")
+async def load_shedding_middleware(request: Request, call_next):
+    if not LOAD_SHEDDING_ENABLED or request.url.path in ["/healthz", "/health", "/metrics"]:
+        return await call_next(request)
+    limiter = load_shedder.try_acquire(load_shedder.route_class(request.method))
+    if limiter is None:
+        return JSONResponse(
+            status_code=503,
+            content={"detail": "Servicio sobrecargado. Intente nuevamente más tarde."},
+            headers={"Retry-After": str(LOAD_SHED_RETRY_AFTER)},
+        )
+    start = time.perf_counter()
+    failed = True
+    try:
+        response = await call_next(request)
+        # 503 propios (circuit breaker) son rápidos y no indican saturación de este servicio
+        failed = response.status_code >= 500 and response.status_code != 503
+        return response
+    finally:
+        limiter.release(time.perf_counter() - start, failed)
+
+# Middleware de métricas (el más externo): latencia y status por template de ruta + tiempo en la base
+# y por fase (header Server-Timing), statements repetidos en modo DB_QUERY_DEBUG y profiling opt-in
+@app.middleware("http")
+async def metrics_middleware(request: Request, call_next):
+    stats = new_query_stats()
+    stats_token = query_stats.set(stats)
+    timings = {}
+    timings_token = request_timings.set(timings)
+    method = request.method if request.method in HTTP_METHODS else "OTHER"
+    HTTP_IN_FLIGHT.inc()
+    profiler = start_profiler(request)
+    start = time.perf_counter()
+    status_code = 500
+    try:
+        response = await call_next(request)
+        status_code = response.status_code
+        if SERVER_TIMING_ENABLED:
+            response.headers.append(
+                "Server-Timing", f"{server_timing(stats)}, {format_server_timing(timings, time.perf_counter() - start)}"
+            )
+        if profiler is not None:
+            profile = await save_profile(profiler, method, route_label(request.scope))
+            if profile:
+                response.headers["X-Profile-File"] = profile
+        return response
+    finally:
+        if profiler is not None and profiler.is_running:
+            profiler.stop()
+        HTTP_IN_FLIGHT.dec()
+        route = route_label(request.scope)
+        HTTP_REQUEST_DURATION.labels(method, route).observe(time.perf_counter() - start)
+        HTTP_REQUESTS.labels(method, route, str(status_code)).inc()
+        DB_TIME_PER_REQUEST.labels(route).observe(stats["seconds"])
+        DB_QUERIES_PER_REQUEST.labels(route).observe(stats["count"])
+        for statement, count in repeated_statements(stats):
+            DB_REPEATED_STATEMENTS.labels(route).inc()
+            logger.warning("Posible N+1 en %s %s: %d ejecuciones de %s", method, route, count, statement, extra={"event": "repeated_statement"})
+        query_stats.reset(stats_token)
+        request_timings.reset(timings_token)
+
 @app.exception_handler(CircuitBreakerError)
 async def circuit_breaker_handler(request: Request, exc: CircuitBreakerError):
     return JSONResponse(
@@ -63,6 +254,15 @@ async def circuit_breaker_handler(request: Request, exc: CircuitBreakerError):
         content={"detail": "Servicio temporalmente no disponible. Circuit breaker está abierto."}
     )
 
+@app.get("/metrics", include_in_schema=False)
+def metrics():
+    """Exposición Prometheus (no pasa por el gateway)"""
+    observe_pool("primary", pool_stats())
+    for i, e in enumerate(read_engines):
+        observe_pool(f"replica{i}", pool_stats(e))
+    body, content_type = render_metrics()
+    return Response(content=body, media_type=content_type)
+
 @app.get("/health")
 @app.get("/healthz")
 async def health_check():
@@ -75,13 +275,20 @@ async def health_check():
     
     # Verificar base de datos
     try:
-        with session_scope() as s:
+        with session_scope(readonly=False) as s:
             s.execute(text("SELECT 1"))
-        health_status["dependencies"]["database"] = {"status": "healthy"}
+        health_status["dependencies"]["database"] = {"status": "healthy", "pool": pool_stats()}
     except Exception as e:
         health_status["dependencies"]["database"] = {"status": "unhealthy", "error": str(e)}
         health_status["status"] = "degraded"
     
+    # Verificar réplicas de lectura
+    replicas = check_replicas_health()
+    if replicas:
+        health_status["dependencies"]["database_replicas"] = replicas
+        if any(r["status"] != "healthy" for r in replicas):
+            health_status["status"] = "degraded"
+    
     # Verificar Redis
     redis_health = check_redis_health()
     health_status["dependencies"]["redis"] = redis_health
@@ -105,19 +312,28 @@ async def health_check():
         health_status["dependencies"]["users-api"] = {"status": "unhealthy", "error": str(e)}
         health_status["status"] = "degraded"
     
+    # Cola: informativo; una cola larga no es motivo para reiniciar el pod (ver admission control y
+    # la señal mq_desired_workers en /metrics), así que no cambia el status
+    queue = task_processor.queue
+    health_status["queue"] = {
+        "size": queue.depth,
+        "consumers": queue.consumers,
+        "saturated": queue.saturated,
+        "desired_workers": desired_workers(queue.depth) if queue.depth is not None else None,
+    }
+    
     status_code = 200 if health_status["status"] == "healthy" else 503
     return JSONResponse(content=health_status, status_code=status_code)
 
 @app.post("/projects", response_model=ProjectOut, status_code=201)
-async def create_project(payload: ProjectCreate):
+async def create_project(payload: ProjectCreate, background_tasks: BackgroundTasks):
     logger.info(f"Creando proyecto '{payload.name}' para user_id={payload.owner_user_id}")
     
     # Validar que usuario existe usando patrones Circuit Breaker + Retry
     try:
-        user_url = f"{USERS_API_URL}/users/{payload.owner_user_id}"
-        logger.info(f"Validando que usuario existe en: {user_url}")
-        user_data = await call_external_service(user_url)
-        logger.info(f"Validación de usuario exitosa: {user_data.get('id')}")
+        logger.debug("Validando que usuario existe: %s", payload.owner_user_id)
+        user_data = await users_loader.load(payload.owner_user_id)
+        logger.debug("Validación de usuario exitosa: %s", user_data.get("id"))
     except CircuitBreakerError as e:
         logger.error(f"Circuit breaker está abierto para validación de usuario: {e}")
         raise HTTPException(
@@ -137,47 +353,102 @@ async def create_project(payload: ProjectCreate):
         # Invalidar cache
         cache.invalidate_pattern("project:*")
         cache.invalidate_pattern("projects:list")
-        
-        # Encolar notificación async
-        try:
-            task_processor.enqueue_task("project_notification", {
-                "project_id": p.id,
-                "owner_user_id": p.owner_user_id,
-                "type": "created"
-            })
-        except Exception as e:
-            logger.warning(f"Falló al encolar notificación: {e}")
-        
-        return p
+    
+    # Encolar notificación async (handler async: variante que no bloquea el event loop)
+    try:
+        await task_processor.enqueue_task_async("project_notification", {
+            "project_id": p.id,
+            "name": p.name,
+            "owner_user_id": p.owner_user_id,
+            "type": "created"
+        })
+    except Exception as e:
+        logger.warning(f"Falló al encolar notificación: {e}")
+    
+    # Refrescar micro-cache del gateway una vez respondido el request
+    background_tasks.add_task(refresh_gateway_cache, "/api/projects/projects")
+    
+    return p
+
+def get_projects_batch(ids: str, if_none_match: Optional[str]) -> Response:
+    """
+    Multi-get por IDs: hits de Redis en un round trip, misses en una sola query (= ANY) y backfill
+    del cache con un pipeline. El array JSON se arma con los bytes cacheados, sin deserializar.
+    """
+    try:
+        project_ids = parse_ids(ids)
+    except ValueError as e:
+        raise HTTPException(status_code=422, detail=f"ids inválido: {e}")
+    keys = {project_id: f"project:{project_id}" for project_id in project_ids}
+    found = cache.get_many_raw(list(keys.values()))
+    
+    missing = [project_id for project_id, key in keys.items() if key not in found]
+    if missing:
+        with session_scope() as s:
+            rows = s.query(Project).filter(Project.id == any_(bindparam("ids", missing, type_=ARRAY(Integer)))).all()
+            loaded = {keys[r.id]: ProjectOut.model_validate(r).model_dump() for r in rows}
+        cache.set_many(loaded)
+        found.update({key: orjson.dumps(value) for key, value in loaded.items()})
+    
+    # Mismo orden que ids; los inexistentes se omiten
+    body = b"[" + b",".join(found[key] for key in keys.values() if key in found) + b"]"
+    etag = make_etag(body)
+    if etag_matches(if_none_match, etag):
+        return Response(status_code=304, headers=cache_headers(etag))
+    return Response(content=body, media_type="application/json", headers=cache_headers(etag))
 
 @app.get("/projects", response_model=list[ProjectOut])
-def list_projects():
-    """Listar proyectos con patrón Cache-Aside"""
+def list_projects(response: Response, ids: str | None = None, if_none_match: str | None = Header(None)):
+    """Listar proyectos con patrón Cache-Aside (con ?ids=1,2,3: multi-get por IDs)"""
+    if ids is not None:
+        return get_projects_batch(ids, if_none_match)
+    
     cache_key = "projects:list"
-    cached_projects = cache.get(cache_key)
+    # GET condicional: el ETag se lee de Redis sin tocar el body
+    if if_none_match:
+        etag = cache.get_etag(cache_key)
+        if etag_matches(if_none_match, etag):
+            return Response(status_code=304, headers=cache_headers(etag))
+    
+    # Cache hit: el JSON guardado ya fue validado contra ProjectOut en el miss,
+    # se envía tal cual sin pasar por response_model
+    cached_projects, etag = cache.get_raw_with_etag(cache_key)
     
     if cached_projects is not None:
-        return cached_projects
+        return Response(content=cached_projects, media_type="application/json", headers=cache_headers(etag))
     
     with session_scope() as s:
         projects = s.query(Project).order_by(Project.id).all()
         project_list = [ProjectOut.model_validate(p) for p in projects]
-        cache.set(cache_key, [p.model_dump() for p in project_list])
+        etag = cache.set(cache_key, [p.model_dump() for p in project_list])
+        response.headers.update(cache_headers(etag))
+        if etag_matches(if_none_match, etag):
+            return Response(status_code=304, headers=cache_headers(etag))
         return project_list
 
 @app.get("/projects/{project_id}", response_model=ProjectOut)
-def get_project(project_id: int):
+def get_project(project_id: int, response: Response, if_none_match: str | None = Header(None)):
     """Obtener proyecto por ID con patrón Cache-Aside"""
     cache_key = f"project:{project_id}"
-    cached_project = cache.get(cache_key)
+    # GET condicional: el ETag se lee de Redis sin tocar el body
+    if if_none_match:
+        etag = cache.get_etag(cache_key)
+        if etag_matches(if_none_match, etag):
+            return Response(status_code=304, headers=cache_headers(etag))
+    
+    # Cache hit: enviar el JSON guardado sin deserializar ni re-validar
+    cached_project, etag = cache.get_raw_with_etag(cache_key)
     
     if cached_project is not None:
-        return ProjectOut(**cached_project)
+        return Response(content=cached_project, media_type="application/json", headers=cache_headers(etag))
     
     with session_scope() as s:
         p = s.get(Project, project_id)
         if not p:
             raise HTTPException(status_code=404, detail="not found")
         project_out = ProjectOut.model_validate(p)
-        cache.set(cache_key, project_out.model_dump())
+        etag = cache.set(cache_key, project_out.model_dump())
+        response.headers.update(cache_headers(etag))
+        if etag_matches(if_none_match, etag):
+            return Response(status_code=304, headers=cache_headers(etag))
         return project_out
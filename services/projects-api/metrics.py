@@ -0,0 +1,133 @@
+"""
+Métricas Prometheus de la API y de los patrones arquitectónicos:
+Cache-Aside, Rate Limiting, Circuit Breaker, Retry, Idempotency-Key, BatchLoader y colas RabbitMQ.
+
+Las labels tienen cardinalidad acotada: la ruta es el template de FastAPI (/tasks/{task_id}),
+nunca el path crudo, y no se usan IDs, keys de cache ni URLs completas como label.
+"""
+import os
+import time
+from functools import wraps
+from typing import Optional
+from prometheus_client import Counter, Gauge, Histogram, CollectorRegistry, CONTENT_TYPE_LATEST, generate_latest, multiprocess
+from timing import add_phase
+
+# Buckets para operaciones cortas (Redis, statements, publish) y para requests completos
+FAST_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0)
+REQUEST_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+# HTTP
+HTTP_REQUESTS = Counter("http_requests_total", "Requests HTTP atendidos", ["method", "route", "status"])
+HTTP_REQUEST_DURATION = Histogram(
+    "http_request_duration_seconds", "Latencia de requests HTTP", ["method", "route"], buckets=REQUEST_BUCKETS
+)
+HTTP_IN_FLIGHT = Gauge("http_requests_in_flight", "Requests HTTP en curso", multiprocess_mode="livesum")
+
+# Base de datos
+DB_QUERY_DURATION = Histogram(
+    "db_query_duration_seconds", "Latencia por statement SQL", ["target"], buckets=FAST_BUCKETS
+)
+DB_TIME_PER_REQUEST = Histogram(
+    "db_time_per_request_seconds", "Tiempo total en la base por request", ["route"], buckets=REQUEST_BUCKETS
+)
+DB_QUERIES_PER_REQUEST = Histogram(
+    "db_queries_per_request", "Statements SQL por request", ["route"], buckets=(0, 1, 2, 3, 5, 10, 20, 50, 100)
+)
+DB_SLOW_QUERIES = Counter("db_slow_queries_total", "Statements que superaron DB_SLOW_QUERY_MS", ["target"])
+DB_REPEATED_STATEMENTS = Counter(
+    "db_repeated_statements_total", "Statements repetidos dentro de un request (posible N+1)", ["route"]
+)
+DB_POOL_SIZE = Gauge("db_pool_size", "Tamaño configurado del pool", ["target"], multiprocess_mode="livesum")
+DB_POOL_CHECKED_OUT = Gauge("db_pool_checked_out", "Conexiones en uso", ["target"], multiprocess_mode="livesum")
+DB_POOL_OVERFLOW = Gauge("db_pool_overflow", "Conexiones de overflow abiertas", ["target"], multiprocess_mode="livesum")
+DB_POOL_CHECKOUT_TIMEOUTS = Gauge("db_pool_checkout_timeouts", "Checkouts que vencieron pool_timeout (acumulado)", ["target"], multiprocess_mode="livesum")
+DB_POOL_CHECKOUT_WAIT_MAX = Gauge("db_pool_checkout_wait_max_seconds", "Máxima espera por una conexión libre", ["target"], multiprocess_mode="livemax")
+
+# Redis / Cache-Aside / Rate Limiting / Idempotency
+REDIS_OPERATION_DURATION = Histogram(
+    "redis_operation_duration_seconds", "Latencia de operaciones contra Redis", ["operation"], buckets=FAST_BUCKETS
+)
+CACHE_REQUESTS = Counter("cache_requests_total", "Lecturas de cache por resultado", ["cache", "result"])
+CACHE_SET_BYTES = Histogram(
+    "cache_set_bytes", "Tamaño de las entradas escritas en cache", ["cache"],
+    buckets=(256, 1024, 4096, 16384, 65536, 262144, 1048576),
+)
+RATE_LIMIT_DECISIONS = Counter("rate_limit_decisions_total", "Decisiones del rate limiter", ["result"])
+IDEMPOTENCY_REQUESTS = Counter("idempotency_requests_total", "POSTs con Idempotency-Key por resultado", ["result"])
+
+# Load shedding: límite de concurrencia adaptativo por clase de ruta
+CONCURRENCY_LIMIT = Gauge("concurrency_limit", "Límite de concurrencia actual (AIMD)", ["route_class"], multiprocess_mode="livesum")
+CONCURRENCY_IN_FLIGHT = Gauge("concurrency_in_flight", "Requests admitidos en curso", ["route_class"], multiprocess_mode="livesum")
+CONCURRENCY_REJECTED = Counter("concurrency_rejected_total", "Requests rechazados con 503 por sobrecarga", ["route_class"])
+
+# Llamadas a otros servicios: Circuit Breaker / Retry / BatchLoader
+EXTERNAL_CALL_DURATION = Histogram(
+    "external_call_duration_seconds", "Latencia de llamadas a otros servicios", ["service", "outcome"],
+    buckets=REQUEST_BUCKETS,
+)
+CIRCUIT_BREAKER_STATE = Gauge("circuit_breaker_state", "Estado del breaker (0=closed, 1=half-open, 2=open)", ["breaker"], multiprocess_mode="livemax")
+CIRCUIT_BREAKER_TRANSITIONS = Counter("circuit_breaker_transitions_total", "Cambios de estado del breaker", ["breaker", "state"])
+RETRY_ATTEMPTS = Counter("retry_attempts_total", "Reintentos por fallas transitorias", ["operation"])
+BATCH_LOADER_BATCH_SIZE = Histogram(
+    "batch_loader_batch_size", "IDs por llamada multi-get", ["loader"], buckets=(1, 2, 5, 10, 20, 50, 100)
+)
+
+# RabbitMQ / Queue-Based Load Leveling
+MQ_PUBLISHED = Counter("mq_messages_published_total", "Mensajes publicados", ["queue", "type", "result"])
+MQ_PUBLISH_DURATION = Histogram("mq_publish_duration_seconds", "Latencia de publish", ["queue"], buckets=FAST_BUCKETS)
+MQ_CONSUMED = Counter("mq_messages_consumed_total", "Mensajes procesados", ["queue", "type", "result"])
+MQ_HANDLER_DURATION = Histogram(
+    "mq_handler_duration_seconds", "Latencia de los handlers de mensajes", ["queue", "type"], buckets=REQUEST_BUCKETS
+)
+MQ_QUEUE_DEPTH = Gauge("mq_queue_depth", "Mensajes en cola (última lectura)", ["queue"], multiprocess_mode="livemax")
+MQ_QUEUE_CONSUMERS = Gauge("mq_queue_consumers", "Consumidores conectados a la cola (última lectura)", ["queue"], multiprocess_mode="livemax")
+MQ_ACKS = Counter("mq_messages_acked_total", "Acks / nacks de mensajes consumidos", ["queue", "outcome"])
+MQ_QUEUE_SATURATED = Gauge("mq_queue_saturated", "1 si la cola superó el high watermark (admission control activo)", ["queue"], multiprocess_mode="livemax")
+MQ_DESIRED_WORKERS = Gauge("mq_desired_workers", "Workers necesarios para la profundidad actual (señal de autoscaling)", ["queue"], multiprocess_mode="livemax")
+
+BREAKER_STATES = {"closed": 0, "half-open": 1, "open": 2}
+
+
+def timed(histogram: Histogram, *labels: str, phase: Optional[str] = None):
+    """Decorator que observa la duración de la función en el histograma (y en la fase de Server-Timing)"""
+    child = histogram.labels(*labels)
+
+    def decorator(func):
+        @wraps(func)
+        def wrapper(*args, **kwargs):
+            start = time.perf_counter()
+            try:
+                return func(*args, **kwargs)
+            finally:
+                elapsed = time.perf_counter() - start
+                child.observe(elapsed)
+                if phase:
+                    add_phase(phase, elapsed)
+        return wrapper
+    return decorator
+
+
+def route_label(scope: dict) -> str:
+    """Template de la ruta que atendió el request; los paths sin ruta se agrupan en una sola label"""
+    route = scope.get("route")
+    return getattr(route, "path", None) or "unmatched"
+
+
+def observe_pool(target: str, stats: dict):
+    """Volcar pool_stats() en los gauges del pool"""
+    if stats.get("mode") != "pool":
+        return
+    DB_POOL_SIZE.labels(target).set(stats["size"])
+    DB_POOL_CHECKED_OUT.labels(target).set(stats["checked_out"])
+    DB_POOL_OVERFLOW.labels(target).set(stats["overflow"])
+    DB_POOL_CHECKOUT_TIMEOUTS.labels(target).set(stats["timeouts"])
+    DB_POOL_CHECKOUT_WAIT_MAX.labels(target).set(stats["wait_seconds_max"])
+
+
+def render_metrics() -> tuple[bytes, str]:
+    """Exposición en formato de texto de Prometheus (agregando todos los workers bajo gunicorn)"""
+    if "PROMETHEUS_MULTIPROC_DIR" in os.environ:
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+        return generate_latest(registry), CONTENT_TYPE_LATEST
+    return generate_latest(), CONTENT_TYPE_LATEST
@@ -0,0 +1,33 @@
+"""Tablas iniciales de projects-api
+
+Revision ID: 0001
+Revises:
+Create Date: 2026-10-19
+"""
+from alembic import op
+import sqlalchemy as sa
+
+revision = "0001"
+down_revision = None
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # Bases creadas antes de las migraciones (create_all al importar) ya tienen las tablas
+    existing = sa.inspect(op.get_bind()).get_table_names()
+    
+    if "projects" not in existing:
+        op.create_table(
+            "projects",
+            sa.Column("id", sa.Integer(), primary_key=True),
+            sa.Column("name", sa.String(200), nullable=False),
+            sa.Column("owner_user_id", sa.Integer(), nullable=False),
+            sa.Column("created_at", sa.DateTime(timezone=True), server_default=sa.func.now(), nullable=False),
+        )
+        op.create_index("ix_projects_name", "projects", ["name"])
+        op.create_index("ix_projects_owner_user_id", "projects", ["owner_user_id"])
+
+
+def downgrade():
+    op.drop_table("projects")
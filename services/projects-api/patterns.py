@@ -8,29 +8,74 @@ Implementación de Patrones Arquitectónicos:
 
 import os
 import time
-import json
+import asyncio
+import hashlib
 import logging
 from functools import wraps
+from contextvars import ContextVar
 from typing import Optional, Any, Callable
 import redis
 import httpx
-from pybreaker import CircuitBreaker, CircuitBreakerError
+import orjson
+import msgpack
+import zstandard
+from pybreaker import CircuitBreaker, CircuitBreakerError, CircuitBreakerListener
 from tenacity import retry, stop_after_attempt, wait_exponential, retry_if_exception_type
+from metrics import (
+    timed, BREAKER_STATES, CIRCUIT_BREAKER_STATE, CIRCUIT_BREAKER_TRANSITIONS, RETRY_ATTEMPTS,
+    EXTERNAL_CALL_DURATION, BATCH_LOADER_BATCH_SIZE, REDIS_OPERATION_DURATION, CACHE_REQUESTS,
+    CACHE_SET_BYTES, RATE_LIMIT_DECISIONS, CONCURRENCY_LIMIT, CONCURRENCY_IN_FLIGHT, CONCURRENCY_REJECTED,
+)
+from timing import add_phase
+from tracing import inject_headers, TRACING_ENABLED
 
-logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
 # Conexión a Redis para caching
 REDIS_URL = os.getenv("REDIS_URL", "redis://localhost:6379")
-redis_client = redis.from_url(REDIS_URL, decode_responses=True)
+redis_client = redis.from_url(REDIS_URL)
+
+
+class BreakerMetricsListener(CircuitBreakerListener):
+    """Exporta el estado del circuit breaker a Prometheus"""
+    
+    def state_change(self, cb, old_state, new_state):
+        CIRCUIT_BREAKER_STATE.labels(cb.name).set(BREAKER_STATES.get(new_state.name, 0))
+        CIRCUIT_BREAKER_TRANSITIONS.labels(cb.name, new_state.name).inc()
+        logger.warning(f"Circuit breaker {cb.name}: {old_state.name} -> {new_state.name}")
+
 
 # Configuración del Circuit Breaker
 circuit_breaker = CircuitBreaker(
     fail_max=5,  # Abre el circuito después de 5 fallos
     reset_timeout=30,  # Mantiene el circuito abierto por 30 segundos
-    name="inter_service_breaker"
+    name="inter_service_breaker",
+    listeners=[BreakerMetricsListener()],
 )
 
+
+def publish_breaker_state():
+    """
+    Estado inicial del breaker en /metrics. Se llama en el startup de cada worker, no al importar: con
+    gunicorn --preload el import corre en el master y su archivo de métricas quedaría como un proceso más
+    """
+    CIRCUIT_BREAKER_STATE.labels(circuit_breaker.name).set(BREAKER_STATES.get(circuit_breaker.current_state, 0))
+
+
+# Micro-cache HTTP: el gateway cachea GETs por este tiempo y sirve stale mientras revalida
+HTTP_CACHE_MAX_AGE = int(os.getenv("HTTP_CACHE_MAX_AGE", "1"))
+HTTP_CACHE_STALE_SECONDS = int(os.getenv("HTTP_CACHE_STALE_SECONDS", "5"))
+GATEWAY_URL = os.getenv("GATEWAY_URL", "")
+# Token que el gateway exige para honrar X-Cache-Refresh (sin token no se refresca)
+CACHE_REFRESH_TOKEN = os.getenv("CACHE_REFRESH_TOKEN", "")
+
+def _before_retry_sleep(retry_state):
+    RETRY_ATTEMPTS.labels("external_call").inc()
+    logger.warning(
+        f"Intento de retry {retry_state.attempt_number} después de {retry_state.outcome.exception()}"
+    )
+
+
 def retry_with_backoff(max_attempts=3):
     """
     Patrón Retry con exponential backoff.
@@ -41,29 +86,356 @@ def retry_with_backoff(max_attempts=3):
         wait=wait_exponential(multiplier=1, min=2, max=10),
         retry=retry_if_exception_type((httpx.RequestError, httpx.TimeoutException)),
         reraise=True,
-        before_sleep=lambda retry_state: logger.warning(
-            f"Intento de retry {retry_state.attempt_number} después de {retry_state.outcome.exception()}"
-        )
+        before_sleep=_before_retry_sleep,
     )
 
+# Cliente HTTP compartido: reutiliza conexiones (keep-alive) entre llamadas a otros servicios
+_http_client: Optional[httpx.AsyncClient] = None
+
+
+async def _propagate_trace(request: httpx.Request):
+    # Sin instrumentación httpx (TRACING_EXPORTER=none) el traceparent se agrega acá
+    request.headers.update(inject_headers())
+
+
+def get_http_client() -> httpx.AsyncClient:
+    """Cliente httpx del proceso, creado en el primer uso"""
+    global _http_client
+    if _http_client is None or _http_client.is_closed:
+        _http_client = httpx.AsyncClient(
+            timeout=5.0,
+            limits=httpx.Limits(max_connections=100, max_keepalive_connections=20),
+            event_hooks={} if TRACING_ENABLED else {"request": [_propagate_trace]},
+        )
+    return _http_client
+
+
+def reset_connections():
+    """Después de un fork: no reutilizar los sockets de Redis ni el cliente httpx del proceso padre"""
+    global _http_client
+    redis_client.connection_pool.reset()
+    _http_client = None
+
+
+async def close_http_client():
+    global _http_client
+    if _http_client is not None:
+        await _http_client.aclose()
+        _http_client = None
+
+
 @circuit_breaker
 @retry_with_backoff(max_attempts=3)
 async def call_external_service(url: str, method: str = "GET", **kwargs) -> dict:
     """
     Realiza llamadas HTTP con patrones Circuit Breaker y Retry.
     """
+    service = httpx.URL(url).host
+    outcome = "error"
+    start = time.perf_counter()
     try:
-        async with httpx.AsyncClient(timeout=5.0) as client:
-            logger.info(f"Llamando {method} {url} con circuit breaker")
-            response = await getattr(client, method.lower())(url, **kwargs)
-            response.raise_for_status()
-            return response.json()
+        client = get_http_client()
+        logger.debug("Llamando %s %s con circuit breaker", method, url, extra={"event": "external_call"})
+        response = await getattr(client, method.lower())(url, **kwargs)
+        response.raise_for_status()
+        outcome = "ok"
+        return response.json()
     except httpx.HTTPStatusError as e:
         logger.error(f"Error HTTP {e.response.status_code} llamando {url}: {e}")
         raise
     except httpx.RequestError as e:
         logger.error(f"Error de request llamando {url}: {e}")
         raise
+    finally:
+        elapsed = time.perf_counter() - start
+        EXTERNAL_CALL_DURATION.labels(service, outcome).observe(elapsed)
+        add_phase("external", elapsed)
+
+
+
+# Load shedding: un 503 inmediato es más barato que encolar requests hasta el timeout del gateway
+LOAD_SHEDDING_ENABLED = os.getenv("LOAD_SHEDDING_ENABLED", "true").lower() == "true"
+LOAD_SHED_RETRY_AFTER = int(os.getenv("LOAD_SHED_RETRY_AFTER", "1"))
+
+
+class AdaptiveConcurrencyLimiter:
+    """
+    Límite de concurrencia AIMD sobre la latencia observada.
+    Sube +1 por cada "límite" de requests rápidos (solo si el límite se está usando) y baja
+    multiplicativamente, a lo sumo una vez por latency_target, si un request tarda más que el
+    objetivo o falla. Corre en el event loop: no necesita locks.
+    """
+    
+    def __init__(self, name: str, initial: int, min_limit: int, max_limit: int, latency_target: float, backoff: float = 0.9):
+        self.name = name
+        self.limit = float(initial)
+        self.min_limit = max(min_limit, 1)
+        self.max_limit = max_limit
+        self.latency_target = latency_target
+        self.backoff = backoff
+        self.in_flight = 0
+        self._last_decrease = 0.0
+    
+    def publish(self):
+        """Límite y requests en curso en /metrics (los gauges por worker se publican desde el startup)"""
+        CONCURRENCY_LIMIT.labels(self.name).set(int(self.limit))
+        CONCURRENCY_IN_FLIGHT.labels(self.name).set(self.in_flight)
+    
+    @classmethod
+    def from_env(cls, name: str, initial: int, min_limit: int, max_limit: int, latency_target: float):
+        """Defaults sobreescribibles con CONCURRENCY_<NAME>_INITIAL / _MIN / _MAX / _LATENCY_TARGET"""
+        prefix = f"CONCURRENCY_{name.upper()}_"
+        return cls(
+            name,
+            int(os.getenv(f"{prefix}INITIAL", initial)),
+            int(os.getenv(f"{prefix}MIN", min_limit)),
+            int(os.getenv(f"{prefix}MAX", max_limit)),
+            float(os.getenv(f"{prefix}LATENCY_TARGET", latency_target)),
+        )
+    
+    def has_capacity(self) -> bool:
+        return self.in_flight < int(self.limit)
+    
+    def acquire(self):
+        self.in_flight += 1
+        CONCURRENCY_IN_FLIGHT.labels(self.name).set(self.in_flight)
+    
+    def release(self, latency: float, failed: bool):
+        in_use = self.in_flight
+        self.in_flight -= 1
+        CONCURRENCY_IN_FLIGHT.labels(self.name).set(self.in_flight)
+        now = time.monotonic()
+        if failed or latency > self.latency_target:
+            if now - self._last_decrease >= self.latency_target:
+                self.limit = max(self.min_limit, self.limit * self.backoff)
+                self._last_decrease = now
+        elif in_use >= self.limit / 2:
+            self.limit = min(self.max_limit, self.limit + 1 / self.limit)
+        CONCURRENCY_LIMIT.labels(self.name).set(int(self.limit))
+
+
+class LoadShedder:
+    """
+    Limitadores por clase de ruta. Health checks y /metrics no pasan por acá; las escrituras
+    tienen su propio límite y además ceden a las lecturas: si las lecturas están al límite, se rechazan.
+    """
+    
+    def __init__(self):
+        self.read = AdaptiveConcurrencyLimiter.from_env("read", initial=20, min_limit=2, max_limit=200, latency_target=0.5)
+        self.write = AdaptiveConcurrencyLimiter.from_env("write", initial=10, min_limit=1, max_limit=100, latency_target=1.0)
+    
+    def publish_metrics(self):
+        self.read.publish()
+        self.write.publish()
+    
+    @staticmethod
+    def route_class(method: str) -> str:
+        return "read" if method in ("GET", "HEAD", "OPTIONS") else "write"
+    
+    def try_acquire(self, route_class: str) -> Optional[AdaptiveConcurrencyLimiter]:
+        """Limitador adquirido, o None si el request se debe rechazar"""
+        limiter = self.read if route_class == "read" else self.write
+        if not limiter.has_capacity() or (limiter is self.write and not self.read.has_capacity()):
+            CONCURRENCY_REJECTED.labels(route_class).inc()
+            return None
+        limiter.acquire()
+        return limiter
+
+# Memo por request (lo inicializa un middleware): la misma clave se resuelve una sola vez por request
+request_memo: ContextVar[Optional[dict]] = ContextVar("request_memo", default=None)
+
+
+class BatchLoader:
+    """
+    Request coalescing estilo DataLoader para lookups a otros servicios.
+    Los load(id) pedidos durante el mismo tick del event loop (por requests concurrentes) se envían
+    como una sola llamada al endpoint multi-get (?ids=) y cada waiter recibe su fila.
+    """
+    
+    def __init__(self, name: str, batch_url: str, max_batch_size: int = 100):
+        self.name = name
+        self.batch_url = batch_url
+        self.max_batch_size = max_batch_size
+        self._pending: dict[int, list[asyncio.Future]] = {}
+        self._scheduled = False
+        # El loop solo guarda referencias débiles a las tasks: sin esto un dispatch en vuelo puede ser recolectado
+        self._dispatches: set[asyncio.Task] = set()
+    
+    async def load(self, key: int) -> dict:
+        """Fila con id=key; LookupError si no existe"""
+        # Una key inválida no entra al batch: haría fallar el multi-get (?ids=) de todos los waiters
+        if not isinstance(key, int) or isinstance(key, bool):
+            raise TypeError(f"BatchLoader {self.name}: key inválida {key!r}")
+        memo = request_memo.get()
+        memo_key = (self.name, key)
+        if memo is not None and memo_key in memo:
+            return await memo[memo_key]
+        
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        self._pending.setdefault(key, []).append(future)
+        if not self._scheduled:
+            # Despachar cuando terminen los callbacks ya listos del loop (fin del tick)
+            self._scheduled = True
+            loop.call_soon(self._start_dispatch)
+        if memo is not None:
+            memo[memo_key] = future
+        return await future
+    
+    def _start_dispatch(self):
+        pending, self._pending, self._scheduled = self._pending, {}, False
+        task = asyncio.ensure_future(self._dispatch(pending))
+        self._dispatches.add(task)
+        task.add_done_callback(lambda done: self._dispatch_done(done, pending))
+    
+    def _dispatch_done(self, task: asyncio.Task, pending: dict[int, list[asyncio.Future]]):
+        """Si el dispatch falló o se canceló, ningún waiter queda colgado"""
+        self._dispatches.discard(task)
+        if not task.cancelled() and task.exception() is None:
+            return
+        if not task.cancelled():
+            logger.error(f"BatchLoader {self.name}: falló el dispatch: {task.exception()}")
+        for futures in pending.values():
+            for future in futures:
+                if future.done():
+                    continue
+                if task.cancelled():
+                    future.cancel()
+                else:
+                    future.set_exception(task.exception())
+    
+    async def _dispatch(self, pending: dict[int, list[asyncio.Future]]):
+        keys = list(pending)
+        chunks = [keys[i:i + self.max_batch_size] for i in range(0, len(keys), self.max_batch_size)]
+        await asyncio.gather(*(self._load_chunk(chunk, pending) for chunk in chunks))
+    
+    async def _load_chunk(self, chunk: list[int], pending: dict[int, list[asyncio.Future]]):
+        BATCH_LOADER_BATCH_SIZE.labels(self.name).observe(len(chunk))
+        try:
+            rows = await call_external_service(self.batch_url, params={"ids": ",".join(map(str, chunk))})
+            by_id = {row["id"]: row for row in rows}
+            logger.debug("BatchLoader %s: %d ids en una llamada", self.name, len(chunk), extra={"event": "batch_load"})
+        except Exception as e:
+            for key in chunk:
+                for future in pending[key]:
+                    if not future.done():
+                        future.set_exception(e)
+            return
+        for key in chunk:
+            for future in pending[key]:
+                if future.done():
+                    continue
+                if key in by_id:
+                    future.set_result(by_id[key])
+                else:
+                    future.set_exception(LookupError(f"{self.name} {key} no existe"))
+
+
+def make_etag(body: bytes) -> str:
+    """ETag fuerte derivado del hash del payload serializado"""
+    return f'"{hashlib.blake2b(body, digest_size=16).hexdigest()}"'
+
+
+def etag_matches(if_none_match: Optional[str], etag: Optional[str]) -> bool:
+    """Comparación débil de If-None-Match contra el ETag actual (RFC 9110)"""
+    if not if_none_match or not etag:
+        return False
+    if if_none_match.strip() == "*":
+        return True
+    candidates = [c.strip().removeprefix("W/") for c in if_none_match.split(",")]
+    return etag.removeprefix("W/") in candidates
+
+
+def cache_headers(etag: Optional[str] = None) -> dict:
+    """
+    Headers HTTP para respuestas GET cacheables.
+    El gateway (proxy_cache) usa Cache-Control para el micro-cache y ETag para revalidar.
+    """
+    headers = {
+        "Cache-Control": f"public, max-age={HTTP_CACHE_MAX_AGE}, stale-while-revalidate={HTTP_CACHE_STALE_SECONDS}"
+    }
+    if etag:
+        headers["ETag"] = etag
+    return headers
+
+
+async def refresh_gateway_cache(*paths: str):
+    """
+    Refrescar entradas del micro-cache del gateway luego de una escritura.
+    Un GET con X-Cache-Refresh (con el token compartido con el gateway) saltea el proxy_cache y reemplaza la
+    entrada guardada. Los listados con query string (filtros, ?ids=) no se guardan en el gateway, así que
+    alcanza con las rutas sin filtros.
+    """
+    if not GATEWAY_URL or not CACHE_REFRESH_TOKEN:
+        return
+    try:
+        client = get_http_client()
+        for path in paths:
+            await client.get(f"{GATEWAY_URL}{path}", headers={"X-Cache-Refresh": CACHE_REFRESH_TOKEN}, timeout=2.0)
+        logger.info(f"Gateway cache REFRESH: {', '.join(paths)}")
+    except httpx.HTTPError as e:
+        logger.warning(f"No se pudo refrescar cache del gateway: {e}")
+
+
+# Formato de las entradas de cache: [versión][codec][compresión] + payload
+CACHE_FORMAT_VERSION = 1
+COMPRESSION_NONE = 0
+COMPRESSION_ZSTD = 1
+CACHE_COMPRESS_THRESHOLD = int(os.getenv("CACHE_COMPRESS_THRESHOLD", "1024"))
+# Codec de las entradas nuevas: "json" (un hit se sirve sin deserializar) o "msgpack" (menos memoria en Redis)
+CACHE_CODEC = os.getenv("CACHE_CODEC", "json")
+
+
+class JsonCodec:
+    """
+    Codec JSON (orjson).
+    El payload decodificado ya es el body HTTP, por lo que un hit se envía sin deserializar.
+    """
+    codec_id = 1
+    name = "json"
+    
+    def encode(self, value: Any) -> bytes:
+        return orjson.dumps(value, default=str)
+    
+    def decode(self, data: bytes) -> Any:
+        return orjson.loads(data)
+
+
+class MsgpackCodec:
+    """
+    Codec msgpack compacto.
+    Las listas de dicts con las mismas keys se guardan como header + filas,
+    así nombres de campo como assignee_user_id no se repiten en cada item.
+    """
+    codec_id = 2
+    name = "msgpack"
+    
+    def encode(self, value: Any) -> bytes:
+        if (
+            isinstance(value, list) and value and isinstance(value[0], dict)
+            and all(isinstance(item, dict) and item.keys() == value[0].keys() for item in value)
+        ):
+            columns = list(value[0].keys())
+            value = {"__columns__": columns, "__rows__": [[item[c] for c in columns] for item in value]}
+        return msgpack.packb(value, default=str)
+    
+    def decode(self, data: bytes) -> Any:
+        value = msgpack.unpackb(data)
+        if isinstance(value, dict) and "__columns__" in value:
+            columns = value["__columns__"]
+            return [dict(zip(columns, row)) for row in value["__rows__"]]
+        return value
+
+
+CACHE_CODECS = {codec.codec_id: codec for codec in (JsonCodec(), MsgpackCodec())}
+
+
+def codec_by_name(name: str):
+    """Codec configurado por nombre (CACHE_CODEC); las entradas ya guardadas se leen con el codec de su header"""
+    for codec in CACHE_CODECS.values():
+        if codec.name == name:
+            return codec
+    raise ValueError(f"CACHE_CODEC desconocido: {name} (opciones: {', '.join(c.name for c in CACHE_CODECS.values())})")
 
 
 class CacheAside:
@@ -71,50 +443,183 @@ class CacheAside:
     Implementación del patrón Cache-Aside.
     """
     
-    def __init__(self, prefix: str = "cache", ttl: int = 300):
+    def __init__(
+        self,
+        prefix: str = "cache",
+        ttl: int = 300,
+        codec: Optional[Any] = None,
+        compress_threshold: int = CACHE_COMPRESS_THRESHOLD,
+    ):
         self.prefix = prefix
         self.ttl = ttl  # Tiempo de vida en segundos (default 5 minutos)
+        self.codec = codec or codec_by_name(CACHE_CODEC)
+        self.compress_threshold = compress_threshold  # Payloads más grandes se comprimen con zstd
     
     def _make_key(self, key: str) -> str:
         return f"{self.prefix}:{key}"
     
+    def _pack(self, value: Any) -> tuple[bytes, str]:
+        """Codificar, comprimir si supera el umbral y anteponer el header de formato"""
+        payload = self.codec.encode(value)
+        etag = make_etag(payload)
+        compression = COMPRESSION_NONE
+        if len(payload) >= self.compress_threshold:
+            payload = zstandard.compress(payload)
+            compression = COMPRESSION_ZSTD
+        header = bytes((CACHE_FORMAT_VERSION, self.codec.codec_id, compression))
+        return header + payload, etag
+    
+    def _unpack(self, data: bytes) -> tuple[Any, bytes]:
+        """Leer el header de formato y descomprimir; retorna (codec, payload)"""
+        version, codec_id, compression = data[0], data[1], data[2]
+        if version != CACHE_FORMAT_VERSION or codec_id not in CACHE_CODECS:
+            raise ValueError(f"Formato de cache desconocido: versión {version}, codec {codec_id}")
+        payload = data[3:]
+        if compression == COMPRESSION_ZSTD:
+            payload = zstandard.decompress(payload)
+        return CACHE_CODECS[codec_id], payload
+    
     def get(self, key: str) -> Optional[Any]:
         """Obtener valor desde cache"""
+        value, _ = self.get_with_etag(key)
+        return value
+    
+    @timed(REDIS_OPERATION_DURATION, "cache_get", phase="cache")
+    def get_with_etag(self, key: str) -> tuple[Optional[Any], Optional[str]]:
+        """Obtener valor y ETag desde cache en un solo round trip"""
         try:
-            cached = redis_client.get(self._make_key(key))
+            cached, etag = redis_client.hmget(self._make_key(key), "body", "etag")
             if cached:
-                logger.info(f"Cache HIT: {key}")
-                return json.loads(cached)
-            logger.info(f"Cache MISS: {key}")
-            return None
+                codec, payload = self._unpack(cached)
+                CACHE_REQUESTS.labels(self.prefix, "hit").inc()
+                logger.debug("Cache HIT: %s", key, extra={"event": "cache_hit"})
+                return codec.decode(payload), etag.decode()
+            CACHE_REQUESTS.labels(self.prefix, "miss").inc()
+            logger.debug("Cache MISS: %s", key, extra={"event": "cache_miss"})
+            return None, None
+        except Exception as e:
+            CACHE_REQUESTS.labels(self.prefix, "error").inc()
+            logger.error(f"Error al obtener de cache: {e}")
+            return None, None
+    
+    @timed(REDIS_OPERATION_DURATION, "cache_get", phase="cache")
+    def get_raw_with_etag(self, key: str) -> tuple[Optional[bytes], Optional[str]]:
+        """
+        Obtener el JSON ya serializado y su ETag, sin deserializar.
+        Permite responder un cache hit enviando el body tal cual fue guardado
+        (con codecs no JSON se convierte, pero igual se evita la validación Pydantic).
+        """
+        try:
+            cached, etag = redis_client.hmget(self._make_key(key), "body", "etag")
+            if cached:
+                codec, payload = self._unpack(cached)
+                if codec.codec_id != JsonCodec.codec_id:
+                    payload = orjson.dumps(codec.decode(payload), default=str)
+                CACHE_REQUESTS.labels(self.prefix, "hit").inc()
+                logger.debug("Cache HIT: %s", key, extra={"event": "cache_hit"})
+                return payload, etag.decode()
+            CACHE_REQUESTS.labels(self.prefix, "miss").inc()
+            logger.debug("Cache MISS: %s", key, extra={"event": "cache_miss"})
+            return None, None
         except Exception as e:
+            CACHE_REQUESTS.labels(self.prefix, "error").inc()
             logger.error(f"Error al obtener de cache: {e}")
+            return None, None
+    
+    @timed(REDIS_OPERATION_DURATION, "cache_get_etag", phase="cache")
+    def get_etag(self, key: str) -> Optional[str]:
+        """Obtener solo el ETag (para responder 304 sin leer ni deserializar el body)"""
+        try:
+            etag = redis_client.hget(self._make_key(key), "etag")
+            return etag.decode() if etag else None
+        except Exception as e:
+            logger.error(f"Error al obtener ETag de cache: {e}")
             return None
     
-    def set(self, key: str, value: Any) -> bool:
-        """Establecer valor en cache con TTL"""
+    @timed(REDIS_OPERATION_DURATION, "cache_set", phase="cache")
+    def set(self, key: str, value: Any) -> Optional[str]:
+        """
+        Establecer valor en cache con TTL.
+        El ETag se guarda junto al body (hash de Redis) y se retorna para usarlo en la respuesta.
+        """
         try:
-            redis_client.setex(
-                self._make_key(key),
-                self.ttl,
-                json.dumps(value, default=str)
-            )
-            logger.info(f"Cache SET: {key} (TTL: {self.ttl}s)")
-            return True
+            body, etag = self._pack(value)
+            redis_key = self._make_key(key)
+            pipe = redis_client.pipeline()
+            pipe.delete(redis_key)
+            pipe.hset(redis_key, mapping={"body": body, "etag": etag})
+            pipe.expire(redis_key, self.ttl)
+            pipe.execute()
+            CACHE_SET_BYTES.labels(self.prefix).observe(len(body))
+            logger.debug("Cache SET: %s (%d bytes, TTL: %ss)", key, len(body), self.ttl, extra={"event": "cache_set"})
+            return etag
         except Exception as e:
             logger.error(f"Error al establecer en cache: {e}")
-            return False
+            return None
     
+    @timed(REDIS_OPERATION_DURATION, "cache_mget", phase="cache")
+    def get_many_raw(self, keys: list[str]) -> dict[str, bytes]:
+        """
+        JSON ya serializado de varias entradas en un solo round trip.
+        Las entradas son hashes (body + etag), por eso se usa un pipeline de HGET en lugar de MGET.
+        Retorna solo los hits; una entrada ilegible cuenta como miss.
+        """
+        try:
+            pipe = redis_client.pipeline(transaction=False)
+            for key in keys:
+                pipe.hget(self._make_key(key), "body")
+            results = pipe.execute()
+        except Exception as e:
+            CACHE_REQUESTS.labels(self.prefix, "error").inc()
+            logger.error(f"Error al obtener de cache: {e}")
+            return {}
+        
+        found = {}
+        for key, cached in zip(keys, results):
+            if not cached:
+                continue
+            try:
+                codec, payload = self._unpack(cached)
+                if codec.codec_id != JsonCodec.codec_id:
+                    payload = orjson.dumps(codec.decode(payload), default=str)
+                found[key] = payload
+            except Exception as e:
+                logger.warning(f"Entrada de cache ilegible {key}: {e}")
+        CACHE_REQUESTS.labels(self.prefix, "hit").inc(len(found))
+        CACHE_REQUESTS.labels(self.prefix, "miss").inc(len(keys) - len(found))
+        logger.debug("Cache MGET: %d/%d hits", len(found), len(keys), extra={"event": "cache_mget"})
+        return found
+    
+    @timed(REDIS_OPERATION_DURATION, "cache_mset", phase="cache")
+    def set_many(self, items: dict[str, Any]):
+        """Backfill de varias entradas con un solo pipeline"""
+        if not items:
+            return
+        try:
+            pipe = redis_client.pipeline(transaction=False)
+            for key, value in items.items():
+                body, etag = self._pack(value)
+                redis_key = self._make_key(key)
+                pipe.delete(redis_key)
+                pipe.hset(redis_key, mapping={"body": body, "etag": etag})
+                pipe.expire(redis_key, self.ttl)
+            pipe.execute()
+            logger.debug("Cache SET: %d entradas (TTL: %ss)", len(items), self.ttl, extra={"event": "cache_set"})
+        except Exception as e:
+            logger.error(f"Error al establecer en cache: {e}")
+    
+    @timed(REDIS_OPERATION_DURATION, "cache_delete", phase="cache")
     def delete(self, key: str) -> bool:
         """Eliminar valor del cache"""
         try:
             redis_client.delete(self._make_key(key))
-            logger.info(f"Cache DELETE: {key}")
+            logger.debug("Cache DELETE: %s", key, extra={"event": "cache_delete"})
             return True
         except Exception as e:
             logger.error(f"Error al eliminar de cache: {e}")
             return False
     
+    @timed(REDIS_OPERATION_DURATION, "cache_invalidate", phase="cache")
     def invalidate_pattern(self, pattern: str):
         """Invalidar todas las keys que coincidan con el patrón"""
         try:
@@ -155,15 +660,22 @@ def cached(cache_key_func: Callable, ttl: int = 300):
         return wrapper
     return decorator
 
+
+# Rate limiting por IP a nivel de aplicación (subir para load tests contra los puertos directos)
+RATE_LIMIT_MAX_REQUESTS = int(os.getenv("RATE_LIMIT_MAX_REQUESTS", "100"))
+RATE_LIMIT_WINDOW_SECONDS = int(os.getenv("RATE_LIMIT_WINDOW_SECONDS", "60"))
+
+
 class RateLimiter:
     """
     Rate limiting a nivel de aplicación usando Redis.
     """
     
-    def __init__(self, max_requests: int = 100, window_seconds: int = 60):
+    def __init__(self, max_requests: int = RATE_LIMIT_MAX_REQUESTS, window_seconds: int = RATE_LIMIT_WINDOW_SECONDS):
         self.max_requests = max_requests
         self.window_seconds = window_seconds
     
+    @timed(REDIS_OPERATION_DURATION, "rate_limit", phase="ratelimit")
     def is_allowed(self, identifier: str) -> bool:
         """
         Verifica si el request está permitido para el identificador dado (ej: user_id, IP)
@@ -188,14 +700,111 @@ class RateLimiter:
             request_count = results[1]
             
             if request_count >= self.max_requests:
+                RATE_LIMIT_DECISIONS.labels("rejected").inc()
                 logger.warning(f"Límite de rate excedido para {identifier}: {request_count}/{self.max_requests}")
                 return False
             
+            RATE_LIMIT_DECISIONS.labels("allowed").inc()
             return True
         except Exception as e:
+            RATE_LIMIT_DECISIONS.labels("error").inc()
             logger.error(f"Error en rate limiter: {e}")
             return True
 
+# Multi-get: tope de IDs por request (?ids=1,2,3)
+MAX_BATCH_IDS = int(os.getenv("MAX_BATCH_IDS", "1000"))
+
+
+def parse_ids(ids: str) -> list[int]:
+    """Parsear "1,2,3" a una lista de IDs sin duplicados, respetando el orden"""
+    parsed = list(dict.fromkeys(int(i) for i in ids.split(",") if i.strip()))
+    if len(parsed) > MAX_BATCH_IDS:
+        raise ValueError(f"máximo {MAX_BATCH_IDS} ids por request")
+    return parsed
+
+
+# Idempotency-Key: ventana de replay y tiempo máximo que un request puede retener la key
+IDEMPOTENCY_KEY_TTL = int(os.getenv("IDEMPOTENCY_KEY_TTL", "86400"))
+IDEMPOTENCY_LOCK_SECONDS = int(os.getenv("IDEMPOTENCY_LOCK_SECONDS", "30"))
+
+
+class IdempotencyStore:
+    """
+    Respuestas de POST indexadas por Idempotency-Key en Redis.
+    Guarda el fingerprint del request junto con status y body; un lock (SET NX) hace que
+    los duplicados concurrentes esperen la respuesta del primero en lugar de re-ejecutar la escritura.
+    """
+    
+    def __init__(self, prefix: str, ttl: int = IDEMPOTENCY_KEY_TTL, lock_seconds: int = IDEMPOTENCY_LOCK_SECONDS):
+        self.prefix = prefix
+        self.ttl = ttl
+        self.lock_seconds = lock_seconds
+    
+    def _key(self, key: str) -> str:
+        return f"idempotency:{self.prefix}:{key}"
+    
+    @staticmethod
+    def scoped_key(key: str, authorization: Optional[str]) -> str:
+        """
+        Idempotency-Key con la identidad del caller (hash del header Authorization): la misma key enviada por
+        otro cliente no recibe su respuesta. Los requests sin Authorization comparten el namespace "anon".
+        """
+        caller = hashlib.sha256(authorization.encode()).hexdigest()[:16] if authorization else "anon"
+        return f"{caller}:{key}"
+    
+    @staticmethod
+    def fingerprint(method: str, path: str, body: bytes) -> str:
+        return hashlib.sha256(method.encode() + b" " + path.encode() + b"\n" + body).hexdigest()
+    
+    @timed(REDIS_OPERATION_DURATION, "idempotency_get", phase="idempotency")
+    def get(self, key: str) -> Optional[dict]:
+        """Respuesta guardada para la key, o None"""
+        stored = redis_client.hgetall(self._key(key))
+        if not stored:
+            return None
+        return {
+            "fingerprint": stored[b"fingerprint"].decode(),
+            "status_code": int(stored[b"status_code"]),
+            "media_type": stored[b"media_type"].decode(),
+            "body": stored[b"body"],
+        }
+    
+    @timed(REDIS_OPERATION_DURATION, "idempotency_acquire", phase="idempotency")
+    def acquire(self, key: str) -> bool:
+        """Tomar la key para ejecutar el request; False si otro request igual está en curso"""
+        return bool(redis_client.set(f"{self._key(key)}:lock", 1, nx=True, ex=self.lock_seconds))
+    
+    @timed(REDIS_OPERATION_DURATION, "idempotency_release", phase="idempotency")
+    def release(self, key: str):
+        """Liberar la key sin guardar respuesta (el request falló y puede reintentarse)"""
+        redis_client.delete(f"{self._key(key)}:lock")
+    
+    @timed(REDIS_OPERATION_DURATION, "idempotency_save", phase="idempotency")
+    def save(self, key: str, fingerprint: str, status_code: int, media_type: str, body: bytes):
+        pipe = redis_client.pipeline()
+        pipe.hset(self._key(key), mapping={
+            "fingerprint": fingerprint,
+            "status_code": status_code,
+            "media_type": media_type,
+            "body": body,
+        })
+        pipe.expire(self._key(key), self.ttl)
+        pipe.delete(f"{self._key(key)}:lock")
+        pipe.execute()
+    
+    async def wait(self, key: str, poll_interval: float = 0.05) -> Optional[dict]:
+        """Esperar la respuesta del request que tiene la key; None si liberó sin guardar o venció el lock"""
+        deadline = time.monotonic() + self.lock_seconds
+        while time.monotonic() < deadline:
+            stored = self.get(key)
+            if stored is not None:
+                return stored
+            if not redis_client.exists(f"{self._key(key)}:lock"):
+                return self.get(key)
+            await asyncio.sleep(poll_interval)
+        return None
+
+
 
 def check_redis_health() -> dict:
     """Verificar conectividad a Redis"""
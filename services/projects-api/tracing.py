@@ -0,0 +1,127 @@
+"""
+Trazas distribuidas (OpenTelemetry): gateway -> servicio -> otros servicios / base / Redis / RabbitMQ.
+El contexto viaja en el header W3C traceparent, tanto en HTTP como en los headers de los mensajes AMQP.
+
+Exporters (TRACING_EXPORTER):
+- none:    sin exportar (default) y sin instrumentación: solo se propaga el contexto. El traceparent del
+           request se adjunta al contexto (TraceContextMiddleware) y los spans no se graban (ALWAYS_OFF),
+           así que los logs llevan el trace_id y este sigue hacia otros servicios y RabbitMQ sin costo de spans
+- otlp:    OTLP/HTTP a OTEL_EXPORTER_OTLP_ENDPOINT (collector, Jaeger, Tempo...)
+- file:    una línea JSON por span en TRACING_FILE
+- console: spans a stdout
+"""
+import os
+import json
+import logging
+from typing import Optional, Sequence
+from opentelemetry import context, trace, propagate
+from opentelemetry.baggage.propagation import W3CBaggagePropagator
+from opentelemetry.propagators.composite import CompositePropagator
+from opentelemetry.trace.propagation.tracecontext import TraceContextTextMapPropagator
+from opentelemetry.sdk.resources import Resource
+from opentelemetry.sdk.trace import TracerProvider
+from opentelemetry.sdk.trace.export import BatchSpanProcessor, ConsoleSpanExporter, SpanExporter, SpanExportResult
+from opentelemetry.sdk.trace.sampling import ALWAYS_OFF, ParentBasedTraceIdRatio
+
+logger = logging.getLogger(__name__)
+
+TRACING_EXPORTER = os.getenv("TRACING_EXPORTER", "none").lower()
+# Con exporter se instrumenta todo; sin exporter solo se propaga el contexto
+TRACING_ENABLED = TRACING_EXPORTER != "none"
+TRACING_FILE = os.getenv("TRACING_FILE", "/tmp/traces.jsonl")
+# Fracción de trazas nuevas que se muestrean; si el gateway / caller ya decidió, se respeta su decisión
+TRACING_SAMPLE_RATIO = float(os.getenv("TRACING_SAMPLE_RATIO", "1.0"))
+# Rutas sin span de servidor (alta frecuencia, sin valor diagnóstico)
+TRACING_EXCLUDED_URLS = os.getenv("TRACING_EXCLUDED_URLS", "health,healthz,metrics")
+
+
+class FileSpanExporter(SpanExporter):
+    """Una línea JSON por span, para inspeccionar trazas sin collector"""
+
+    def __init__(self, path: str):
+        self._file = open(path, "a", buffering=1)
+
+    def export(self, spans) -> SpanExportResult:
+        for span in spans:
+            self._file.write(json.dumps(json.loads(span.to_json()), separators=(",", ":")) + "\n")
+        return SpanExportResult.SUCCESS
+
+    def shutdown(self):
+        self._file.close()
+
+
+def _create_exporter() -> Optional[SpanExporter]:
+    if TRACING_EXPORTER == "otlp":
+        from opentelemetry.exporter.otlp.proto.http.trace_exporter import OTLPSpanExporter
+        return OTLPSpanExporter()
+    if TRACING_EXPORTER == "file":
+        return FileSpanExporter(TRACING_FILE)
+    if TRACING_EXPORTER == "console":
+        return ConsoleSpanExporter()
+    return None
+
+
+class TraceContextMiddleware:
+    """
+    Middleware ASGI para el modo sin instrumentación: adjunta el contexto del traceparent recibido durante el
+    request (lo que haría FastAPIInstrumentor, pero sin crear spans)
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        carrier = {name.decode("latin-1"): value.decode("latin-1") for name, value in scope["headers"]}
+        token = context.attach(propagate.extract(carrier))
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            context.detach(token)
+
+
+def setup_tracing(service_name: str, app, engines: Sequence = ()):
+    """
+    Configurar el provider y auto-instrumentar FastAPI, httpx, SQLAlchemy y Redis.
+    Con TRACING_EXPORTER=none no se instrumenta nada: sampler ALWAYS_OFF (spans no grabados, que conservan el
+    trace_id del padre) y solo el middleware que extrae el traceparent de los requests.
+    """
+    propagate.set_global_textmap(CompositePropagator([TraceContextTextMapPropagator(), W3CBaggagePropagator()]))
+    resource = Resource.create({"service.name": service_name})
+    if not TRACING_ENABLED:
+        trace.set_tracer_provider(TracerProvider(resource=resource, sampler=ALWAYS_OFF))
+        # Como FastAPIInstrumentor: por fuera de todo el stack de middlewares, para que sus logs tengan trace_id
+        build_middleware_stack = app.build_middleware_stack
+        app.build_middleware_stack = lambda: TraceContextMiddleware(build_middleware_stack())
+        logger.info(f"Tracing sin exporter (TRACING_EXPORTER=none): {service_name} solo propaga contexto")
+        return
+
+    from opentelemetry.instrumentation.fastapi import FastAPIInstrumentor
+    from opentelemetry.instrumentation.httpx import HTTPXClientInstrumentor
+    from opentelemetry.instrumentation.sqlalchemy import SQLAlchemyInstrumentor
+    from opentelemetry.instrumentation.redis import RedisInstrumentor
+
+    provider = TracerProvider(resource=resource, sampler=ParentBasedTraceIdRatio(TRACING_SAMPLE_RATIO))
+    provider.add_span_processor(BatchSpanProcessor(_create_exporter()))
+    trace.set_tracer_provider(provider)
+
+    FastAPIInstrumentor.instrument_app(app, excluded_urls=TRACING_EXCLUDED_URLS)
+    # Clientes httpx (call_external_service): inyecta traceparent en las llamadas a otros servicios
+    HTTPXClientInstrumentor().instrument()
+    SQLAlchemyInstrumentor().instrument(engines=list(engines))
+    RedisInstrumentor().instrument()
+    logger.info(f"Tracing habilitado: {service_name} -> {TRACING_EXPORTER}")
+
+
+def inject_headers(headers: Optional[dict] = None) -> dict:
+    """Agregar el contexto de la traza actual (traceparent) a un dict de headers"""
+    headers = dict(headers or {})
+    propagate.inject(headers)
+    return headers
+
+
+def extract_context(headers: Optional[dict]):
+    """Contexto de traza recibido en headers (HTTP o AMQP)"""
+    return propagate.extract(headers or {})
@@ -1,54 +1,214 @@
 
 import os
+import asyncio
+import time
 import logging
-from fastapi import FastAPI, HTTPException, Request
-from fastapi.responses import JSONResponse
-from sqlalchemy import text
+from datetime import datetime
+from typing import Optional
+from fastapi import FastAPI, HTTPException, Request, Response, BackgroundTasks, Header, Query
+from fastapi.responses import JSONResponse, ORJSONResponse
+from sqlalchemy import text, update
+from anyio import from_thread
 from pybreaker import CircuitBreakerError
-from db import Base, engine, session_scope, init_schema
-from models import Task, TaskActivity
-from schemas import TaskCreate, TaskOut
-from patterns import CacheAside, RateLimiter, check_redis_health, call_external_service
-from messaging import AsyncTaskProcessor, check_rabbitmq_health
+from db import (
+    engine, session_scope, pool_stats, start_liveness_check, query_stats, read_engines, dispose_engines,
+    new_query_stats, repeated_statements, server_timing,
+    check_replicas_health, db_route, READ_YOUR_WRITES_COOKIE, READ_YOUR_WRITES_SECONDS,
+)
+from models import Task, TaskActivity, TaskView
+from schemas import TaskCreate, TaskOut, TaskActivityOut, TaskExpandedOut, ProjectRef, UserRef
+from patterns import CacheAside, RateLimiter, cache_headers, etag_matches, refresh_gateway_cache, check_redis_health, call_external_service, IdempotencyStore, BatchLoader, request_memo, close_http_client, LoadShedder, publish_breaker_state, LOAD_SHEDDING_ENABLED, LOAD_SHED_RETRY_AFTER, reset_connections
+from messaging import AsyncTaskProcessor, check_rabbitmq_health, desired_workers
+from tracing import setup_tracing
+from logging_config import setup_logging, restart_listener
+from timing import request_timings, format_server_timing, start_profiler, save_profile, ProfiledRoute, SERVER_TIMING_ENABLED
+from metrics import (
+    HTTP_REQUESTS, HTTP_REQUEST_DURATION, HTTP_IN_FLIGHT, DB_TIME_PER_REQUEST, DB_QUERIES_PER_REQUEST, DB_REPEATED_STATEMENTS,
+    IDEMPOTENCY_REQUESTS, route_label, observe_pool, render_metrics,
+)
+from partitions import start_partition_maintenance
 
-logging.basicConfig(level=logging.INFO)
+setup_logging("tasks-api")
 logger = logging.getLogger(__name__)
 
-app = FastAPI(title="Tasks API")
+app = FastAPI(title="Tasks API", default_response_class=ORJSONResponse)
+# Los handlers sync se perfilan en el thread del threadpool donde corren (ver timing.py)
+app.router.route_class = ProfiledRoute
+setup_tracing("tasks-api", app, engines=[engine, *read_engines])
 
-init_schema()
-Base.metadata.create_all(bind=engine)
+# El schema y las tablas los crea el job de migraciones (alembic upgrade head), no el import
+
+# Métodos con label propia en las métricas (el resto se agrupa como OTHER)
+HTTP_METHODS = {"GET", "HEAD", "POST", "PUT", "PATCH", "DELETE", "OPTIONS"}
 
 # Inicializar patrones
 cache = CacheAside(prefix="tasks", ttl=300)
-rate_limiter = RateLimiter(max_requests=100, window_seconds=60)
+rate_limiter = RateLimiter()
+load_shedder = LoadShedder()
+idempotency = IdempotencyStore(prefix="tasks")
 task_processor = AsyncTaskProcessor("task_tasks")
 
 USERS_API_URL = os.getenv("USERS_API_URL", "http://users-api:8000")
 PROJECTS_API_URL = os.getenv("PROJECTS_API_URL", "http://projects-api:8000")
 
+# Lookups a otros servicios agrupados en llamadas multi-get (?ids=)
+users_loader = BatchLoader("users", f"{USERS_API_URL}/users")
+projects_loader = BatchLoader("projects", f"{PROJECTS_API_URL}/projects")
+
 # Registrar handlers de tareas asíncronas
 def handle_task_notification(data: dict):
     """Ejemplo de handler async para notificaciones de tarea"""
-    logger.info(f"Procesando notificación de tarea: {data}")
+    logger.debug("Procesando notificación de tarea: %s", data, extra={"event": "notification"})
 
 task_processor.register_handler("task_notification", handle_task_notification)
 
+# Read model task_view (CQRS): los eventos de users-api / projects-api llegan por el exchange de eventos
+def handle_user_notification(data: dict):
+    """Actualizar el nombre del asignado en task_view"""
+    if data.get("name") is None:
+        return
+    with session_scope(readonly=False) as s:
+        s.execute(
+            update(TaskView)
+            .where(TaskView.assignee_user_id == data["user_id"])
+            .values(assignee_name=data["name"])
+        )
+
+def handle_project_notification(data: dict):
+    """Actualizar el nombre del proyecto en task_view"""
+    if data.get("name") is None:
+        return
+    with session_scope(readonly=False) as s:
+        s.execute(
+            update(TaskView)
+            .where(TaskView.project_id == data["project_id"])
+            .values(project_name=data["name"])
+        )
+
+task_processor.register_handler("user_notification", handle_user_notification)
+task_processor.register_handler("project_notification", handle_project_notification)
+
+# Con gunicorn --preload la app se importa en el master y los workers heredan sus conexiones
+def reset_after_fork():
+    """
+    Llamado desde post_fork en cada worker: descartar el pool de la base, Redis, httpx y pika del master
+    y levantar el listener de logging (los threads no sobreviven al fork). Los threads de liveness,
+    particiones y monitor de cola arrancan en startup, que ya corre por worker.
+    """
+    dispose_engines()
+    reset_connections()
+    task_processor.queue.reset_connections()
+    restart_listener()
+
+
 @app.on_event("startup")
 async def startup_event():
     logger.info("Iniciando Tasks API con patrones arquitectónicos")
     logger.info("Queue-based load leveling listo ")
+    start_liveness_check()
+    # Gauges iniciales por worker (ver publish_breaker_state)
+    load_shedder.publish_metrics()
+    publish_breaker_state()
+    start_partition_maintenance()
+    # Consumidor de eventos que mantiene task_view
+    task_processor.start_worker()
+    task_processor.start_monitor()
 
 @app.on_event("shutdown")
 async def shutdown_event():
     logger.info("Deteniendo Tasks API")
     task_processor.stop_worker()
+    await close_http_client()
+
+# Middleware de ruteo de lecturas: GETs a réplica salvo escritura reciente del cliente
+@app.middleware("http")
+async def read_routing_middleware(request: Request, call_next):
+    sticky = READ_YOUR_WRITES_COOKIE in request.cookies
+    reading = request.method in ("GET", "HEAD") and not sticky
+    token = db_route.set("read" if reading else "write")
+    try:
+        response = await call_next(request)
+    finally:
+        db_route.reset(token)
+    # Read-your-writes: luego de escribir, el cliente lee del primario durante una ventana corta
+    if request.method not in ("GET", "HEAD") and response.status_code < 400:
+        response.set_cookie(READ_YOUR_WRITES_COOKIE, "1", max_age=READ_YOUR_WRITES_SECONDS, httponly=True)
+    return response
+
+# Middleware de Idempotency-Key: un POST reintentado devuelve la respuesta original sin re-ejecutar la escritura
+@app.middleware("http")
+async def idempotency_middleware(request: Request, call_next):
+    key = request.headers.get("idempotency-key")
+    if request.method != "POST" or not key:
+        return await call_next(request)
+    key = idempotency.scoped_key(key, request.headers.get("authorization"))
+    
+    fingerprint = idempotency.fingerprint(request.method, request.url.path, await request.body())
+    try:
+        stored = idempotency.get(key)
+        if stored is None and not idempotency.acquire(key):
+            # Un duplicado concurrente está en curso: esperar su respuesta
+            stored = await idempotency.wait(key)
+            if stored is None:
+                IDEMPOTENCY_REQUESTS.labels("in_progress").inc()
+                return JSONResponse(
+                    status_code=409,
+                    content={"detail": "Request con esta Idempotency-Key en curso"},
+                    headers={"Retry-After": "1"},
+                )
+    except Exception as e:
+        # Sin Redis no hay deduplicación, pero el request se atiende igual
+        logger.warning(f"Idempotency store no disponible: {e}")
+        return await call_next(request)
+    
+    if stored is not None:
+        if stored["fingerprint"] != fingerprint:
+            IDEMPOTENCY_REQUESTS.labels("mismatch").inc()
+            return JSONResponse(status_code=422, content={"detail": "Idempotency-Key reutilizada con otro request"})
+        IDEMPOTENCY_REQUESTS.labels("replayed").inc()
+        return Response(
+            content=stored["body"],
+            status_code=stored["status_code"],
+            media_type=stored["media_type"],
+            headers={"Idempotent-Replayed": "true"},
+        )
+    
+    IDEMPOTENCY_REQUESTS.labels("new").inc()
+    try:
+        response = await call_next(request)
+        body = b"".join([chunk async for chunk in response.body_iterator])
+    except Exception:
+        idempotency.release(key)
+        raise
+    # Los 5xx se pueden reintentar; el resto (incluidos los 4xx de validación) se guarda
+    try:
+        if response.status_code >= 500:
+            idempotency.release(key)
+        else:
+            media_type = response.headers.get("content-type", "application/json")
+            idempotency.save(key, fingerprint, response.status_code, media_type, body)
+    except Exception as e:
+        logger.warning(f"No se pudo guardar la respuesta idempotente: {e}")
+    
+    async def replay_body():
+        yield body
+    response.body_iterator = replay_body()
+    return response
+
+# Middleware de memo por request: lookups repetidos a otros servicios se resuelven una vez (BatchLoader)
+@app.middleware("http")
+async def request_memo_middleware(request: Request, call_next):
+    token = request_memo.set({})
+    try:
+        return await call_next(request)
+    finally:
+        request_memo.reset(token)
 
 # Middleware de rate limiting
 @app.middleware("http")
 async def rate_limit_middleware(request: Request, call_next):
     identifier = request.client.host
-    if request.url.path in ["/healthz", "/health"]:
+    if request.url.path in ["/healthz", "/health", "/metrics"]:
         return await call_next(request)
     if not rate_limiter.is_allowed(identifier):
         return JSONResponse(
@@ -57,6 +217,69 @@ async def rate_limit_middleware(request: Request, call_next):
         )
     return await call_next(request)
 
+# Middleware de load shedding: límite de concurrencia adaptativo por clase de ruta; en sobrecarga
+# responde 503 enseguida en lugar de acumular requests en el threadpool hasta el timeout del gateway
+@app.middleware("http")
+async def load_shedding_middleware(request: Request, call_next):
+    if not LOAD_SHEDDING_ENABLED or request.url.path in ["/healthz", "/health", "/metrics"]:
+        return await call_next(request)
+    limiter = load_shedder.try_acquire(load_shedder.route_class(request.method))
+    if limiter is None:
+        return JSONResponse(
+            status_code=503,
+            content={"detail": "Servicio sobrecargado. Intente nuevamente más tarde."},
+            headers={"Retry-After": str(LOAD_SHED_RETRY_AFTER)},
+        )
+    start = time.perf_counter()
+    failed = True
+    try:
+        response = await call_next(request)
+        # 503 propios (circuit breaker) son rápidos y no indican saturación de este servicio
+        failed = response.status_code >= 500 and response.status_code != 503
+        return response
+    finally:
+        limiter.release(time.perf_counter() - start, failed)
+
+# Middleware de métricas (el más externo): latencia y status por template de ruta + tiempo en la base
+# y por fase (header Server-Timing), statements repetidos en modo DB_QUERY_DEBUG y profiling opt-in
+@app.middleware("http")
+async def metrics_middleware(request: Request, call_next):
+    stats = new_query_stats()
+    stats_token = query_stats.set(stats)
+    timings = {}
+    timings_token = request_timings.set(timings)
+    method = request.method if request.method in HTTP_METHODS else "OTHER"
+    HTTP_IN_FLIGHT.inc()
+    profiler = start_profiler(request)
+    start = time.perf_counter()
+    status_code = 500
+    try:
+        response = await call_next(request)
+        status_code = response.status_code
+        if SERVER_TIMING_ENABLED:
+            response.headers.append(
+                "Server-Timing", f"{server_timing(stats)}, {format_server_timing(timings, time.perf_counter() - start)}"
+            )
+        if profiler is not None:
+            profile = await save_profile(profiler, method, route_label(request.scope))
+            if profile:
+                response.headers["X-Profile-File"] = profile
+        return response
+    finally:
+        if profiler is not None and profiler.is_running:
+            profiler.stop()
+        HTTP_IN_FLIGHT.dec()
+        route = route_label(request.scope)
+        HTTP_REQUEST_DURATION.labels(method, route).observe(time.perf_counter() - start)
+        HTTP_REQUESTS.labels(method, route, str(status_code)).inc()
+        DB_TIME_PER_REQUEST.labels(route).observe(stats["seconds"])
+        DB_QUERIES_PER_REQUEST.labels(route).observe(stats["count"])
+        for statement, count in repeated_statements(stats):
+            DB_REPEATED_STATEMENTS.labels(route).inc()
+            logger.warning("Posible N+1 en %s %s: %d ejecuciones de %s", method, route, count, statement, extra={"event": "repeated_statement"})
+        query_stats.reset(stats_token)
+        request_timings.reset(timings_token)
+
 @app.exception_handler(CircuitBreakerError)
 async def circuit_breaker_handler(request: Request, exc: CircuitBreakerError):
     return JSONResponse(
@@ -64,6 +287,15 @@ async def circuit_breaker_handler(request: Request, exc: CircuitBreakerError):
         content={"detail": "Servicio temporalmente no disponible. Circuit breaker está abierto."}
     )
 
+@app.get("/metrics", include_in_schema=False)
+def metrics():
+    """Exposición Prometheus (no pasa por el gateway)"""
+    observe_pool("primary", pool_stats())
+    for i, e in enumerate(read_engines):
+        observe_pool(f"replica{i}", pool_stats(e))
+    body, content_type = render_metrics()
+    return Response(content=body, media_type=content_type)
+
 @app.get("/health")
 @app.get("/healthz")
 async def health_check():
@@ -76,13 +308,20 @@ async def health_check():
     
     # Verificar base de datos
     try:
-        with session_scope() as s:
+        with session_scope(readonly=False) as s:
             s.execute(text("SELECT 1"))
-        health_status["dependencies"]["database"] = {"status": "healthy"}
+        health_status["dependencies"]["database"] = {"status": "healthy", "pool": pool_stats()}
     except Exception as e:
         health_status["dependencies"]["database"] = {"status": "unhealthy", "error": str(e)}
         health_status["status"] = "degraded"
     
+    # Verificar réplicas de lectura
+    replicas = check_replicas_health()
+    if replicas:
+        health_status["dependencies"]["database_replicas"] = replicas
+        if any(r["status"] != "healthy" for r in replicas):
+            health_status["status"] = "degraded"
+    
     # Verificar Redis
     redis_health = check_redis_health()
     health_status["dependencies"]["redis"] = redis_health
@@ -116,38 +355,48 @@ async def health_check():
         health_status["dependencies"]["projects-api"] = {"status": "unhealthy", "error": str(e)}
         health_status["status"] = "degraded"
     
+    # Cola: informativo; una cola larga no es motivo para reiniciar el pod (ver admission control y
+    # la señal mq_desired_workers en /metrics), así que no cambia el status
+    queue = task_processor.queue
+    health_status["queue"] = {
+        "size": queue.depth,
+        "consumers": queue.consumers,
+        "saturated": queue.saturated,
+        "desired_workers": desired_workers(queue.depth) if queue.depth is not None else None,
+    }
+    
     status_code = 200 if health_status["status"] == "healthy" else 503
     return JSONResponse(content=health_status, status_code=status_code)
 
 @app.post("/tasks", response_model=TaskOut, status_code=201)
-async def create_task(payload: TaskCreate):
+async def create_task(payload: TaskCreate, background_tasks: BackgroundTasks):
     """
     Crear tarea con validación via patrón Circuit Breaker
     """
-    # Validar que usuario existe usando patrones Circuit Breaker + Retry
-    try:
-        user_url = f"{USERS_API_URL}/users/{payload.assignee_user_id}"
-        await call_external_service(user_url)
-    except CircuitBreakerError:
+    # Validar usuario y proyecto en paralelo (Circuit Breaker + Retry); los BatchLoader agrupan
+    # los lookups de requests concurrentes en una llamada multi-get por servicio
+    # Sin asignado no hay lookup de usuario (sleep(0, None) mantiene la forma del gather)
+    user, project = await asyncio.gather(
+        users_loader.load(payload.assignee_user_id) if payload.assignee_user_id is not None else asyncio.sleep(0, None),
+        projects_loader.load(payload.project_id),
+        return_exceptions=True,
+    )
+    if isinstance(user, CircuitBreakerError):
         raise HTTPException(
             status_code=503,
             detail="Servicio de usuarios temporalmente no disponible. Circuit breaker está abierto."
         )
-    except Exception as e:
-        logger.error(f"Falló al validar usuario: {e}")
+    if isinstance(user, Exception):
+        logger.error(f"Falló al validar usuario: {user}")
         raise HTTPException(status_code=400, detail=f"assignee_user_id inválido: {payload.assignee_user_id}")
     
-    # Validar que proyecto existe
-    try:
-        project_url = f"{PROJECTS_API_URL}/projects/{payload.project_id}"
-        await call_external_service(project_url)
-    except CircuitBreakerError:
+    if isinstance(project, CircuitBreakerError):
         raise HTTPException(
             status_code=503,
             detail="Servicio de proyectos temporalmente no disponible. Circuit breaker está abierto."
         )
-    except Exception as e:
-        logger.error(f"Falló al validar proyecto: {e}")
+    if isinstance(project, Exception):
+        logger.error(f"Falló al validar proyecto: {project}")
         raise HTTPException(status_code=400, detail=f"project_id inválido: {payload.project_id}")
     
     # Ejemplo ACID: crear Task + TaskActivity inicial atómicamente
@@ -157,52 +406,174 @@ async def create_task(payload: TaskCreate):
         s.flush()
         a = TaskActivity(task_id=t.id, action="CREATED", note="Task created")
         s.add(a)
+        # Read model con los nombres ya obtenidos al validar
+        s.add(TaskView(
+            task_id=t.id,
+            title=t.title,
+            project_id=t.project_id,
+            project_name=project.get("name"),
+            assignee_user_id=t.assignee_user_id,
+            assignee_name=user.get("name") if user is not None else None,
+        ))
         
         # Invalidar cache
         cache.invalidate_pattern("task:*")
-        cache.invalidate_pattern("tasks:list")
-        
-        # Encolar notificación async
-        try:
-            task_processor.enqueue_task("task_notification", {
-                "task_id": t.id,
-                "assignee_user_id": t.assignee_user_id,
-                "project_id": t.project_id,
-                "type": "assigned"
-            })
-        except Exception as e:
-            logger.warning(f"Falló al encolar notificación: {e}")
-        
-        return t
+        cache.invalidate_pattern("tasks:list*")
+    
+    # Encolar notificación async (informativa: con la cola saturada el admission control la descarta o
+    # la demora; fuera de la transacción y con la variante async para no frenar el event loop)
+    try:
+        await task_processor.enqueue_task_async("task_notification", {
+            "task_id": t.id,
+            "assignee_user_id": t.assignee_user_id,
+            "project_id": t.project_id,
+            "type": "assigned"
+        }, critical=False)
+    except Exception as e:
+        logger.warning(f"Falló al encolar notificación: {e}")
+    
+    # Refrescar micro-cache del gateway una vez respondido el request
+    background_tasks.add_task(refresh_gateway_cache, "/api/tasks/tasks")
+    
+    return t
 
 @app.get("/tasks", response_model=list[TaskOut])
-def list_tasks():
-    """Listar tareas con patrón Cache-Aside"""
+def list_tasks(
+    response: Response,
+    project_id: int | None = None,
+    assignee_user_id: int | None = None,
+    if_none_match: str | None = Header(None),
+):
+    """
+    Listar tareas con patrón Cache-Aside.
+    Los filtros por proyecto / asignado usan los índices (project_id, id) y (assignee_user_id, id).
+    """
     cache_key = "tasks:list"
-    cached_tasks = cache.get(cache_key)
+    if project_id is not None:
+        cache_key += f":project={project_id}"
+    if assignee_user_id is not None:
+        cache_key += f":assignee={assignee_user_id}"
+    # GET condicional: el ETag se lee de Redis sin tocar el body
+    if if_none_match:
+        etag = cache.get_etag(cache_key)
+        if etag_matches(if_none_match, etag):
+            return Response(status_code=304, headers=cache_headers(etag))
+    
+    # Cache hit: el JSON guardado ya fue validado contra TaskOut en el miss,
+    # se envía tal cual sin pasar por response_model
+    cached_tasks, etag = cache.get_raw_with_etag(cache_key)
     
     if cached_tasks is not None:
-        return cached_tasks
+        return Response(content=cached_tasks, media_type="application/json", headers=cache_headers(etag))
     
     with session_scope() as s:
-        tasks = s.query(Task).order_by(Task.id).all()
+        query = s.query(Task)
+        if project_id is not None:
+            query = query.filter(Task.project_id == project_id)
+        if assignee_user_id is not None:
+            query = query.filter(Task.assignee_user_id == assignee_user_id)
+        tasks = query.order_by(Task.id).all()
         task_list = [TaskOut.model_validate(t) for t in tasks]
-        cache.set(cache_key, [t.model_dump() for t in task_list])
+        etag = cache.set(cache_key, [t.model_dump() for t in task_list])
+        response.headers.update(cache_headers(etag))
+        if etag_matches(if_none_match, etag):
+            return Response(status_code=304, headers=cache_headers(etag))
         return task_list
 
+EXPANDABLE_FIELDS = {"project", "assignee"}
+
+def fetch_name(loader: BatchLoader, key: Optional[int]) -> Optional[str]:
+    """Nombre de un recurso remoto desde el threadpool de un endpoint sync (BatchLoader en el event loop)"""
+    if key is None:
+        return None
+    try:
+        return from_thread.run(loader.load, key).get("name")
+    except Exception as e:
+        logger.warning(f"No se pudo completar task_view desde {loader.name} {key}: {e}")
+        return None
+
+def get_task_expanded(task_id: int, fields: set[str]) -> Response:
+    """Tarea con proyecto / asignado desde task_view: una lectura local en lugar de un fan-out"""
+    with session_scope() as s:
+        view = s.get(TaskView, task_id)
+        if not view:
+            raise HTTPException(status_code=404, detail="not found")
+        task = TaskExpandedOut(
+            id=view.task_id,
+            title=view.title,
+            project_id=view.project_id,
+            assignee_user_id=view.assignee_user_id,
+        )
+        project_name, assignee_name = view.project_name, view.assignee_name
+    
+    # Read-repair: filas anteriores al read model o eventos aún no consumidos
+    repaired = {}
+    if "project" in fields and project_name is None:
+        project_name = fetch_name(projects_loader, task.project_id)
+        if project_name is not None:
+            repaired["project_name"] = project_name
+    if "assignee" in fields and assignee_name is None:
+        assignee_name = fetch_name(users_loader, task.assignee_user_id)
+        if assignee_name is not None:
+            repaired["assignee_name"] = assignee_name
+    if repaired:
+        with session_scope(readonly=False) as s:
+            s.execute(update(TaskView).where(TaskView.task_id == task_id).values(**repaired))
+    
+    if "project" in fields:
+        task.project = ProjectRef(id=task.project_id, name=project_name)
+    if "assignee" in fields:
+        task.assignee = UserRef(id=task.assignee_user_id, name=assignee_name)
+    return ORJSONResponse(task.model_dump(exclude_none=True))
+
 @app.get("/tasks/{task_id}", response_model=TaskOut)
-def get_task(task_id: int):
-    """Obtener tarea por ID con patrón Cache-Aside"""
+def get_task(
+    task_id: int,
+    response: Response,
+    expand: str | None = None,
+    if_none_match: str | None = Header(None),
+):
+    """
+    Obtener tarea por ID con patrón Cache-Aside.
+    Con expand=project,assignee responde TaskExpandedOut desde el read model task_view.
+    """
+    if expand:
+        fields = {f.strip() for f in expand.split(",") if f.strip()}
+        if not fields <= EXPANDABLE_FIELDS:
+            raise HTTPException(status_code=422, detail=f"expand admite: {', '.join(sorted(EXPANDABLE_FIELDS))}")
+        return get_task_expanded(task_id, fields)
+    
     cache_key = f"task:{task_id}"
-    cached_task = cache.get(cache_key)
+    # GET condicional: el ETag se lee de Redis sin tocar el body
+    if if_none_match:
+        etag = cache.get_etag(cache_key)
+        if etag_matches(if_none_match, etag):
+            return Response(status_code=304, headers=cache_headers(etag))
+    
+    # Cache hit: enviar el JSON guardado sin deserializar ni re-validar
+    cached_task, etag = cache.get_raw_with_etag(cache_key)
     
     if cached_task is not None:
-        return TaskOut(**cached_task)
+        return Response(content=cached_task, media_type="application/json", headers=cache_headers(etag))
     
     with session_scope() as s:
         t = s.get(Task, task_id)
         if not t:
             raise HTTPException(status_code=404, detail="not found")
         task_out = TaskOut.model_validate(t)
-        cache.set(cache_key, task_out.model_dump())
+        etag = cache.set(cache_key, task_out.model_dump())
+        response.headers.update(cache_headers(etag))
+        if etag_matches(if_none_match, etag):
+            return Response(status_code=304, headers=cache_headers(etag))
         return task_out
+
+@app.get("/tasks/{task_id}/activities", response_model=list[TaskActivityOut])
+def list_task_activities(task_id: int, limit: int = Query(50, ge=1, le=500), since: Optional[datetime] = None):
+    """Actividades de una tarea, más recientes primero (índice (task_id, created_at DESC)).
+    Con since, Postgres descarta las particiones mensuales anteriores (partition pruning)"""
+    with session_scope() as s:
+        query = s.query(TaskActivity).filter(TaskActivity.task_id == task_id)
+        if since is not None:
+            query = query.filter(TaskActivity.created_at >= since)
+        activities = query.order_by(TaskActivity.created_at.desc()).limit(limit).all()
+        return [TaskActivityOut.model_validate(a) for a in activities]
@@ -1,25 +1,227 @@
-
 import os
+import time
+import random
+import logging
+import threading
 from contextlib import contextmanager
-from sqlalchemy import create_engine, text
+from contextvars import ContextVar
+from typing import Optional
+from sqlalchemy import create_engine, event, text
+from sqlalchemy.exc import TimeoutError as PoolTimeoutError
 from sqlalchemy.orm import sessionmaker, declarative_base
+from sqlalchemy.pool import NullPool, QueuePool
+from metrics import DB_QUERY_DURATION, DB_SLOW_QUERIES
+
+logger = logging.getLogger(__name__)
 
 DATABASE_URL = os.getenv("DATABASE_URL", "postgresql+psycopg2://postgres:postgres@db:5432/appdb")
 SCHEMA = "tasks"
 
-engine = create_engine(DATABASE_URL, pool_pre_ping=True)
+# Pool de conexiones configurable por entorno
+DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", "10"))
+DB_MAX_OVERFLOW = int(os.getenv("DB_MAX_OVERFLOW", "10"))
+DB_POOL_TIMEOUT = float(os.getenv("DB_POOL_TIMEOUT", "5"))
+DB_POOL_RECYCLE = int(os.getenv("DB_POOL_RECYCLE", "1800"))
+# pre-ping agrega un round trip por checkout; por defecto se usa el chequeo en background
+DB_POOL_PRE_PING = os.getenv("DB_POOL_PRE_PING", "false").lower() == "true"
+DB_LIVENESS_INTERVAL = int(os.getenv("DB_LIVENESS_INTERVAL", "30"))
+# Modo PgBouncer (transaction pooling): PgBouncer hace el pooling, la app no retiene conexiones
+DB_PGBOUNCER = os.getenv("DB_PGBOUNCER", "false").lower() == "true"
+
+# Réplicas de lectura (separadas por coma); sin réplicas todas las lecturas van al primario
+DATABASE_READ_URLS = [u.strip() for u in os.getenv("DATABASE_READ_URLS", "").split(",") if u.strip()]
+# Ventana read-your-writes: luego de escribir, el cliente lee del primario durante N segundos
+READ_YOUR_WRITES_SECONDS = int(os.getenv("READ_YOUR_WRITES_SECONDS", "5"))
+READ_YOUR_WRITES_COOKIE = "db_rw"
+
+# Statements lentos: se loguean con sus parámetros y (opcional) el plan de EXPLAIN, sin ANALYZE
+DB_SLOW_QUERY_MS = float(os.getenv("DB_SLOW_QUERY_MS", "100"))
+DB_EXPLAIN_SLOW_QUERIES = os.getenv("DB_EXPLAIN_SLOW_QUERIES", "false").lower() == "true"
+# Modo debug: contar statements idénticos por request para detectar N+1
+DB_QUERY_DEBUG = os.getenv("DB_QUERY_DEBUG", "false").lower() == "true"
+DB_REPEATED_STATEMENT_MIN = int(os.getenv("DB_REPEATED_STATEMENT_MIN", "3"))
+EXPLAINABLE_STATEMENTS = ("SELECT", "WITH", "INSERT", "UPDATE", "DELETE")
+
+# Ruta de la request actual ("read" = réplica, "write" = primario); la setea el middleware
+db_route: ContextVar[str] = ContextVar("db_route", default="write")
+# Statements y tiempo en la base de la request actual; el middleware de métricas inicializa el dict
+query_stats: ContextVar[Optional[dict]] = ContextVar("query_stats", default=None)
+
+
+def new_query_stats() -> dict:
+    """Acumulador por request para query_stats"""
+    return {"count": 0, "seconds": 0.0, "slow": [], "statements": {} if DB_QUERY_DEBUG else None}
+
+
+def repeated_statements(stats: dict) -> list[tuple[str, int]]:
+    """Statements ejecutados DB_REPEATED_STATEMENT_MIN o más veces en el request (solo en modo debug)"""
+    if not stats.get("statements"):
+        return []
+    return sorted(
+        ((statement, count) for statement, count in stats["statements"].items() if count >= DB_REPEATED_STATEMENT_MIN),
+        key=lambda item: -item[1],
+    )
+
+
+def server_timing(stats: dict) -> str:
+    """Entradas de Server-Timing con el tiempo en la base del request"""
+    entries = [f'db;dur={stats["seconds"] * 1000:.1f};desc="{stats["count"]} queries"']
+    if stats["slow"]:
+        entries.append(f'db-slow;desc="{len(stats["slow"])} queries > {DB_SLOW_QUERY_MS:g}ms"')
+    repeated = repeated_statements(stats)
+    if repeated:
+        entries.append(f'db-repeated;desc="{len(repeated)} statements x{repeated[0][1]}"')
+    return ", ".join(entries)
+
+
+def _explain(conn, statement: str, parameters) -> Optional[str]:
+    """
+    Plan estimado del statement, con un cursor DBAPI aparte (no dispara los eventos de SQLAlchemy).
+    Corre en la conexión y transacción del request, así que va dentro de un SAVEPOINT: si el EXPLAIN
+    falla se vuelve al savepoint y la transacción sigue usable en vez de quedar abortada
+    """
+    dbapi_connection = conn.connection.dbapi_connection
+    in_transaction = not getattr(dbapi_connection, "autocommit", False)
+    try:
+        cursor = dbapi_connection.cursor()
+        try:
+            if in_transaction:
+                cursor.execute("SAVEPOINT slow_query_explain")
+            try:
+                cursor.execute(f"EXPLAIN {statement}", parameters)
+                plan = "\n".join(row[0] for row in cursor.fetchall())
+            except Exception:
+                if in_transaction:
+                    cursor.execute("ROLLBACK TO SAVEPOINT slow_query_explain")
+                raise
+            if in_transaction:
+                cursor.execute("RELEASE SAVEPOINT slow_query_explain")
+            return plan
+        finally:
+            cursor.close()
+    except Exception as exc:
+        return f"EXPLAIN falló: {exc}"
+
+
+def _record_slow_query(conn, statement, parameters, executemany: bool, elapsed: float, target: str, stats: Optional[dict]):
+    DB_SLOW_QUERIES.labels(target).inc()
+    entry = {
+        "target": target,
+        "duration_ms": round(elapsed * 1000, 2),
+        "statement": statement,
+        "parameters": repr(parameters)[:500],
+    }
+    if DB_EXPLAIN_SLOW_QUERIES and not executemany and statement.lstrip().upper().startswith(EXPLAINABLE_STATEMENTS):
+        entry["plan"] = _explain(conn, statement, parameters)
+    if stats is not None:
+        stats["slow"].append(entry)
+    logger.warning("Query lenta (%.1f ms, %s): %s", entry["duration_ms"], target, statement, extra={"event": "slow_query", "slow_query": entry})
+
+
+class InstrumentedQueuePool(QueuePool):
+    """QueuePool que mide cuánto esperan los requests por una conexión libre"""
+    
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._stats_lock = threading.Lock()
+        self.wait_count = 0
+        self.wait_seconds_total = 0.0
+        self.wait_seconds_max = 0.0
+        self.timeouts = 0
+    
+    def _do_get(self):
+        start = time.perf_counter()
+        try:
+            return super()._do_get()
+        except PoolTimeoutError:
+            with self._stats_lock:
+                self.timeouts += 1
+            raise
+        finally:
+            elapsed = time.perf_counter() - start
+            with self._stats_lock:
+                self.wait_count += 1
+                self.wait_seconds_total += elapsed
+                self.wait_seconds_max = max(self.wait_seconds_max, elapsed)
+
+
+def _instrument(e, target: str):
+    """Medir cada statement (histograma por target + acumulado de la request actual)"""
+    query_duration = DB_QUERY_DURATION.labels(target)
+    
+    @event.listens_for(e, "before_cursor_execute")
+    def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        conn.info.setdefault("query_start", []).append(time.perf_counter())
+    
+    @event.listens_for(e, "after_cursor_execute")
+    def after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        elapsed = time.perf_counter() - conn.info["query_start"].pop()
+        query_duration.observe(elapsed)
+        stats = query_stats.get()
+        if stats is not None:
+            stats["count"] += 1
+            stats["seconds"] += elapsed
+            if stats["statements"] is not None:
+                stats["statements"][statement] = stats["statements"].get(statement, 0) + 1
+        if elapsed * 1000 >= DB_SLOW_QUERY_MS:
+            _record_slow_query(conn, statement, parameters, executemany, elapsed, target, stats)
+    
+    @event.listens_for(e, "handle_error")
+    def handle_error(context):
+        # El statement falló: after_cursor_execute no corre, descartar su marca de inicio
+        if context.connection is not None and context.connection.info.get("query_start"):
+            context.connection.info["query_start"].pop()
+    
+    return e
+
+
+def _create_engine(url: str, target: str = "primary"):
+    if DB_PGBOUNCER:
+        return _instrument(create_engine(url, poolclass=NullPool), target)
+    return _instrument(create_engine(
+        url,
+        poolclass=InstrumentedQueuePool,
+        pool_size=DB_POOL_SIZE,
+        max_overflow=DB_MAX_OVERFLOW,
+        pool_timeout=DB_POOL_TIMEOUT,
+        pool_recycle=DB_POOL_RECYCLE,
+        pool_pre_ping=DB_POOL_PRE_PING,
+        pool_use_lifo=True,
+    ), target)
+
+
+engine = _create_engine(DATABASE_URL)
 SessionLocal = sessionmaker(bind=engine, autoflush=False, autocommit=False, expire_on_commit=False)
 
+read_engines = [_create_engine(url, target="replica") for url in DATABASE_READ_URLS]
+ReadSessionLocals = [
+    sessionmaker(bind=e, autoflush=False, autocommit=False, expire_on_commit=False) for e in read_engines
+]
+
 Base = declarative_base()
 
-def init_schema():
-    with engine.connect() as conn:
-        conn.execute(text(f'CREATE SCHEMA IF NOT EXISTS "tasks"'))
-        conn.commit()
+def dispose_engines():
+    """Después de un fork: descartar las conexiones heredadas sin cerrarlas (son del proceso padre)"""
+    for e in [engine, *read_engines]:
+        e.dispose(close=False)
+
+
+def use_replica() -> bool:
+    """True si la request actual lee de una réplica"""
+    return bool(ReadSessionLocals) and db_route.get() == "read"
 
 @contextmanager
-def session_scope():
-    session = SessionLocal()
+def session_scope(readonly: Optional[bool] = None):
+    """
+    Sesión transaccional. Por defecto sigue la ruta de la request (GET -> réplica);
+    readonly=False fuerza el primario.
+    """
+    if readonly is None:
+        readonly = use_replica()
+    if readonly and ReadSessionLocals:
+        session = random.choice(ReadSessionLocals)()
+    else:
+        session = SessionLocal()
     try:
         yield session
         session.commit()
@@ -28,3 +230,66 @@ def session_scope():
         raise
     finally:
         session.close()
+
+
+def pool_stats(target=None) -> dict:
+    """Métricas del pool: conexiones en uso, overflow y tiempo de espera por checkout"""
+    pool = (target or engine).pool
+    if not isinstance(pool, InstrumentedQueuePool):
+        return {"mode": "pgbouncer" if DB_PGBOUNCER else type(pool).__name__}
+    with pool._stats_lock:
+        waits = pool.wait_count
+        wait_total = pool.wait_seconds_total
+        wait_max = pool.wait_seconds_max
+        timeouts = pool.timeouts
+    return {
+        "mode": "pool",
+        "size": pool.size(),
+        "checked_out": pool.checkedout(),
+        "checked_in": pool.checkedin(),
+        "overflow": max(pool.overflow(), 0),
+        "max_overflow": DB_MAX_OVERFLOW,
+        "checkouts": waits,
+        "wait_seconds_total": round(wait_total, 6),
+        "wait_seconds_avg": round(wait_total / waits, 6) if waits else 0.0,
+        "wait_seconds_max": round(wait_max, 6),
+        "timeouts": timeouts,
+    }
+
+
+def start_liveness_check():
+    """
+    Chequeo de liveness en background (reemplaza pool_pre_ping).
+    Si la base no responde se descartan las conexiones del pool para no reusar sockets muertos.
+    """
+    if DB_POOL_PRE_PING or DB_PGBOUNCER or DB_LIVENESS_INTERVAL <= 0:
+        return
+    
+    def check():
+        while True:
+            time.sleep(DB_LIVENESS_INTERVAL)
+            for e in [engine, *read_engines]:
+                try:
+                    with e.connect() as conn:
+                        conn.execute(text("SELECT 1"))
+                except Exception as exc:
+                    logger.warning(f"Liveness de base de datos falló ({e.url.host}), reciclando pool: {exc}")
+                    e.dispose()
+    
+    threading.Thread(target=check, daemon=True, name="db-liveness").start()
+    logger.info(f"Liveness check de base de datos cada {DB_LIVENESS_INTERVAL}s")
+
+
+def check_replicas_health() -> list[dict]:
+    """Verificar cada réplica de lectura"""
+    results = []
+    for e in read_engines:
+        try:
+            with e.connect() as conn:
+                lag = conn.execute(text(
+                    "SELECT COALESCE(EXTRACT(EPOCH FROM now() - pg_last_xact_replay_timestamp()), 0)"
+                )).scalar()
+            results.append({"status": "healthy", "host": e.url.host, "lag_seconds": float(lag), "pool": pool_stats(e)})
+        except Exception as exc:
+            results.append({"status": "unhealthy", "host": e.url.host, "error": str(exc)})
+    return results
@@ -0,0 +1,47 @@
+"""Tablas iniciales de tasks-api
+
+Revision ID: 0001
+Revises:
+Create Date: 2026-10-19
+"""
+from alembic import op
+import sqlalchemy as sa
+
+revision = "0001"
+down_revision = None
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # Bases creadas antes de las migraciones (create_all al importar) ya tienen las tablas
+    existing = sa.inspect(op.get_bind()).get_table_names()
+    
+    if "tasks" not in existing:
+        op.create_table(
+            "tasks",
+            sa.Column("id", sa.Integer(), primary_key=True),
+            sa.Column("title", sa.String(200), nullable=False),
+            sa.Column("project_id", sa.Integer(), nullable=False),
+            sa.Column("assignee_user_id", sa.Integer(), nullable=False),
+            sa.Column("created_at", sa.DateTime(timezone=True), server_default=sa.func.now(), nullable=False),
+        )
+        op.create_index("ix_tasks_title", "tasks", ["title"])
+        op.create_index("ix_tasks_project_id", "tasks", ["project_id"])
+        op.create_index("ix_tasks_assignee_user_id", "tasks", ["assignee_user_id"])
+    
+    if "task_activities" not in existing:
+        op.create_table(
+            "task_activities",
+            sa.Column("id", sa.Integer(), primary_key=True),
+            sa.Column("task_id", sa.Integer(), nullable=False),
+            sa.Column("action", sa.String(50), nullable=False),
+            sa.Column("note", sa.Text(), nullable=False),
+            sa.Column("created_at", sa.DateTime(timezone=True), server_default=sa.func.now(), nullable=False),
+        )
+        op.create_index("ix_task_activities_task_id", "task_activities", ["task_id"])
+
+
+def downgrade():
+    op.drop_table("task_activities")
+    op.drop_table("tasks")
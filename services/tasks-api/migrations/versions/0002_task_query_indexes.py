@@ -0,0 +1,58 @@
+"""Índices compuestos y covering según las consultas de tasks-api
+
+Revision ID: 0002
+Revises: 0001
+Create Date: 2026-10-19
+"""
+from alembic import op
+import sqlalchemy as sa
+
+revision = "0002"
+down_revision = "0001"
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # CONCURRENTLY no puede correr dentro de una transacción y no bloquea escrituras
+    with op.get_context().autocommit_block():
+        op.create_index(
+            "ix_tasks_project_id_id", "tasks", ["project_id", "id"],
+            postgresql_include=["title", "assignee_user_id"],
+            postgresql_concurrently=True, if_not_exists=True,
+        )
+        op.create_index(
+            "ix_tasks_assignee_user_id_id", "tasks", ["assignee_user_id", "id"],
+            postgresql_include=["title", "project_id"],
+            postgresql_concurrently=True, if_not_exists=True,
+        )
+        op.create_index(
+            "ix_task_activities_task_id_created_at", "task_activities", ["task_id", sa.text("created_at DESC")],
+            postgresql_include=["action"],
+            postgresql_concurrently=True, if_not_exists=True,
+        )
+        
+        # Redundantes con los compuestos (prefijo) o sin consultas que los usen (title)
+        for name, table in [
+            ("ix_tasks_title", "tasks"),
+            ("ix_tasks_project_id", "tasks"),
+            ("ix_tasks_assignee_user_id", "tasks"),
+            ("ix_task_activities_task_id", "task_activities"),
+        ]:
+            op.drop_index(name, table_name=table, postgresql_concurrently=True, if_exists=True)
+
+
+def downgrade():
+    with op.get_context().autocommit_block():
+        op.create_index("ix_tasks_title", "tasks", ["title"], postgresql_concurrently=True, if_not_exists=True)
+        op.create_index("ix_tasks_project_id", "tasks", ["project_id"], postgresql_concurrently=True, if_not_exists=True)
+        op.create_index(
+            "ix_tasks_assignee_user_id", "tasks", ["assignee_user_id"], postgresql_concurrently=True, if_not_exists=True
+        )
+        op.create_index(
+            "ix_task_activities_task_id", "task_activities", ["task_id"], postgresql_concurrently=True, if_not_exists=True
+        )
+        
+        op.drop_index("ix_task_activities_task_id_created_at", table_name="task_activities", postgresql_concurrently=True, if_exists=True)
+        op.drop_index("ix_tasks_assignee_user_id_id", table_name="tasks", postgresql_concurrently=True, if_exists=True)
+        op.drop_index("ix_tasks_project_id_id", table_name="tasks", postgresql_concurrently=True, if_exists=True)
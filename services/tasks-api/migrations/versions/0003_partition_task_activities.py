@@ -0,0 +1,80 @@
+"""Particionar task_activities por mes (created_at)
+
+Revision ID: 0003
+Revises: 0002
+Create Date: 2026-10-19
+"""
+from alembic import op
+
+revision = "0003"
+down_revision = "0002"
+branch_labels = None
+depends_on = None
+
+TABLE = "task_activities"
+COLUMNS = """
+    id integer NOT NULL DEFAULT nextval('task_activities_id_seq'),
+    task_id integer NOT NULL,
+    action varchar(50) NOT NULL,
+    note text NOT NULL,
+    created_at timestamptz NOT NULL DEFAULT now()
+"""
+COLUMN_NAMES = "id, task_id, action, note, created_at"
+
+
+def upgrade():
+    # La tabla actual queda como legacy; sus datos se copian a la particionada
+    op.execute(f"ALTER TABLE {TABLE} RENAME TO {TABLE}_legacy")
+    op.execute(f"ALTER TABLE {TABLE}_legacy RENAME CONSTRAINT {TABLE}_pkey TO {TABLE}_legacy_pkey")
+    
+    # La PK de una tabla particionada debe incluir la clave de partición
+    op.execute(f"""
+        CREATE TABLE {TABLE} (
+            {COLUMNS},
+            PRIMARY KEY (id, created_at)
+        ) PARTITION BY RANGE (created_at)
+    """)
+    op.execute(f"ALTER SEQUENCE {TABLE}_id_seq OWNED BY {TABLE}.id")
+    # Red de seguridad si el mantenimiento no creó la partición del mes
+    op.execute(f"CREATE TABLE {TABLE}_default PARTITION OF {TABLE} DEFAULT")
+    
+    # Particiones mensuales desde el dato más viejo hasta 3 meses adelante
+    op.execute(f"""
+        DO $$
+        DECLARE m date;
+        BEGIN
+            FOR m IN
+                SELECT generate_series(
+                    date_trunc('month', COALESCE((SELECT min(created_at) FROM {TABLE}_legacy), now())),
+                    date_trunc('month', now()) + interval '3 months',
+                    interval '1 month'
+                )::date
+            LOOP
+                EXECUTE format(
+                    'CREATE TABLE IF NOT EXISTS %I PARTITION OF {TABLE} FOR VALUES FROM (%L) TO (%L)',
+                    '{TABLE}_p' || to_char(m, 'YYYYMM'), m, (m + interval '1 month')::date
+                );
+            END LOOP;
+        END $$
+    """)
+    
+    op.execute(f"INSERT INTO {TABLE} ({COLUMN_NAMES}) SELECT {COLUMN_NAMES} FROM {TABLE}_legacy")
+    op.execute(f"DROP TABLE {TABLE}_legacy")
+    
+    # Índice en la tabla padre: se propaga a cada partición (actual y futuras)
+    op.execute(
+        f"CREATE INDEX ix_task_activities_task_id_created_at ON {TABLE} (task_id, created_at DESC) INCLUDE (action)"
+    )
+
+
+def downgrade():
+    op.execute(f"ALTER TABLE {TABLE} RENAME TO {TABLE}_partitioned")
+    op.execute(f"ALTER TABLE {TABLE}_partitioned RENAME CONSTRAINT {TABLE}_pkey TO {TABLE}_partitioned_pkey")
+    op.execute("ALTER INDEX ix_task_activities_task_id_created_at RENAME TO ix_task_activities_partitioned_task_id_created_at")
+    op.execute(f"CREATE TABLE {TABLE} ({COLUMNS}, PRIMARY KEY (id))")
+    op.execute(f"ALTER SEQUENCE {TABLE}_id_seq OWNED BY {TABLE}.id")
+    op.execute(f"INSERT INTO {TABLE} ({COLUMN_NAMES}) SELECT {COLUMN_NAMES} FROM {TABLE}_partitioned")
+    op.execute(f"DROP TABLE {TABLE}_partitioned")
+    op.execute(
+        f"CREATE INDEX ix_task_activities_task_id_created_at ON {TABLE} (task_id, created_at DESC) INCLUDE (action)"
+    )
@@ -0,0 +1,38 @@
+"""Read model task_view (CQRS) con nombres de proyecto y asignado
+
+Revision ID: 0004
+Revises: 0003
+Create Date: 2026-10-19
+"""
+from alembic import op
+import sqlalchemy as sa
+
+revision = "0004"
+down_revision = "0003"
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table(
+        "task_view",
+        sa.Column("task_id", sa.Integer(), primary_key=True),
+        sa.Column("title", sa.String(200), nullable=False),
+        sa.Column("project_id", sa.Integer(), nullable=False),
+        sa.Column("project_name", sa.String(200), nullable=True),
+        sa.Column("assignee_user_id", sa.Integer(), nullable=False),
+        sa.Column("assignee_name", sa.String(100), nullable=True),
+        sa.Column("updated_at", sa.DateTime(timezone=True), server_default=sa.func.now(), nullable=False),
+    )
+    op.create_index("ix_task_view_project_id", "task_view", ["project_id"])
+    op.create_index("ix_task_view_assignee_user_id", "task_view", ["assignee_user_id"])
+    
+    # Tareas existentes: los nombres se completan on-read la primera vez que se expanden
+    op.execute(
+        "INSERT INTO task_view (task_id, title, project_id, assignee_user_id) "
+        "SELECT id, title, project_id, assignee_user_id FROM tasks"
+    )
+
+
+def downgrade():
+    op.drop_table("task_view")
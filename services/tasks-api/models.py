@@ -1,26 +1,62 @@
 from datetime import datetime
-from sqlalchemy import String, Integer, DateTime, Text, func
+from typing import Optional
+from sqlalchemy import String, Integer, DateTime, Text, Index, func
 from sqlalchemy.orm import Mapped, mapped_column
 from db import Base 
 
 class Task(Base):
     __tablename__ = "tasks"
+    __table_args__ = (
+        # Tareas de un proyecto / asignado ordenadas por id, con index-only scan (INCLUDE cubre TaskOut)
+        Index("ix_tasks_project_id_id", "project_id", "id", postgresql_include=["title", "assignee_user_id"]),
+        Index("ix_tasks_assignee_user_id_id", "assignee_user_id", "id", postgresql_include=["title", "project_id"]),
+    )
 
     id: Mapped[int] = mapped_column(Integer, primary_key=True)
-    title: Mapped[str] = mapped_column(String(200), nullable=False, index=True)
-    project_id: Mapped[int] = mapped_column(Integer, nullable=False, index=True)
-    assignee_user_id: Mapped[int] = mapped_column(Integer, nullable=False, index=True)
+    title: Mapped[str] = mapped_column(String(200), nullable=False)
+    project_id: Mapped[int] = mapped_column(Integer, nullable=False)
+    assignee_user_id: Mapped[int] = mapped_column(Integer, nullable=False)
     created_at: Mapped[datetime] = mapped_column(
         DateTime(timezone=True), server_default=func.now(), nullable=False
     )
 
 class TaskActivity(Base):
     __tablename__ = "task_activities"
+    # Particionada por mes sobre created_at (ver partitions.py); la PK debe incluir la clave de partición
+    __table_args__ = {"postgresql_partition_by": "RANGE (created_at)"}
 
-    id: Mapped[int] = mapped_column(Integer, primary_key=True)
-    task_id: Mapped[int] = mapped_column(Integer, nullable=False, index=True)
+    # PK compuesta: sin autoincrement explícito SQLAlchemy no toma id como generado por la base (nextval)
+    id: Mapped[int] = mapped_column(Integer, primary_key=True, autoincrement=True)
+    task_id: Mapped[int] = mapped_column(Integer, nullable=False)
     action: Mapped[str] = mapped_column(String(50), nullable=False)
     note: Mapped[str] = mapped_column(Text, nullable=False, default="Task created")
     created_at: Mapped[datetime] = mapped_column(
-        DateTime(timezone=True), server_default=func.now(), nullable=False
+        DateTime(timezone=True), server_default=func.now(), nullable=False, primary_key=True
+    )
+
+# Actividades de una tarea, más recientes primero
+Index(
+    "ix_task_activities_task_id_created_at",
+    TaskActivity.task_id,
+    TaskActivity.created_at.desc(),
+    postgresql_include=["action"],
+)
+
+class TaskView(Base):
+    """Read model desnormalizado (CQRS): tarea + nombre de proyecto y asignado, actualizado por eventos"""
+    __tablename__ = "task_view"
+    __table_args__ = (
+        # Los eventos de users / projects actualizan todas las filas del asignado / proyecto
+        Index("ix_task_view_project_id", "project_id"),
+        Index("ix_task_view_assignee_user_id", "assignee_user_id"),
+    )
+
+    task_id: Mapped[int] = mapped_column(Integer, primary_key=True)
+    title: Mapped[str] = mapped_column(String(200), nullable=False)
+    project_id: Mapped[int] = mapped_column(Integer, nullable=False)
+    project_name: Mapped[Optional[str]] = mapped_column(String(200), nullable=True)
+    assignee_user_id: Mapped[int] = mapped_column(Integer, nullable=False)
+    assignee_name: Mapped[Optional[str]] = mapped_column(String(100), nullable=True)
+    updated_at: Mapped[datetime] = mapped_column(
+        DateTime(timezone=True), server_default=func.now(), onupdate=func.now(), nullable=False
     )
@@ -1,4 +1,6 @@
 
+
+from datetime import datetime
 from pydantic import BaseModel
 
 class TaskCreate(BaseModel):
@@ -14,3 +16,25 @@ class TaskOut(BaseModel):
 
     class Config:
         from_attributes = True
+
+class TaskActivityOut(BaseModel):
+    id: int
+    task_id: int
+    action: str
+    note: str
+    created_at: datetime
+
+    class Config:
+        from_attributes = True
+
+class ProjectRef(BaseModel):
+    id: int
+    name: str | None = None
+
+class UserRef(BaseModel):
+    id: int
+    name: str | None = None
+
+class TaskExpandedOut(TaskOut):
+    project: ProjectRef | None = None
+    assignee: UserRef | None = None
@@ -0,0 +1,151 @@
+"""
+Desglose del tiempo de cada request y profiling bajo demanda.
+
+- Server-Timing: el middleware de métricas abre un acumulador por request; rate limiting, cache, idempotencia,
+  llamadas a otros servicios y publish a RabbitMQ suman su duración por fase (la base la suma db.query_stats)
+- Profiling (pyinstrument): opt-in por header X-Profile con PROFILE_TOKEN o por muestreo (PROFILE_SAMPLE_RATE);
+  escribe un flame graph HTML por request en PROFILE_DIR. El profiler del middleware ve el event loop; los
+  handlers sync corren en el threadpool, así que ProfiledRoute abre otro profiler en ese thread y el HTML
+  combina ambos
+"""
+import os
+import hmac
+import functools
+import random
+import asyncio
+import logging
+from contextvars import ContextVar
+from datetime import datetime
+from pathlib import Path
+from typing import Optional
+from fastapi.routing import APIRoute
+
+logger = logging.getLogger(__name__)
+
+SERVER_TIMING_ENABLED = os.getenv("SERVER_TIMING_ENABLED", "true").lower() == "true"
+# Token que habilita el header X-Profile (vacío = solo muestreo)
+PROFILE_TOKEN = os.getenv("PROFILE_TOKEN", "")
+PROFILE_SAMPLE_RATE = float(os.getenv("PROFILE_SAMPLE_RATE", "0"))
+PROFILE_DIR = Path(os.getenv("PROFILE_DIR", "/tmp/profiles"))
+PROFILE_INTERVAL = float(os.getenv("PROFILE_INTERVAL", "0.001"))
+
+# Fase -> [segundos, operaciones] del request actual; lo inicializa el middleware de métricas
+request_timings: ContextVar[Optional[dict]] = ContextVar("request_timings", default=None)
+
+
+class RequestProfiler:
+    """Profiler del event loop más las sesiones de los threads donde corrió el handler sync"""
+
+    def __init__(self, profiler):
+        self.profiler = profiler
+        self.thread_sessions = []
+
+    @property
+    def is_running(self) -> bool:
+        return self.profiler.is_running
+
+    def stop(self):
+        self.profiler.stop()
+
+
+# Profiler del request actual; lo lee el wrapper de los handlers sync (el contexto se copia al threadpool)
+request_profiler: ContextVar[Optional[RequestProfiler]] = ContextVar("request_profiler", default=None)
+
+
+def add_phase(name: str, seconds: float):
+    """Sumar tiempo a una fase del request actual (no-op fuera de un request)"""
+    timings = request_timings.get()
+    if timings is None:
+        return
+    entry = timings.get(name)
+    if entry is None:
+        timings[name] = [seconds, 1]
+    else:
+        entry[0] += seconds
+        entry[1] += 1
+
+
+def format_server_timing(timings: dict, total_seconds: float) -> str:
+    """Entradas de Server-Timing por fase más el total del request"""
+    entries = [
+        f'{name};dur={seconds * 1000:.1f};desc="{count} ops"' for name, (seconds, count) in timings.items()
+    ]
+    entries.append(f"total;dur={total_seconds * 1000:.1f}")
+    return ", ".join(entries)
+
+
+def start_profiler(request):
+    """Profiler del request si lo pide un caller autorizado o cae en el muestreo; None si no corresponde"""
+    requested = request.headers.get("x-profile")
+    authorized = bool(PROFILE_TOKEN) and requested is not None and hmac.compare_digest(requested, PROFILE_TOKEN)
+    if not authorized and not (PROFILE_SAMPLE_RATE > 0 and random.random() < PROFILE_SAMPLE_RATE):
+        return None
+    try:
+        from pyinstrument import Profiler
+    except ImportError:
+        logger.warning("Profiling pedido pero pyinstrument no está instalado")
+        return None
+    profiler = Profiler(interval=PROFILE_INTERVAL, async_mode="enabled")
+    try:
+        profiler.start()
+    except RuntimeError as e:
+        # pyinstrument admite un profiler activo por contexto
+        logger.warning(f"No se pudo iniciar el profiler: {e}")
+        return None
+    profile = RequestProfiler(profiler)
+    request_profiler.set(profile)
+    return profile
+
+
+def profile_sync(func):
+    """Envolver un handler sync: si el request se está perfilando, perfilar también el thread del threadpool"""
+
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        current = request_profiler.get()
+        if current is None:
+            return func(*args, **kwargs)
+        from pyinstrument import Profiler
+        # Sin async_mode: es otro thread, no compite con el profiler del event loop
+        profiler = Profiler(interval=PROFILE_INTERVAL, async_mode="disabled")
+        profiler.start()
+        try:
+            return func(*args, **kwargs)
+        finally:
+            current.thread_sessions.append(profiler.stop())
+
+    return wrapper
+
+
+class ProfiledRoute(APIRoute):
+    """Ruta cuyo handler sync se perfila dentro del threadpool (app.router.route_class)"""
+
+    def __init__(self, path: str, endpoint, **kwargs):
+        if not asyncio.iscoroutinefunction(endpoint):
+            endpoint = profile_sync(endpoint)
+        super().__init__(path, endpoint, **kwargs)
+
+
+async def save_profile(profile: RequestProfiler, method: str, route: str) -> Optional[str]:
+    """Detener el profiler y escribir el flame graph HTML (event loop + threads) fuera del event loop"""
+    from pyinstrument.renderers import HTMLRenderer
+    from pyinstrument.session import Session
+
+    profile.stop()
+    name = f"{datetime.now().strftime('%Y%m%d-%H%M%S-%f')}-{method}-{route.strip('/').replace('/', '_') or 'root'}.html"
+    path = PROFILE_DIR / name.replace("{", "").replace("}", "")
+
+    def write():
+        session = profile.profiler.last_session
+        for thread_session in profile.thread_sessions:
+            session = Session.combine(session, thread_session)
+        PROFILE_DIR.mkdir(parents=True, exist_ok=True)
+        path.write_text(HTMLRenderer().render(session))
+
+    try:
+        await asyncio.to_thread(write)
+    except Exception as e:
+        logger.warning(f"No se pudo guardar el profile: {e}")
+        return None
+    logger.info(f"Profile guardado: {path}")
+    return path.name
@@ -1,41 +1,88 @@
 
+import time
 import logging
-from fastapi import FastAPI, HTTPException, Request
-from fastapi.responses import JSONResponse
-from sqlalchemy import text
+import hashlib
+from datetime import datetime, timedelta, timezone
+from typing import Optional
+import orjson
+from fastapi import FastAPI, HTTPException, Request, Response, BackgroundTasks, Header
+from fastapi.responses import JSONResponse, ORJSONResponse
+from sqlalchemy import text, func, Integer, any_, bindparam
+from sqlalchemy.dialects.postgresql import ARRAY
+from sqlalchemy.dialects.postgresql import insert as pg_insert
 from pybreaker import CircuitBreakerError
-from db import Base, engine, session_scope, init_schema
-from models import User, AuditLog
+from db import (
+    engine, session_scope, pool_stats, start_liveness_check, query_stats, read_engines, dispose_engines,
+    new_query_stats, repeated_statements, server_timing,
+    check_replicas_health, db_route, READ_YOUR_WRITES_COOKIE, READ_YOUR_WRITES_SECONDS,
+)
+from models import User, AuditLog, IdempotencyKey, IDEMPOTENCY_KEY_TTL
 from schemas import UserCreate, UserOut
-from patterns import CacheAside, RateLimiter, check_redis_health
-from messaging import AsyncTaskProcessor, check_rabbitmq_health
+from patterns import CacheAside, RateLimiter, cache_headers, etag_matches, refresh_gateway_cache, check_redis_health, IdempotencyStore, make_etag, parse_ids, LoadShedder, publish_breaker_state, LOAD_SHEDDING_ENABLED, LOAD_SHED_RETRY_AFTER, reset_connections
+from messaging import AsyncTaskProcessor, check_rabbitmq_health, desired_workers
+from tracing import setup_tracing
+from logging_config import setup_logging, restart_listener
+from timing import request_timings, format_server_timing, start_profiler, save_profile, ProfiledRoute, SERVER_TIMING_ENABLED
+from metrics import (
+    HTTP_REQUESTS, HTTP_REQUEST_DURATION, HTTP_IN_FLIGHT, DB_TIME_PER_REQUEST, DB_QUERIES_PER_REQUEST, DB_REPEATED_STATEMENTS,
+    IDEMPOTENCY_REQUESTS, route_label, observe_pool, render_metrics,
+)
+from partitions import start_partition_maintenance
 
-logging.basicConfig(level=logging.INFO)
+setup_logging("users-api")
 logger = logging.getLogger(__name__)
 
-app = FastAPI(title="Users API")
+app = FastAPI(title="Users API", default_response_class=ORJSONResponse)
+# Los handlers sync se perfilan en el thread del threadpool donde corren (ver timing.py)
+app.router.route_class = ProfiledRoute
+setup_tracing("users-api", app, engines=[engine, *read_engines])
 
-# Inicializar schema y tablas
-init_schema()
-Base.metadata.create_all(bind=engine)
+# El schema y las tablas los crea el job de migraciones (alembic upgrade head), no el import
+
+# Métodos con label propia en las métricas (el resto se agrupa como OTHER)
+HTTP_METHODS = {"GET", "HEAD", "POST", "PUT", "PATCH", "DELETE", "OPTIONS"}
 
 # Inicializar patrones
 cache = CacheAside(prefix="users", ttl=300)
-rate_limiter = RateLimiter(max_requests=100, window_seconds=60)
+rate_limiter = RateLimiter()
+load_shedder = LoadShedder()
+idempotency = IdempotencyStore(prefix="users")
+# Rutas cuya Idempotency-Key vive en la base (idempotency_keys, en la misma transacción que la escritura):
+# la fuente de verdad es la tabla y el middleware de Redis no las procesa
+IDEMPOTENCY_DB_ROUTES = {"/users"}
 task_processor = AsyncTaskProcessor("user_tasks")
 
 # Registrar handlers de tareas asíncronas
 def handle_user_notification(data: dict):
     """Ejemplo de handler async para notificaciones de usuario"""
-    logger.info(f"Procesando notificación de usuario: {data}")
+    logger.debug("Procesando notificación de usuario: %s", data, extra={"event": "notification"})
 
 task_processor.register_handler("user_notification", handle_user_notification)
 
+# Con gunicorn --preload la app se importa en el master y los workers heredan sus conexiones
+def reset_after_fork():
+    """
+    Llamado desde post_fork en cada worker: descartar el pool de la base, Redis, httpx y pika del master
+    y levantar el listener de logging (los threads no sobreviven al fork). Los threads de liveness,
+    particiones y monitor de cola arrancan en startup, que ya corre por worker.
+    """
+    dispose_engines()
+    reset_connections()
+    task_processor.queue.reset_connections()
+    restart_listener()
+
+
 # Iniciar worker en background para procesamiento de cola
 @app.on_event("startup")
 async def startup_event():
     logger.info("Iniciando Users API con patrones arquitectónicos")
     logger.info("Queue-based load leveling listo ")
+    start_liveness_check()
+    # Gauges iniciales por worker (ver publish_breaker_state)
+    load_shedder.publish_metrics()
+    publish_breaker_state()
+    start_partition_maintenance()
+    task_processor.start_monitor()
 
 
 @app.on_event("shutdown")
@@ -44,6 +91,82 @@ async def shutdown_event():
     task_processor.stop_worker()
 
 
+# Middleware de ruteo de lecturas: GETs a réplica salvo escritura reciente del cliente
+@app.middleware("http")
+async def read_routing_middleware(request: Request, call_next):
+    sticky = READ_YOUR_WRITES_COOKIE in request.cookies
+    reading = request.method in ("GET", "HEAD") and not sticky
+    token = db_route.set("read" if reading else "write")
+    try:
+        response = await call_next(request)
+    finally:
+        db_route.reset(token)
+    # Read-your-writes: luego de escribir, el cliente lee del primario durante una ventana corta
+    if request.method not in ("GET", "HEAD") and response.status_code < 400:
+        response.set_cookie(READ_YOUR_WRITES_COOKIE, "1", max_age=READ_YOUR_WRITES_SECONDS, httponly=True)
+    return response
+
+
+# Middleware de Idempotency-Key: un POST reintentado devuelve la respuesta original sin re-ejecutar la escritura
+@app.middleware("http")
+async def idempotency_middleware(request: Request, call_next):
+    key = request.headers.get("idempotency-key")
+    if request.method != "POST" or not key or request.url.path in IDEMPOTENCY_DB_ROUTES:
+        return await call_next(request)
+    key = idempotency.scoped_key(key, request.headers.get("authorization"))
+    
+    fingerprint = idempotency.fingerprint(request.method, request.url.path, await request.body())
+    try:
+        stored = idempotency.get(key)
+        if stored is None and not idempotency.acquire(key):
+            # Un duplicado concurrente está en curso: esperar su respuesta
+            stored = await idempotency.wait(key)
+            if stored is None:
+                IDEMPOTENCY_REQUESTS.labels("in_progress").inc()
+                return JSONResponse(
+                    status_code=409,
+                    content={"detail": "Request con esta Idempotency-Key en curso"},
+                    headers={"Retry-After": "1"},
+                )
+    except Exception as e:
+        # Sin Redis no hay deduplicación, pero el request se atiende igual
+        logger.warning(f"Idempotency store no disponible: {e}")
+        return await call_next(request)
+    
+    if stored is not None:
+        if stored["fingerprint"] != fingerprint:
+            IDEMPOTENCY_REQUESTS.labels("mismatch").inc()
+            return JSONResponse(status_code=422, content={"detail": "Idempotency-Key reutilizada con otro request"})
+        IDEMPOTENCY_REQUESTS.labels("replayed").inc()
+        return Response(
+            content=stored["body"],
+            status_code=stored["status_code"],
+            media_type=stored["media_type"],
+            headers={"Idempotent-Replayed": "true"},
+        )
+    
+    IDEMPOTENCY_REQUESTS.labels("new").inc()
+    try:
+        response = await call_next(request)
+        body = b"".join([chunk async for chunk in response.body_iterator])
+    except Exception:
+        idempotency.release(key)
+        raise
+    # Los 5xx se pueden reintentar; el resto (incluidos los 4xx de validación) se guarda
+    try:
+        if response.status_code >= 500:
+            idempotency.release(key)
+        else:
+            media_type = response.headers.get("content-type", "application/json")
+            idempotency.save(key, fingerprint, response.status_code, media_type, body)
+    except Exception as e:
+        logger.warning(f"No se pudo guardar la respuesta idempotente: {e}")
+    
+    async def replay_body():
+        yield body
+    response.body_iterator = replay_body()
+    return response
+
 # Middleware de rate limiting a nivel de aplicación
 @app.middleware("http")
 async def rate_limit_middleware(request: Request, call_next):
@@ -52,7 +175,7 @@ async def rate_limit_middleware(request: Request, call_next):
     identifier = request.client.host
     
     # Saltar rate limiting para health checks
-    if request.url.path in ["/healthz", "/health"]:
+    if request.url.path in ["/healthz", "/health", "/metrics"]:
         return await call_next(request)
     
     if not rate_limiter.is_allowed(identifier):
@@ -64,6 +187,69 @@ async def rate_limit_middleware(request: Request, call_next):
     return await call_next(request)
 
 
+# Middleware de load shedding: límite de concurrencia adaptativo por clase de ruta; en sobrecarga
+# responde 503 enseguida en lugar de acumular requests en el threadpool hasta el timeout del gateway
+@app.middleware("http")
+async def load_shedding_middleware(request: Request, call_next):
+    if not LOAD_SHEDDING_ENABLED or request.url.path in ["/healthz", "/health", "/metrics"]:
+        return await call_next(request)
+    limiter = load_shedder.try_acquire(load_shedder.route_class(request.method))
+    if limiter is None:
+        return JSONResponse(
+            status_code=503,
+            content={"detail": "Servicio sobrecargado. Intente nuevamente más tarde."},
+            headers={"Retry-After": str(LOAD_SHED_RETRY_AFTER)},
+        )
+    start = time.perf_counter()
+    failed = True
+    try:
+        response = await call_next(request)
+        # 503 propios (circuit breaker) son rápidos y no indican saturación de este servicio
+        failed = response.status_code >= 500 and response.status_code != 503
+        return response
+    finally:
+        limiter.release(time.perf_counter() - start, failed)
+
+# Middleware de métricas (el más externo): latencia y status por template de ruta + tiempo en la base
+# y por fase (header Server-Timing), statements repetidos en modo DB_QUERY_DEBUG y profiling opt-in
+@app.middleware("http")
+async def metrics_middleware(request: Request, call_next):
+    stats = new_query_stats()
+    stats_token = query_stats.set(stats)
+    timings = {}
+    timings_token = request_timings.set(timings)
+    method = request.method if request.method in HTTP_METHODS else "OTHER"
+    HTTP_IN_FLIGHT.inc()
+    profiler = start_profiler(request)
+    start = time.perf_counter()
+    status_code = 500
+    try:
+        response = await call_next(request)
+        status_code = response.status_code
+        if SERVER_TIMING_ENABLED:
+            response.headers.append(
+                "Server-Timing", f"{server_timing(stats)}, {format_server_timing(timings, time.perf_counter() - start)}"
+            )
+        if profiler is not None:
+            profile = await save_profile(profiler, method, route_label(request.scope))
+            if profile:
+                response.headers["X-Profile-File"] = profile
+        return response
+    finally:
+        if profiler is not None and profiler.is_running:
+            profiler.stop()
+        HTTP_IN_FLIGHT.dec()
+        route = route_label(request.scope)
+        HTTP_REQUEST_DURATION.labels(method, route).observe(time.perf_counter() - start)
+        HTTP_REQUESTS.labels(method, route, str(status_code)).inc()
+        DB_TIME_PER_REQUEST.labels(route).observe(stats["seconds"])
+        DB_QUERIES_PER_REQUEST.labels(route).observe(stats["count"])
+        for statement, count in repeated_statements(stats):
+            DB_REPEATED_STATEMENTS.labels(route).inc()
+            logger.warning("Posible N+1 en %s %s: %d ejecuciones de %s", method, route, count, statement, extra={"event": "repeated_statement"})
+        query_stats.reset(stats_token)
+        request_timings.reset(timings_token)
+
 # Handler de errores de circuit breaker
 @app.exception_handler(CircuitBreakerError)
 async def circuit_breaker_handler(request: Request, exc: CircuitBreakerError):
@@ -73,6 +259,15 @@ async def circuit_breaker_handler(request: Request, exc: CircuitBreakerError):
     )
 
 
+@app.get("/metrics", include_in_schema=False)
+def metrics():
+    """Exposición Prometheus (no pasa por el gateway)"""
+    observe_pool("primary", pool_stats())
+    for i, e in enumerate(read_engines):
+        observe_pool(f"replica{i}", pool_stats(e))
+    body, content_type = render_metrics()
+    return Response(content=body, media_type=content_type)
+
 @app.get("/health")
 @app.get("/healthz")
 async def health_check():
@@ -87,13 +282,20 @@ async def health_check():
     
     # Verificar base de datos
     try:
-        with session_scope() as s:
+        with session_scope(readonly=False) as s:
             s.execute(text("SELECT 1"))
-        health_status["dependencies"]["database"] = {"status": "healthy"}
+        health_status["dependencies"]["database"] = {"status": "healthy", "pool": pool_stats()}
     except Exception as e:
         health_status["dependencies"]["database"] = {"status": "unhealthy", "error": str(e)}
         health_status["status"] = "degraded"
     
+    # Verificar réplicas de lectura
+    replicas = check_replicas_health()
+    if replicas:
+        health_status["dependencies"]["database_replicas"] = replicas
+        if any(r["status"] != "healthy" for r in replicas):
+            health_status["status"] = "degraded"
+    
     # Verificar Redis
     redis_health = check_redis_health()
     health_status["dependencies"]["redis"] = redis_health
@@ -106,37 +308,107 @@ async def health_check():
     if rabbitmq_health["status"] != "healthy":
         health_status["status"] = "degraded"
     
-    # Verificar tamaño de cola
-    try:
-        queue_size = task_processor.queue.get_queue_size()
-        health_status["queue_size"] = queue_size
-        if queue_size > 5000:  # Umbral de advertencia
-            health_status["status"] = "degraded"
-            health_status["warning"] = "Tamaño de cola es alto"
-    except Exception as e:
-        logger.warning(f"No se pudo verificar tamaño de cola: {e}")
+    # Cola: informativo; una cola larga no es motivo para reiniciar el pod (ver admission control y
+    # la señal mq_desired_workers en /metrics), así que no cambia el status
+    queue = task_processor.queue
+    health_status["queue"] = {
+        "size": queue.depth,
+        "consumers": queue.consumers,
+        "saturated": queue.saturated,
+        "desired_workers": desired_workers(queue.depth) if queue.depth is not None else None,
+    }
     
     # Retornar código de status apropiado
     status_code = 200 if health_status["status"] == "healthy" else 503
     return JSONResponse(content=health_status, status_code=status_code)
 
 
+def replay_idempotent(s, key: str, request_hash: str) -> Optional[Response]:
+    """Respuesta original de un POST ya procesado con esta Idempotency-Key (SELECT simple, sin locks)"""
+    stored = s.get(IdempotencyKey, key)
+    if stored is None or stored.created_at < datetime.now(timezone.utc) - timedelta(seconds=IDEMPOTENCY_KEY_TTL):
+        return None
+    if stored.request_hash != request_hash:
+        IDEMPOTENCY_REQUESTS.labels("mismatch").inc()
+        raise HTTPException(status_code=422, detail="Idempotency-Key reutilizada con otro request")
+    IDEMPOTENCY_REQUESTS.labels("replayed").inc()
+    return Response(
+        content=stored.response_body,
+        status_code=stored.status_code,
+        media_type="application/json",
+        headers={"Idempotent-Replayed": "true"},
+    )
+
+
 @app.post("/users", response_model=UserOut, status_code=201)
-def create_user(payload: UserCreate):
+def create_user(
+    payload: UserCreate,
+    background_tasks: BackgroundTasks,
+    idempotency_key: str | None = Header(None),
+    authorization: str | None = Header(None),
+):
     """
     Crear usuario con transacción ACID + Queue-Based Load Leveling
     
     La creación de usuario es síncrona, pero las notificaciones se encolan para procesamiento async.
+    Un reintento con la misma Idempotency-Key devuelve la respuesta original.
     """
-    # Ejemplo ACID: crear user + audit log atómicamente
+    request_hash = hashlib.sha256(orjson.dumps(payload.model_dump(), option=orjson.OPT_SORT_KEYS)).hexdigest()
+    if idempotency_key:
+        idempotency_key = idempotency.scoped_key(idempotency_key, authorization)
+    
+    # Ejemplo ACID: crear user + audit log (+ idempotency key) atómicamente
     with session_scope() as s:
-        if s.query(User).filter_by(email=payload.email).first():
+        if idempotency_key:
+            replay = replay_idempotent(s, idempotency_key, request_hash)
+            if replay is not None:
+                return replay
+        
+        # INSERT ... ON CONFLICT en un solo round trip: el perdedor de una carrera obtiene 409, no IntegrityError
+        row = s.execute(
+            pg_insert(User)
+            .values(name=payload.name, email=payload.email)
+            .on_conflict_do_nothing(index_elements=[User.email])
+            .returning(User.id, User.name, User.email)
+        ).first()
+        if row is None:
+            if idempotency_key:
+                # Un duplicado concurrente con la misma key ya commiteó: devolver su respuesta
+                replay = replay_idempotent(s, idempotency_key, request_hash)
+                if replay is not None:
+                    return replay
             raise HTTPException(status_code=409, detail="email already exists")
-        u = User(name=payload.name, email=payload.email)
-        s.add(u)
-        s.flush()  # obtener u.id
-        log = AuditLog(action="CREATE_USER", detail=f"User {u.id} created with email {u.email}")
-        s.add(log)
+        
+        user_out = UserOut.model_validate(row)
+        s.add(AuditLog(action="CREATE_USER", detail=f"User {user_out.id} created with email {user_out.email}"))
+        
+        if idempotency_key:
+            insert_key = pg_insert(IdempotencyKey).values(
+                key=idempotency_key,
+                request_hash=request_hash,
+                status_code=201,
+                response_body=orjson.dumps(user_out.model_dump()),
+            )
+            # Una key vencida se reutiliza; una vigente no se pisa
+            stored = s.execute(insert_key.on_conflict_do_update(
+                index_elements=[IdempotencyKey.key],
+                set_={
+                    "request_hash": insert_key.excluded.request_hash,
+                    "status_code": insert_key.excluded.status_code,
+                    "response_body": insert_key.excluded.response_body,
+                    "created_at": func.now(),
+                },
+                where=IdempotencyKey.created_at < func.now() - timedelta(seconds=IDEMPOTENCY_KEY_TTL),
+            ).returning(IdempotencyKey.key)).first()
+            if stored is None:
+                # Un request concurrente con la misma key (y otro email) commiteó primero: descartar este
+                # usuario y responder como ese request (422 si el body difiere)
+                s.rollback()
+                replay = replay_idempotent(s, idempotency_key, request_hash)
+                if replay is not None:
+                    return replay
+                raise HTTPException(status_code=409, detail="Request con esta Idempotency-Key en curso")
+            IDEMPOTENCY_REQUESTS.labels("new").inc()
         
         # Invalidar cache
         cache.invalidate_pattern("user:*")
@@ -145,30 +417,73 @@ def create_user(payload: UserCreate):
         # Encolar notificación async (patrón Queue-Based Load Leveling)
         try:
             task_processor.enqueue_task("user_notification", {
-                "user_id": u.id,
-                "email": u.email,
+                "user_id": user_out.id,
+                "name": user_out.name,
+                "email": user_out.email,
                 "type": "welcome"
             })
         except Exception as e:
             logger.warning(f"Falló al encolar notificación: {e}")
             # No fallar el request si falla el encolamiento
         
-        return u
+        # Refrescar micro-cache del gateway una vez respondido el request
+        background_tasks.add_task(refresh_gateway_cache, "/api/users/users")
+        
+        return user_out
+
+
+def get_users_batch(ids: str, if_none_match: Optional[str]) -> Response:
+    """
+    Multi-get por IDs: hits de Redis en un round trip, misses en una sola query (= ANY) y backfill
+    del cache con un pipeline. El array JSON se arma con los bytes cacheados, sin deserializar.
+    """
+    try:
+        user_ids = parse_ids(ids)
+    except ValueError as e:
+        raise HTTPException(status_code=422, detail=f"ids inválido: {e}")
+    keys = {user_id: f"user:{user_id}" for user_id in user_ids}
+    found = cache.get_many_raw(list(keys.values()))
+    
+    missing = [user_id for user_id, key in keys.items() if key not in found]
+    if missing:
+        with session_scope() as s:
+            rows = s.query(User).filter(User.id == any_(bindparam("ids", missing, type_=ARRAY(Integer)))).all()
+            loaded = {keys[r.id]: UserOut.model_validate(r).model_dump() for r in rows}
+        cache.set_many(loaded)
+        found.update({key: orjson.dumps(value) for key, value in loaded.items()})
+    
+    # Mismo orden que ids; los inexistentes se omiten
+    body = b"[" + b",".join(found[key] for key in keys.values() if key in found) + b"]"
+    etag = make_etag(body)
+    if etag_matches(if_none_match, etag):
+        return Response(status_code=304, headers=cache_headers(etag))
+    return Response(content=body, media_type="application/json", headers=cache_headers(etag))
 
 
 @app.get("/users", response_model=list[UserOut])
-def list_users():
+def list_users(response: Response, ids: str | None = None, if_none_match: str | None = Header(None)):
     """
-    Listar usuarios con patrón Cache-Aside
+    Listar usuarios con patrón Cache-Aside (con ?ids=1,2,3: multi-get por IDs)
     
     Los resultados se cachean por 5 minutos para mejorar rendimiento.
     """
+    if ids is not None:
+        return get_users_batch(ids, if_none_match)
+    
     # Intentar cache primero (patrón Cache-Aside)
     cache_key = "users:list"
-    cached_users = cache.get(cache_key)
+    # GET condicional: el ETag se lee de Redis sin tocar el body
+    if if_none_match:
+        etag = cache.get_etag(cache_key)
+        if etag_matches(if_none_match, etag):
+            return Response(status_code=304, headers=cache_headers(etag))
+    
+    # Cache hit: el JSON guardado ya fue validado contra UserOut en el miss,
+    # se envía tal cual sin pasar por response_model
+    cached_users, etag = cache.get_raw_with_etag(cache_key)
     
     if cached_users is not None:
-        return cached_users
+        return Response(content=cached_users, media_type="application/json", headers=cache_headers(etag))
     
     # Cache miss - consultar base de datos
     with session_scope() as s:
@@ -176,22 +491,32 @@ def list_users():
         user_list = [UserOut.model_validate(u) for u in users]
         
         # Almacenar en cache
-        cache.set(cache_key, [u.model_dump() for u in user_list])
+        etag = cache.set(cache_key, [u.model_dump() for u in user_list])
+        response.headers.update(cache_headers(etag))
+        if etag_matches(if_none_match, etag):
+            return Response(status_code=304, headers=cache_headers(etag))
         
         return user_list
 
 
 @app.get("/users/{user_id}", response_model=UserOut)
-def get_user(user_id: int):
+def get_user(user_id: int, response: Response, if_none_match: str | None = Header(None)):
     """
     Obtener usuario por ID con patrón Cache-Aside
     """
     # Intentar cache primero
     cache_key = f"user:{user_id}"
-    cached_user = cache.get(cache_key)
+    # GET condicional: el ETag se lee de Redis sin tocar el body
+    if if_none_match:
+        etag = cache.get_etag(cache_key)
+        if etag_matches(if_none_match, etag):
+            return Response(status_code=304, headers=cache_headers(etag))
+    
+    # Cache hit: enviar el JSON guardado sin deserializar ni re-validar
+    cached_user, etag = cache.get_raw_with_etag(cache_key)
     
     if cached_user is not None:
-        return UserOut(**cached_user)
+        return Response(content=cached_user, media_type="application/json", headers=cache_headers(etag))
     
     # Cache miss - consultar base de datos
     with session_scope() as s:
@@ -202,6 +527,9 @@ def get_user(user_id: int):
         user_out = UserOut.model_validate(u)
         
         # Almacenar en cache
-        cache.set(cache_key, user_out.model_dump())
+        etag = cache.set(cache_key, user_out.model_dump())
+        response.headers.update(cache_headers(etag))
+        if etag_matches(if_none_match, etag):
+            return Response(status_code=304, headers=cache_headers(etag))
         
         return user_out
@@ -0,0 +1,58 @@
+"""
+Runner de migraciones (job one-shot: alembic upgrade head).
+Cada migración corre en su propia transacción para poder usar autocommit_block()
+en operaciones que no admiten transacción (CREATE INDEX CONCURRENTLY).
+"""
+from logging.config import fileConfig
+from alembic import context
+from sqlalchemy import text
+from db import Base, engine, DATABASE_URL, SCHEMA
+import models  # noqa: F401 - registra las tablas en Base.metadata
+
+config = context.config
+if config.config_file_name is not None:
+    fileConfig(config.config_file_name)
+
+target_metadata = Base.metadata
+
+
+def include_object(obj, name, type_, reflected, compare_to):
+    # Los otros servicios comparten la base: ignorar sus tablas en autogenerate
+    return not (type_ == "table" and reflected and compare_to is None)
+
+
+def run_migrations_offline():
+    context.configure(
+        url=DATABASE_URL,
+        target_metadata=target_metadata,
+        literal_binds=True,
+        version_table_schema=SCHEMA,
+        include_object=include_object,
+        transaction_per_migration=True,
+    )
+    with context.begin_transaction():
+        context.run_migrations()
+
+
+def run_migrations_online():
+    with engine.connect() as connection:
+        connection.execute(text(f'CREATE SCHEMA IF NOT EXISTS "{SCHEMA}"'))
+        # Un solo runner por servicio aunque se lancen varios jobs en paralelo
+        connection.execute(text("SELECT pg_advisory_lock(hashtext(:name))"), {"name": f"migrations:{SCHEMA}"})
+        connection.commit()
+        
+        context.configure(
+            connection=connection,
+            target_metadata=target_metadata,
+            version_table_schema=SCHEMA,
+            include_object=include_object,
+            transaction_per_migration=True,
+        )
+        with context.begin_transaction():
+            context.run_migrations()
+
+
+if context.is_offline_mode():
+    run_migrations_offline()
+else:
+    run_migrations_online()
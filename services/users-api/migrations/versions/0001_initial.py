@@ -0,0 +1,43 @@
+"""Tablas iniciales de users-api
+
+Revision ID: 0001
+Revises:
+Create Date: 2026-10-19
+"""
+from alembic import op
+import sqlalchemy as sa
+
+revision = "0001"
+down_revision = None
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # Bases creadas antes de las migraciones (create_all al importar) ya tienen las tablas
+    existing = sa.inspect(op.get_bind()).get_table_names()
+    
+    if "users" not in existing:
+        op.create_table(
+            "users",
+            sa.Column("id", sa.Integer(), primary_key=True),
+            sa.Column("name", sa.String(100), nullable=False),
+            sa.Column("email", sa.String(255), nullable=False),
+            sa.Column("created_at", sa.DateTime(timezone=True), server_default=sa.func.now(), nullable=False),
+        )
+        op.create_index("ix_users_id", "users", ["id"])
+        op.create_index("ix_users_email", "users", ["email"], unique=True)
+    
+    if "audit_logs" not in existing:
+        op.create_table(
+            "audit_logs",
+            sa.Column("id", sa.Integer(), primary_key=True),
+            sa.Column("action", sa.String(50), nullable=False),
+            sa.Column("detail", sa.Text(), nullable=False),
+            sa.Column("created_at", sa.DateTime(timezone=True), server_default=sa.func.now(), nullable=False),
+        )
+
+
+def downgrade():
+    op.drop_table("audit_logs")
+    op.drop_table("users")
@@ -1,8 +1,12 @@
+import os
 from datetime import datetime
-from sqlalchemy import String, Integer, DateTime, Text, func
+from sqlalchemy import String, Integer, DateTime, Text, LargeBinary, func
 from sqlalchemy.orm import Mapped, mapped_column
 from db import Base
 
+# Ventana durante la cual un POST reintentado con la misma Idempotency-Key devuelve la respuesta original
+IDEMPOTENCY_KEY_TTL = int(os.getenv("IDEMPOTENCY_KEY_TTL", "86400"))
+
 class User(Base):
     __tablename__ = "users"
 
@@ -15,10 +19,24 @@ class User(Base):
 
 class AuditLog(Base):
     __tablename__ = "audit_logs"
+    # Particionada por mes sobre created_at (ver partitions.py); la PK debe incluir la clave de partición
+    __table_args__ = {"postgresql_partition_by": "RANGE (created_at)"}
 
-    id: Mapped[int] = mapped_column(Integer, primary_key=True)
+    # PK compuesta: sin autoincrement explícito SQLAlchemy no toma id como generado por la base (nextval)
+    id: Mapped[int] = mapped_column(Integer, primary_key=True, autoincrement=True)
     action: Mapped[str] = mapped_column(String(50), nullable=False)
     detail: Mapped[str] = mapped_column(Text, nullable=False)
+    created_at: Mapped[datetime] = mapped_column(
+        DateTime(timezone=True), server_default=func.now(), nullable=False, primary_key=True
+    )
+
+class IdempotencyKey(Base):
+    __tablename__ = "idempotency_keys"
+
+    key: Mapped[str] = mapped_column(String(255), primary_key=True)
+    request_hash: Mapped[str] = mapped_column(String(64), nullable=False)
+    status_code: Mapped[int] = mapped_column(Integer, nullable=False)
+    response_body: Mapped[bytes] = mapped_column(LargeBinary, nullable=False)
     created_at: Mapped[datetime] = mapped_column(
         DateTime(timezone=True), server_default=func.now(), nullable=False
     )
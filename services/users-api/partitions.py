@@ -0,0 +1,164 @@
+"""
+Particionado por rango mensual (created_at) de tablas append-only.
+Crea las particiones futuras y aplica retención dropeando particiones completas
+en lugar de DELETE masivos, así vacuum e índices mantienen un tamaño constante.
+"""
+import os
+import time
+import logging
+import threading
+from datetime import date
+from typing import Optional
+from sqlalchemy import text
+from db import engine, SCHEMA
+from models import IDEMPOTENCY_KEY_TTL
+
+logger = logging.getLogger(__name__)
+
+PARTITIONED_TABLES = ["audit_logs"]
+# Tablas chicas con expiración por fila: tabla -> segundos de vida según created_at
+EXPIRING_TABLES = {"idempotency_keys": IDEMPOTENCY_KEY_TTL}
+PARTITION_MONTHS_AHEAD = int(os.getenv("PARTITION_MONTHS_AHEAD", "3"))
+# 0 = sin retención (no se dropean particiones)
+PARTITION_RETENTION_MONTHS = int(os.getenv("PARTITION_RETENTION_MONTHS", "12"))
+PARTITION_MAINTENANCE_INTERVAL = int(os.getenv("PARTITION_MAINTENANCE_INTERVAL", "3600"))
+
+
+def _add_months(month: date, months: int) -> date:
+    total = month.year * 12 + month.month - 1 + months
+    return date(total // 12, total % 12 + 1, 1)
+
+
+def partition_name(table: str, month: date) -> str:
+    return f"{table}_p{month:%Y%m}"
+
+
+def default_partition(conn, table: str) -> Optional[str]:
+    """Nombre de la partición DEFAULT de table, si tiene"""
+    return conn.execute(text(
+        "SELECT c.relname FROM pg_inherits i "
+        "JOIN pg_class c ON c.oid = i.inhrelid "
+        "JOIN pg_class p ON p.oid = i.inhparent "
+        "WHERE p.relname = :table AND pg_get_expr(c.relpartbound, c.oid) = 'DEFAULT'"
+    ), {"table": table}).scalar()
+
+
+def move_from_default(conn, table: str, default: str, month: date):
+    """
+    Crear la partición de month cuando ya hay filas de ese mes en DEFAULT (mantenimiento atrasado, reloj
+    corrido): Postgres no deja crearla con DEFAULT conteniendo filas del rango, así que se desengancha
+    DEFAULT, se crea la partición, se mueven las filas y se vuelve a enganchar (todo en la transacción).
+    """
+    upper = _add_months(month, 1)
+    bounds = {"lower": month, "upper": upper}
+    conn.execute(text(f'ALTER TABLE "{table}" DETACH PARTITION "{default}"'))
+    conn.execute(text(
+        f'CREATE TABLE "{partition_name(table, month)}" PARTITION OF "{table}" '
+        f"FOR VALUES FROM ('{month.isoformat()}') TO ('{upper.isoformat()}')"
+    ))
+    moved = conn.execute(text(
+        f'INSERT INTO "{table}" SELECT * FROM "{default}" WHERE created_at >= :lower AND created_at < :upper'
+    ), bounds).rowcount
+    conn.execute(text(f'DELETE FROM "{default}" WHERE created_at >= :lower AND created_at < :upper'), bounds)
+    conn.execute(text(f'ALTER TABLE "{table}" ATTACH PARTITION "{default}" DEFAULT'))
+    logger.warning(f"{moved} filas de {table} movidas de {default} a {partition_name(table, month)}")
+
+
+def ensure_partitions(conn, table: str, since: Optional[date] = None, months_ahead: int = PARTITION_MONTHS_AHEAD):
+    """
+    Crear particiones mensuales desde since (o el mes actual) hasta months_ahead meses adelante, más las de
+    los meses que ya tienen filas en DEFAULT (que se mueven a su partición)
+    """
+    current = date.today().replace(day=1)
+    month = (since or current).replace(day=1)
+    end = _add_months(current, months_ahead)
+    months = set()
+    while month <= end:
+        months.add(month)
+        month = _add_months(month, 1)
+    
+    default = default_partition(conn, table)
+    stranded = set()
+    if default:
+        stranded = set(conn.execute(text(
+            f"SELECT DISTINCT date_trunc('month', created_at)::date FROM \"{default}\""
+        )).scalars().all())
+    
+    for month in sorted(months | stranded):
+        if month in stranded:
+            # Si DEFAULT tiene filas del mes, la partición no existe (Postgres no lo permitiría)
+            move_from_default(conn, table, default, month)
+            continue
+        upper = _add_months(month, 1)
+        conn.execute(text(
+            f'CREATE TABLE IF NOT EXISTS "{partition_name(table, month)}" PARTITION OF "{table}" '
+            f"FOR VALUES FROM ('{month.isoformat()}') TO ('{upper.isoformat()}')"
+        ))
+
+
+def drop_expired_partitions(conn, table: str, retention_months: int = PARTITION_RETENTION_MONTHS) -> list[str]:
+    """Dropear particiones cuyo rango completo quedó fuera de la retención"""
+    if retention_months <= 0:
+        return []
+    cutoff = _add_months(date.today().replace(day=1), -retention_months)
+    partitions = conn.execute(text(
+        "SELECT c.relname FROM pg_inherits i "
+        "JOIN pg_class c ON c.oid = i.inhrelid "
+        "JOIN pg_class p ON p.oid = i.inhparent "
+        "WHERE p.relname = :table"
+    ), {"table": table}).scalars().all()
+    
+    dropped = []
+    for name in partitions:
+        suffix = name.removeprefix(f"{table}_p")
+        if len(suffix) != 6 or not suffix.isdigit():
+            continue  # partición DEFAULT u otras que no siguen la convención
+        month = date(int(suffix[:4]), int(suffix[4:]), 1)
+        if _add_months(month, 1) <= cutoff:
+            conn.execute(text(f'DROP TABLE "{name}"'))
+            dropped.append(name)
+    return dropped
+
+
+def run_maintenance():
+    """Crear particiones futuras y aplicar retención en todas las tablas particionadas"""
+    with engine.begin() as conn:
+        # Una sola réplica hace el mantenimiento a la vez
+        locked = conn.execute(
+            text("SELECT pg_try_advisory_xact_lock(hashtext(:name))"), {"name": f"partitions:{SCHEMA}"}
+        ).scalar()
+        if not locked:
+            return
+        # No esperar indefinidamente por el lock de la tabla padre
+        conn.execute(text("SET LOCAL lock_timeout = '5s'"))
+        for table in PARTITIONED_TABLES:
+            ensure_partitions(conn, table)
+            dropped = drop_expired_partitions(conn, table)
+            if dropped:
+                logger.info(f"Retención de {table}: particiones eliminadas {dropped}")
+        for table, ttl in EXPIRING_TABLES.items():
+            conn.execute(text(f"DELETE FROM {table} WHERE created_at < now() - make_interval(secs => :ttl)"), {"ttl": ttl})
+
+
+def start_partition_maintenance():
+    """Mantenimiento periódico de particiones en background"""
+    if PARTITION_MAINTENANCE_INTERVAL <= 0:
+        return
+    
+    def loop():
+        while True:
+            try:
+                run_maintenance()
+            except Exception as e:
+                logger.warning(f"Falló el mantenimiento de particiones: {e}")
+            time.sleep(PARTITION_MAINTENANCE_INTERVAL)
+    
+    threading.Thread(target=loop, daemon=True, name="partition-maintenance").start()
+    logger.info(f"Mantenimiento de particiones cada {PARTITION_MAINTENANCE_INTERVAL}s")
+
+
+if __name__ == "__main__":
+    # Para correr desde cron / job: python partitions.py
+    from logging_config import setup_logging
+    setup_logging("users-api-partitions")
+    run_maintenance()
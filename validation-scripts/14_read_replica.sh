@@ -0,0 +1,36 @@
+#!/usr/bin/env bash
+# ruteo de lecturas a la réplica con read-your-writes.
+# Qué valida:
+#   - /health reporta la réplica de lectura y su lag
+#   - POST + GET inmediato con la cookie de la escritura ve la fila (lee del primario)
+#   - La fila llega a la réplica por streaming replication
+
+set -euo pipefail
+source "$(dirname "$0")/env.sh"
+
+JAR=$(mktemp)
+trap 'rm -f "$JAR"' EXIT
+
+echo "== Health: réplicas de lectura =="
+curl -s "$USERS/health" | jq '.dependencies.database_replicas'
+
+echo "== Crear usuario y leerlo inmediatamente (read-your-writes) =="
+EMAIL="replica.$(date +%s)@example.com"
+USER_ID=$(jq -n --arg name "Replica" --arg email "$EMAIL" '{name:$name,email:$email}' \
+  | curl -s -c "$JAR" -X POST "$USERS/users" -H "Content-Type: application/json" --data-binary @- | jq -r '.id')
+echo "  Usuario creado con ID: $USER_ID"
+
+STATUS=$(curl -s -b "$JAR" -o /dev/null -w "%{http_code}" "$USERS/users/$USER_ID")
+if [ "$STATUS" == "200" ]; then
+  echo "  ✓ Read-your-writes: PASS"
+else
+  echo "  ✗ Read-your-writes: FAIL (status $STATUS)"
+  exit 1
+fi
+
+echo "== Verificar en la réplica (debe ser 1) =="
+sleep 1
+psql_replica <<SQL
+SELECT COUNT(*) AS replica_rows FROM users WHERE email='$EMAIL';
+SELECT pg_is_in_recovery() AS is_replica;
+SQL
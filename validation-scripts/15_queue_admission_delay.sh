@@ -0,0 +1,75 @@
+#!/usr/bin/env bash
+# Admission control en modo delay sin bloquear el event loop.
+# Qué valida (dentro del contenedor de tasks-api, con QUEUE_ADMISSION_MODE=delay):
+#   - Con la cola saturada, publish_async de un mensaje no crítico espera QUEUE_ADMISSION_MAX_DELAY y lo descarta
+#   - Mientras espera, otra corutina del mismo loop sigue corriendo (ticks cada 50ms sin atrasos)
+#   - Si la cola baja del low watermark durante la espera, el publish se admite
+
+set -euo pipefail
+source "$(dirname "$0")/env.sh"
+
+echo "== Admission control delay (publish_async) =="
+docker compose exec -T -e QUEUE_ADMISSION_MODE=delay -e QUEUE_ADMISSION_MAX_DELAY=1 tasks-api python - <<'PY'
+import sys
+import time
+import asyncio
+import messaging
+
+TICK = 0.05
+
+
+async def ticker(stop: asyncio.Event) -> tuple[int, float]:
+    """Cuenta ticks y el peor atraso respecto del intervalo esperado"""
+    ticks, worst_lag = 0, 0.0
+    last = time.monotonic()
+    while not stop.is_set():
+        await asyncio.sleep(TICK)
+        now = time.monotonic()
+        worst_lag = max(worst_lag, now - last - TICK)
+        last = now
+        ticks += 1
+    return ticks, worst_lag
+
+
+async def admission_while_ticking(queue, release_after=None) -> tuple[bool, float, int, float]:
+    stop = asyncio.Event()
+    ticking = asyncio.create_task(ticker(stop))
+    if release_after is not None:
+        asyncio.get_running_loop().call_later(release_after, setattr, queue, "saturated", False)
+    start = time.monotonic()
+    admitted = await queue._admit_async(critical=False)
+    waited = time.monotonic() - start
+    stop.set()
+    ticks, worst_lag = await ticking
+    return admitted, waited, ticks, worst_lag
+
+
+async def main() -> int:
+    failures = 0
+    queue = messaging.MessageQueue("admission_delay_check")
+
+    queue.saturated = True
+    admitted, waited, ticks, worst_lag = await admission_while_ticking(queue)
+    print(f"  Cola saturada: admitido={admitted} espera={waited:.2f}s ticks={ticks} peor atraso={worst_lag * 1000:.0f}ms")
+    if not admitted and waited >= 0.9 and ticks >= 15 and worst_lag < 0.1:
+        print("  ✓ Espera sin bloquear el event loop y descarte al vencer: PASS")
+    else:
+        print("  ✗ El event loop quedó bloqueado o el publish se admitió: FAIL")
+        failures += 1
+
+    queue.saturated = True
+    admitted, waited, ticks, worst_lag = await admission_while_ticking(queue, release_after=0.3)
+    print(f"  Cola liberada a los 0.3s: admitido={admitted} espera={waited:.2f}s peor atraso={worst_lag * 1000:.0f}ms")
+    if admitted and waited < 0.9 and worst_lag < 0.1:
+        print("  ✓ Publish admitido al bajar la cola: PASS")
+    else:
+        print("  ✗ Publish no admitido tras liberar la cola: FAIL")
+        failures += 1
+    return failures
+
+
+sys.exit(1 if asyncio.run(main()) else 0)
+PY
+
+echo ""
+echo "✓ Admission control delay validado"
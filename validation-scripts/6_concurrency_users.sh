@@ -2,6 +2,7 @@
 #   - Ejecuta 10 creaciones concurrentes con el email.
 #   - Esperable: 1x 201 y 9x 409.
 #   - En la base hay sola 1 fila con ese email
+#   - Reintentar con la misma Idempotency-Key devuelve la respuesta original (mismo id)
 
 set -euo pipefail
 source "$(dirname "$0")/env.sh"
@@ -18,3 +19,13 @@ echo "== Verificar en DB (debe ser 1) =="
 psql_db <<SQL
 SELECT COUNT(*) AS user_rows FROM users.users WHERE email='$E';
 SQL
+
+K="idem-$(date +%s)"
+IE="idem.$(date +%s)@example.com"
+BODY="$(jq -n --arg email "$IE" '{name:"Idem",email:$email}')"
+
+echo "== Mismo POST dos veces con Idempotency-Key: $K (debe devolver el mismo id) =="
+for i in 1 2; do
+  curl -s -i -X POST "$USERS/users" -H "Content-Type: application/json" -H "Idempotency-Key: $K" \
+    --data-binary "$BODY" | grep -iE '^HTTP/|^idempotent-replayed|"id"'
+done
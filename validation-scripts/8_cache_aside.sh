@@ -89,6 +89,21 @@ else
     exit 1
 fi
 
+echo ""
+
+# Probar GET condicional (ETag / If-None-Match)
+echo "6. Probando GET condicional con ETag"
+ETAG=$(curl -s -D - -o /dev/null http://localhost:8001/users/$USER_ID | grep -i '^etag:' | cut -d' ' -f2 | tr -d '\r')
+echo "  ETag: $ETAG"
+STATUS=$(curl -s -o /dev/null -w "%{http_code}" -H "If-None-Match: $ETAG" http://localhost:8001/users/$USER_ID)
+
+if [ -n "$ETAG" ] && [ "$STATUS" == "304" ]; then
+    echo "  ✓ GET condicional: PASS (304 Not Modified)"
+else
+    echo "  ✗ GET condicional: FAIL (status $STATUS)"
+    exit 1
+fi
+
 echo ""
 echo "✓ Todas las pruebas de cache-aside PASARON"
 echo ""
@@ -17,9 +17,15 @@ psql_db () {
   docker compose exec -T db psql -U postgres -d appdb "$@"
 }
 
+# helper para ejecutar psql contra la réplica de lectura
+psql_replica () {
+  docker compose exec -T db-replica psql -U postgres -d appdb "$@"
+}
+
 # exportar solo en bash
 if [ -n "${BASH_VERSION:-}" ]; then
   export -f psql_db
+  export -f psql_replica
 fi
 
 echo "Entorno cargado:"
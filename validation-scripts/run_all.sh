@@ -28,6 +28,12 @@ echo "== 5) Schemas por servicio =="
 echo "== 6) Concurrencia =="
 ./6_concurrency_users.sh
 
+echo "== 14) Réplica de lectura =="
+./14_read_replica.sh
+
+echo "== 15) Admission control delay =="
+./15_queue_admission_delay.sh
+
 echo ""
 echo "== PART 2: Architectural Patterns Tests =="
 echo ""